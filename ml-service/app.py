@@ -5,34 +5,284 @@ FastAPI service for real ML predictions
 Run with: uvicorn app:app --host 0.0.0.0 --port 8000
 """
 
+from __future__ import annotations
+
 import os
 import sys
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import tempfile
+import importlib
+import importlib.util
+import pickle
+import hashlib
+import bisect
+import logging
+import threading
+import types
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Callable, Set, AsyncIterator, Awaitable, Iterator, Sequence, Union
 from dataclasses import dataclass
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 
 import numpy as np
-import pandas as pd
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 import uvicorn
 
-# ML Models
-from sklearn.linear_model import LinearRegression, Ridge
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.preprocessing import StandardScaler, MinMaxScaler
-from sklearn.cluster import KMeans
-from scipy import stats
-
-# Try to import Prophet (optional)
-try:
-    from prophet import Prophet
-    PROPHET_AVAILABLE = True
-except ImportError:
-    PROPHET_AVAILABLE = False
+# ============================================================================
+# Metrics
+# ============================================================================
+
+# Histogram buckets in seconds, from cache hits up to bulk forecasts
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), " ")}"'
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Histogram:
+    """Prometheus histogram with one set of buckets per label combination"""
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = METRIC_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float, *labels: str) -> None:
+        # Per series: one count per bucket (the last is +Inf), then the sum
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, labels, le)} {cumulative:g}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, labels)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, labels)} {cumulative:g}")
+        return lines
+
+class Gauge:
+    """Prometheus gauge (or counter) whose values are read from collect() at scrape time"""
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Dict[Tuple[str, ...], float]], kind: str = "gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.collect = collect
+        self.kind = kind
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_label_text(self.labels, labels)} {float(value):g}")
+        return lines
+
+class MetricsRegistry:
+    """Metrics exported by /metrics in the Prometheus text format
+    
+    Values are kept per process: work done in process-pool workers only
+    shows up through the executor task histogram of the parent.
+    """
+    
+    def __init__(self):
+        self._metrics: List[Any] = []
+    
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Histogram:
+        metric = Histogram(name, help_text, labels)
+        self._metrics.append(metric)
+        return metric
+    
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...],
+              collect: Callable[[], Dict[Tuple[str, ...], float]], kind: str = "gauge") -> Gauge:
+        metric = Gauge(name, help_text, labels, collect, kind)
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"Metric {metric.name} failed to render: {e}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+request_latency = metrics.histogram(
+    "ml_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+stage_latency = metrics.histogram(
+    "ml_stage_duration_seconds", "Time spent per processing stage (stages may nest)", ("stage",)
+)
+fit_latency = metrics.histogram("ml_model_fit_duration_seconds", "Model fit time by model type", ("model",))
+executor_latency = metrics.histogram(
+    "ml_executor_task_duration_seconds", "Executor call latency, queueing included", ("executor",)
+)
+
+@contextmanager
+def timed_stage(stage: str, model: Optional[str] = None):
+    """Time a block (or, as a decorator, a function) as one processing stage
+    
+    Stages are decode, prepare_data, features, fit, predict and serialize;
+    fit stages also feed the per-model fit histogram.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_latency.observe(elapsed, stage)
+        if model is not None:
+            fit_latency.observe(elapsed, model)
+
+# ============================================================================
+# JSON Encoding
+# ============================================================================
+
+# orjson serializes numpy arrays natively and is several times faster than json
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+if ORJSON_AVAILABLE:
+    import orjson
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return float(obj)
+
+def dump_json(obj: Any, sort_keys: bool = False) -> bytes:
+    """Compact JSON for responses, NDJSON lines and stored job results
+    
+    numpy arrays and scalars are written as plain JSON numbers; anything
+    else unknown goes through float(), as json.dumps(default=float) did.
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, default=_json_default, option=option | orjson.OPT_SORT_KEYS if sort_keys else option)
+    return json.dumps(obj, default=_json_default, separators=(',', ':'), sort_keys=sort_keys).encode()
+
+# ============================================================================
+# Lazy Model Backends
+# ============================================================================
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module on first attribute access
+    
+    pandas, scipy and scikit-learn add seconds to worker start-up and
+    hundreds of MB per worker, so they load the first time a request (or the
+    optional warm-up) actually needs them.
+    """
+    
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module: Optional[types.ModuleType] = None
+        self._lock = threading.Lock()
+    
+    def load(self) -> types.ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    self._module = importlib.import_module(self.__name__)
+                    backend_load_times[self.__name__] = round(time.perf_counter() - start, 3)
+        return self._module
+    
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+    
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+# Seconds spent importing each backend, reported by /health
+backend_load_times: Dict[str, float] = {}
+
+pd = LazyModule("pandas")
+stats = LazyModule("scipy.stats")
+sk_ensemble = LazyModule("sklearn.ensemble")
+sk_cluster = LazyModule("sklearn.cluster")
+sk_preprocessing = LazyModule("sklearn.preprocessing")
+_prophet = LazyModule("prophet")
+
+# Prophet (optional) is only located here; it is imported on first use
+PROPHET_AVAILABLE = importlib.util.find_spec("prophet") is not None
+if not PROPHET_AVAILABLE:
     print("Prophet not available, using fallback forecasting")
+else:
+    # cmdstanpy logs every optimizer start and stop at INFO; with a handler
+    # already attached it keeps this level instead of installing its own
+    _cmdstanpy_logger = logging.getLogger("cmdstanpy")
+    _cmdstanpy_logger.addHandler(logging.NullHandler())
+    _cmdstanpy_logger.setLevel(logging.WARNING)
+    # Yearly seasonality under two years of history is deliberate (prophet_seasonality)
+    logging.getLogger("prophet").addFilter(
+        lambda record: "Yearly seasonality is enabled with less than" not in record.getMessage())
+
+# Tuned Prophet: seasonalities the data supports, MAP fit warm-started from the
+# product's previous fit, fewer uncertainty samples; "0" restores the original setup
+PROPHET_TUNED = os.environ.get("ML_PROPHET_TUNED", "1").lower() in ("1", "true", "yes")
+# Trend/seasonality samples drawn for intervals; 0 uses the fitted noise level instead
+PROPHET_UNCERTAINTY_SAMPLES = int(os.environ.get("ML_PROPHET_UNCERTAINTY_SAMPLES", 200))
+PROPHET_STAN_BACKEND = os.environ.get("ML_PROPHET_STAN_BACKEND") or None
+PROPHET_INIT_CACHE_SIZE = int(os.environ.get("ML_PROPHET_INIT_CACHE_SIZE", 1024))
+
+MODEL_BACKENDS = [pd, stats, sk_ensemble, sk_cluster, sk_preprocessing] + ([_prophet] if PROPHET_AVAILABLE else [])
+
+def models_ready() -> bool:
+    """Whether every model backend has been imported"""
+    return all(backend.loaded for backend in MODEL_BACKENDS)
+
+def warm_up() -> None:
+    """Import model backends and run tiny fits so first requests skip that cost"""
+    start = time.perf_counter()
+    for backend in MODEL_BACKENDS:
+        backend.load()
+    
+    history = [
+        {'date': f"2024-01-{day:02d}", 'quantity': day % 7 + 1, 'revenue': 10.0}
+        for day in range(1, 29)
+    ]
+    for model_type in ("statistical", "random_forest", "prophet"):
+        try:
+            forecaster.predict(history, days=7, model_type=model_type)
+        except Exception as e:
+            print(f"   Warm-up of {model_type} failed: {e}")
+    print(f"   Model backends warmed up in {time.perf_counter() - start:.1f}s")
 
 # ============================================================================
 # Data Models
@@ -51,33 +301,84 @@ class ProductData:
     variants: List[Dict[str, Any]]
     historical_sales: List[SalesDataPoint]
 
+class ColumnarSales(BaseModel):
+    """Sales history as parallel arrays instead of one object per day"""
+    dates: List[str]
+    quantities: List[float]
+    revenues: Optional[List[float]] = None
+    prices: Optional[List[float]] = None
+
 class ForecastRequest(BaseModel):
     product_id: str
-    historical_sales: List[Dict[str, Any]]
+    historical_sales: Union[ColumnarSales, List[Dict[str, Any]]]
     forecast_days: int = 30
-    model_type: str = "prophet"  # prophet, linear, random_forest
+    model_type: str = "prophet"  # prophet, linear, random_forest, global, auto
+    response_format: str = "records"  # "records" (one dict per day) or "columnar" (one array per field)
+    quantiles: Optional[List[float]] = None  # e.g. [0.1, 0.5, 0.9]: daily demand quantiles in the forecast
 
 class ForecastResponse(BaseModel):
     product_id: str
-    forecast: List[Dict[str, Any]]
-    confidence_intervals: List[Dict[str, Any]]
+    forecast: Union[List[Dict[str, Any]], Dict[str, Any]]  # dict for response_format "columnar"
+    confidence_intervals: Optional[List[Dict[str, Any]]]  # records format only; columnar carries the bounds
     seasonality_patterns: Dict[str, Any]
     recommendations: List[str]
     model_used: str
-    accuracy_metrics: Dict[str, float]
+    accuracy_metrics: Dict[str, Any]
+    model_selection: Optional[Dict[str, Any]] = None  # model_type "auto" only
+
+class ForecastUpdateRequest(BaseModel):
+    product_id: str
+    new_sales: List[Dict[str, Any]]
+    historical_sales: Optional[List[Dict[str, Any]]] = None  # only used to seed a new product
+    forecast_days: int = 30
+    model_type: str = "statistical"  # prophet, linear, random_forest
+
+class ForecastUpdateResponse(BaseModel):
+    product_id: str
+    model_used: str
+    forecast: List[Dict[str, Any]]
+    initialized: bool
+    days_applied: int
+    days_ignored: int
+    history_length: int
+    last_date: str
+    update_seconds: float
 
 class DemandForecastRequest(BaseModel):
     product_variants: List[Dict[str, Any]]
-    historical_sales: Dict[str, List[Dict[str, Any]]]
+    historical_sales: Dict[str, Union[ColumnarSales, List[Dict[str, Any]]]]
     forecast_days: int = 30
+    model_type: str = "prophet"  # prophet, linear, random_forest, global, auto
+    response_format: str = "records"  # "records" (one dict per day) or "columnar" (one array per field)
+    quantiles: Optional[List[float]] = None  # e.g. [0.1, 0.5, 0.9]: daily demand quantiles in each forecast
+    service_level: Optional[float] = None  # e.g. 0.95: reorder quantities add safety stock for this service level
 
 class DemandForecastResponse(BaseModel):
-    forecasts: List[Dict[str, Any]]
+    forecasts: List[Dict[str, Any]]  # each 'forecast' is a dict for response_format "columnar"
     reorder_recommendations: List[Dict[str, Any]]
     demand_trends: Dict[str, str]
     seasonal_index: Dict[str, float]
     stock_optimization: Dict[str, Any]
 
+class GlobalTrainingRequest(BaseModel):
+    historical_sales: Dict[str, Union[ColumnarSales, List[Dict[str, Any]]]]  # by variant id
+    horizon: int = Field(default=30, ge=1, le=365)
+
+class BacktestRequest(BaseModel):
+    historical_sales: Dict[str, Union[ColumnarSales, List[Dict[str, Any]]]]  # by product id
+    models: List[str] = ["statistical", "random_forest", "prophet"]
+    horizon: int = Field(default=14, ge=1, le=90)
+    folds: int = Field(default=3, ge=1, le=12)
+
+class SeasonalityIngestRequest(BaseModel):
+    historical_sales: Dict[str, Union[ColumnarSales, List[Dict[str, Any]]]]  # by variant id
+    categories: Dict[str, str] = {}  # variant id -> category
+
+class JobSubmissionResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
 class PriceOptimizationRequest(BaseModel):
     product_id: str
     current_price: float
@@ -93,217 +394,1733 @@ class PriceOptimizationResponse(BaseModel):
     revenue_projection: Dict[str, float]
     confidence: float
 
+class BatchPriceOptimizationRequest(BaseModel):
+    products: List[PriceOptimizationRequest]
+
+class BatchPriceOptimizationResponse(BaseModel):
+    results: List[PriceOptimizationResponse]
+    count: int
+
+class SegmentRule(BaseModel):
+    name: str
+    codes: Optional[List[str]] = None  # exact "RFM" score codes, e.g. "555"
+    R: Optional[List[int]] = None
+    F: Optional[List[int]] = None
+    M: Optional[List[int]] = None
+
 class CustomerSegmentationRequest(BaseModel):
     customers: List[Dict[str, Any]]
+    segment_rules: Optional[List[SegmentRule]] = None  # defaults to DEFAULT_SEGMENT_RULES
+    mode: str = "rfm"  # "rfm" rules or "cluster" (persisted MiniBatchKMeans model)
+    n_clusters: Optional[int] = Field(default=None, ge=2, le=50)  # cluster mode, when training
+    retrain: bool = False  # cluster mode: train a new model on these customers
+    update_model: bool = False  # cluster mode: partial_fit the model with these customers first
 
 class CustomerSegmentationResponse(BaseModel):
     segments: List[Dict[str, Any]]
     segment_characteristics: Dict[str, Any]
     marketing_recommendations: Dict[str, List[str]]
+    model: Optional[Dict[str, Any]] = None  # cluster mode only
+
+class CustomerFileSegmentationRequest(BaseModel):
+    path: str  # relative to ML_DATA_DIR
+    format: Optional[str] = None  # csv, parquet or ndjson; inferred from the extension
+    chunk_size: int = Field(default=50_000, ge=1000)
+    segment_rules: Optional[List[SegmentRule]] = None
+    output_path: Optional[str] = None  # per-customer assignments CSV, relative to ML_DATA_DIR
+
+class ClusterTrainingRequest(BaseModel):
+    path: str  # relative to ML_DATA_DIR
+    format: Optional[str] = None
+    chunk_size: int = Field(default=50_000, ge=1000)
+    n_clusters: Optional[int] = Field(default=None, ge=2, le=50)
+    epochs: int = Field(default=3, ge=1, le=20)
+
+class StreamingSegmentationResponse(CustomerSegmentationResponse):
+    total_customers: int
+    quantile_edges: Dict[str, List[float]] = {}
+    approximate: bool = True
+    assignments_path: Optional[str] = None
 
 # ============================================================================
-# ML Service
+# Feature Engineering
 # ============================================================================
 
-class DemandForecaster:
-    """Demand forecasting using multiple models"""
+CALENDAR_FEATURES = ['dayofweek', 'month', 'day', 'is_weekend', 'is_holiday_season']
+
+def future_dates(base_date: pd.Timestamp, days: int) -> pd.DatetimeIndex:
+    """Daily dates following base_date"""
+    return pd.date_range(start=pd.Timestamp(base_date) + pd.Timedelta(days=1), periods=days, freq='D')
+
+def build_calendar_features(dates: Any, extra_features: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """Columnar calendar feature matrix (float32) for history or future dates
     
-    def __init__(self):
-        self.models = {}
-        self.scalers = {}
-        
-    def prepare_data(self, historical_sales: List[Dict[str, Any]]) -> pd.DataFrame:
-        """Convert historical sales to DataFrame"""
-        if not historical_sales:
-            # Return mock data for demo
-            dates = pd.date_range(end=datetime.now(), periods=90, freq='D')
-            data = {
-                'date': dates,
-                'quantity': np.random.randint(5, 50, 90).tolist(),
-                'revenue': np.random.uniform(100, 1000, 90).tolist()
-            }
-            return pd.DataFrame(data)
-        
-        df = pd.DataFrame(historical_sales)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
-        return df
+    Column order matches CALENDAR_FEATURES, followed by any extra feature
+    columns (lags, rolling means, promo flags) in insertion order. Each extra
+    column must be array-like with one value per date.
+    """
+    index = pd.DatetimeIndex(dates)
+    n = len(index)
+    extra_features = extra_features or {}
     
-    def extract_features(self, df: pd.DataFrame) -> np.ndarray:
-        """Extract time-based features for ML models"""
-        features = []
-        for _, row in df.iterrows():
-            feat = [
-                row['date'].dayofweek / 7.0,
-                row['date'].month / 12.0,
-                row['date'].day / 31.0,
-                (row['date'].dayofweek >= 5).astype(int),  # Weekend
-                1 if row['date'].month in [11, 12] else 0,  # Holiday season
-            ]
-            features.append(feat)
-        return np.array(features)
-    
-    def forecast_prophet(self, df: pd.DataFrame, days: int) -> Dict[str, Any]:
-        """Prophet-based forecasting"""
-        if not PROPHET_AVAILABLE:
-            return self.forecast_statistical(df, days)
-        
-        # Prepare data for Prophet
-        prophet_df = df.rename(columns={'date': 'ds', 'quantity': 'y'})
-        
-        model = Prophet(
-            daily_seasonality=True,
-            weekly_seasonality=True,
-            yearly_seasonality=True,
-            interval_width=0.95
+    features = np.empty((n, len(CALENDAR_FEATURES) + len(extra_features)), dtype=np.float32)
+    dayofweek = index.dayofweek.to_numpy()
+    month = index.month.to_numpy()
+    
+    features[:, 0] = dayofweek / 7.0
+    features[:, 1] = month / 12.0
+    features[:, 2] = index.day.to_numpy() / 31.0
+    features[:, 3] = dayofweek >= 5  # Weekend
+    features[:, 4] = month >= 11  # Holiday season (Nov-Dec)
+    
+    for col, (name, values) in enumerate(extra_features.items(), start=len(CALENDAR_FEATURES)):
+        values = np.asarray(values, dtype=np.float32)
+        if values.shape != (n,):
+            raise ValueError(f"Extra feature '{name}' has shape {values.shape}, expected ({n},)")
+        features[:, col] = values
+    
+    return features
+
+# ============================================================================
+# Sales Payloads
+# ============================================================================
+
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+class PayloadUnsupported(Exception):
+    """Raised for binary payload formats this worker cannot decode"""
+
+# Typed arrays in msgpack payloads may only use these dtype kinds
+_TYPED_ARRAY_KINDS = {'f', 'i', 'u', 'M'}
+
+@dataclass
+class SalesColumns:
+    """Decoded sales history held as NumPy columns (no per-day dicts)"""
+    dates: np.ndarray  # datetime64[ns]
+    quantities: np.ndarray
+    revenues: Optional[np.ndarray] = None
+    prices: Optional[np.ndarray] = None
+    
+    def __post_init__(self):
+        n = len(self.dates)
+        for name in ('quantities', 'revenues', 'prices'):
+            values = getattr(self, name)
+            if values is not None and len(values) != n:
+                raise ValueError(f"'{name}' has {len(values)} values but there are {n} dates")
+    
+    def __len__(self) -> int:
+        return len(self.dates)
+    
+    @classmethod
+    def from_arrays(cls, dates: Any, quantities: Any, revenues: Any = None, prices: Any = None) -> "SalesColumns":
+        dates = np.asarray(dates)
+        if dates.dtype.kind != 'M':
+            dates = pd.to_datetime(dates).to_numpy()
+        return cls(
+            dates=dates.astype('datetime64[ns]'),
+            quantities=np.asarray(quantities, dtype=np.float64),
+            revenues=None if revenues is None else np.asarray(revenues, dtype=np.float64),
+            prices=None if prices is None else np.asarray(prices, dtype=np.float64)
         )
-        model.fit(prophet_df)
+    
+    @classmethod
+    def from_model(cls, sales: ColumnarSales) -> "SalesColumns":
+        return cls.from_arrays(sales.dates, sales.quantities, sales.revenues, sales.prices)
+    
+    def to_frame(self) -> pd.DataFrame:
+        data = {'date': self.dates, 'quantity': self.quantities}
+        if self.revenues is not None:
+            data['revenue'] = self.revenues
+        if self.prices is not None:
+            data['price'] = self.prices
+        return pd.DataFrame(data, copy=False)
+
+# Any accepted shape of one sales history
+SalesInput = Union[List[Dict[str, Any]], ColumnarSales, SalesColumns]
+
+def history_length(historical_sales: SalesInput) -> int:
+    """Number of sales days in a history of any accepted shape"""
+    if isinstance(historical_sales, ColumnarSales):
+        return len(historical_sales.dates)
+    return len(historical_sales)
+
+def recent_quantities(historical_sales: SalesInput, days: int) -> np.ndarray:
+    """Quantities of the last `days` entries, in payload order"""
+    if isinstance(historical_sales, ColumnarSales):
+        return np.asarray(historical_sales.quantities[-days:], dtype=np.float64)
+    if isinstance(historical_sales, SalesColumns):
+        return historical_sales.quantities[-days:]
+    return np.array([s.get('quantity', 0) for s in historical_sales[-days:]], dtype=np.float64)
+
+def _decode_typed_array(value: Any, name: str) -> Any:
+    """msgpack array: a plain list, or {'dtype': '<f8', 'data': <bytes>}"""
+    if not isinstance(value, dict):
+        return value
+    dtype = np.dtype(value['dtype'])
+    if dtype.kind not in _TYPED_ARRAY_KINDS:
+        raise ValueError(f"Unsupported dtype '{value['dtype']}' for '{name}'")
+    return np.frombuffer(value['data'], dtype=dtype)
+
+def _columns_from_msgpack(sales: Dict[str, Any]) -> SalesColumns:
+    return SalesColumns.from_arrays(
+        _decode_typed_array(sales['dates'], 'dates'),
+        _decode_typed_array(sales['quantities'], 'quantities'),
+        _decode_typed_array(sales.get('revenues'), 'revenues'),
+        _decode_typed_array(sales.get('prices'), 'prices')
+    )
+
+def _columns_from_arrow(table: Any) -> SalesColumns:
+    def column(name: str) -> Optional[np.ndarray]:
+        return table.column(name).to_numpy() if name in table.column_names else None
+    
+    return SalesColumns.from_arrays(column('date'), column('quantity'), column('revenue'), column('price'))
+
+def decode_sales_payload(body: bytes, content_type: str) -> Tuple[Dict[str, Any], Dict[str, SalesColumns]]:
+    """Decode a binary forecast payload into request fields and sales columns
+    
+    msgpack: the JSON request shape, except each history is a map of
+      parallel arrays (dates, quantities, revenues, prices). Arrays are lists
+      or typed arrays {'dtype': <numpy dtype str>, 'data': <raw bytes>};
+      dates may be ISO strings or datetime64 (e.g. '<M8[D]').
+    Arrow IPC stream: columns date, quantity and optionally revenue, price
+      and series (the SKU/product key for bulk requests). The remaining
+      request fields are JSON values in the schema metadata.
+    
+    Returns the non-history request fields and the histories keyed by series
+    ('' for a single-product payload).
+    """
+    content_type = content_type.split(';')[0].strip().lower()
+    
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if importlib.util.find_spec("msgpack") is None:
+            raise PayloadUnsupported("msgpack payloads need the msgpack package")
+        import msgpack
         
-        future = model.make_future_dataframe(periods=days)
-        forecast = model.predict(future)
+        payload = msgpack.unpackb(body, raw=False)
+        sales = payload.pop('historical_sales', {}) or {}
+        if 'dates' in sales:
+            return payload, {'': _columns_from_msgpack(sales)}
+        return payload, {key: _columns_from_msgpack(series) for key, series in sales.items()}
+    
+    if content_type == ARROW_CONTENT_TYPE:
+        if importlib.util.find_spec("pyarrow") is None:
+            raise PayloadUnsupported("Arrow payloads need the pyarrow package")
+        import pyarrow as pa
         
-        # Extract results
-        future_dates = forecast.tail(days)
-        predictions = []
-        for _, row in future_dates.iterrows():
-            predictions.append({
-                'date': row['ds'].strftime('%Y-%m-%d'),
-                'predicted_quantity': max(0, round(row['yhat'])),
-                'lower_bound': max(0, round(row['yhat_lower'])),
-                'upper_bound': max(0, round(row['yhat_upper']))
-            })
+        table = pa.ipc.open_stream(body).read_all()
+        metadata = table.schema.metadata or {}
+        payload = {key.decode(): json.loads(value) for key, value in metadata.items()}
         
-        return {
-            'predictions': predictions,
-            'seasonality': {
-                'weekly_pattern': True,
-                'yearly_pattern': True
-            }
+        if 'series' not in table.column_names:
+            return payload, {'': _columns_from_arrow(table)}
+        
+        keys = table.column('series').to_numpy(zero_copy_only=False).astype(str)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_keys) + 1))
+        return payload, {
+            str(key): _columns_from_arrow(table.take(order[bounds[i]:bounds[i + 1]]))
+            for i, key in enumerate(unique_keys)
         }
     
-    def forecast_statistical(self, df: pd.DataFrame, days: int) -> Dict[str, Any]:
-        """Statistical fallback when Prophet not available"""
-        # Simple exponential smoothing
-        alpha = 0.3
-        quantities = df['quantity'].values
-        
-        # Calculate trend
-        x = np.arange(len(quantities))
-        slope, intercept, _, _, _ = stats.linregress(x, quantities)
-        
-        # Generate predictions
-        predictions = []
-        last_value = quantities[-1]
+    raise PayloadUnsupported(f"Unsupported content type '{content_type}'")
+
+# ============================================================================
+# Model Cache
+# ============================================================================
+
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """Stable hash of a sales history (dates and quantities)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(df['date'].to_numpy(dtype='datetime64[ns]').view(np.int64).tobytes())
+    digest.update(df['quantity'].to_numpy(dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def estimate_size(obj: Any) -> int:
+    """Approximate in-memory size of a fitted model in bytes"""
+    try:
+        return len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(obj)
+
+class ModelCache:
+    """Bounded LRU cache of fitted models with TTL and memory cap"""
+    
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 900, max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, ...], Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: Tuple[str, ...]) -> Any:
+        """Return the cached model or None, refreshing its LRU position"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            model, stored_at, size = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                self._remove(key)
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return model
+    
+    def put(self, key: Tuple[str, ...], model: Any) -> None:
+        """Store a fitted model, evicting expired then least recently used entries"""
+        size = estimate_size(model)
+        if size > self.max_bytes:
+            return
         
-        for i in range(days):
-            date = df['date'].max() + timedelta(days=i+1)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key, evicted=False)
+            self._entries[key] = (model, time.monotonic(), size)
+            self.current_bytes += size
             
-            # Seasonal adjustment (simple)
-            season_factor = 1.0 + 0.1 * np.sin(2 * np.pi * date.dayofyear / 365)
+            now = time.monotonic()
+            for stale in [k for k, (_, stored_at, _) in self._entries.items() if now - stored_at > self.ttl_seconds]:
+                self._remove(stale)
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+    
+    def _remove(self, key: Tuple[str, ...], evicted: bool = True) -> None:
+        _, _, size = self._entries.pop(key)
+        self.current_bytes -= size
+        if evicted:
+            self.evictions += 1
+
+# ============================================================================
+# Seasonality Index
+# ============================================================================
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+WEEKDAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# Days of "average" sales blended into every month/weekday, so sparse rows shrink towards 1.0
+SEASONALITY_PRIOR_DAYS = float(os.environ.get("ML_SEASONALITY_PRIOR_DAYS", 14))
+
+@dataclass
+class SeasonalityTable:
+    """Monthly and weekday sales sums per row, plus the indices derived from them
+    
+    Rows are 'overall', 'category:<name>' and 'variant:<id>'. Indices are
+    the row's average daily quantity in a month (or weekday) divided by its
+    average daily quantity overall.
+    """
+    rows: Dict[str, int]
+    sums: np.ndarray  # (n_rows, 12 months + 7 weekdays)
+    days: np.ndarray
+    index: np.ndarray
+    last_dates: Dict[str, np.datetime64]  # per variant, newest day already ingested
+    categories: Dict[str, str]  # variant -> category
+    
+    @classmethod
+    def empty(cls) -> "SeasonalityTable":
+        zeros = lambda: np.zeros((0, 19))
+        return cls({}, zeros(), zeros(), zeros(), {}, {})
+    
+    def row(self, key: str) -> int:
+        if key not in self.rows:
+            self.rows[key] = len(self.rows)
+            if len(self.rows) > len(self.sums):
+                grow = max(16, len(self.sums))
+                self.sums, self.days, self.index = (
+                    np.vstack([a, np.zeros((grow, 19))]) for a in (self.sums, self.days, self.index)
+                )
+                self.index[-grow:] = 1.0
+        return self.rows[key]
+
+class SeasonalityIndex:
+    """Precomputed seasonality table, persisted and refreshed incrementally
+    
+    ingest() only absorbs days newer than those already seen per variant and
+    recomputes the indices of the rows it touched; lookups are array reads.
+    The table is pickled to path and re-read (at most once a second) when
+    another worker has written a newer version.
+    """
+    
+    def __init__(self, path: str, prior_days: float = SEASONALITY_PRIOR_DAYS):
+        self.path = path
+        self.prior_days = prior_days
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.table = SeasonalityTable.empty()
+        self._mtime = None
+        self._checked = 0.0
+        self.lock = threading.Lock()
+    
+    def _current(self) -> SeasonalityTable:
+        now = time.monotonic()
+        if now - self._checked >= 1.0:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime is not None and mtime != self._mtime:
+                with open(self.path, 'rb') as f:
+                    self.table = pickle.load(f)
+                self._mtime = mtime
+        return self.table
+    
+    def _row_for(self, variant_id: Optional[str]) -> Optional[int]:
+        """Variant row, else its category row, else the overall row"""
+        table = self._current()
+        for key in (f"variant:{variant_id}", f"category:{table.categories.get(variant_id)}", 'overall'):
+            if key in table.rows:
+                return table.rows[key]
+        return None
+    
+    def has(self, variant_id: str) -> bool:
+        table = self._current()
+        return f"variant:{variant_id}" in table.rows or variant_id in table.categories
+    
+    def month_index(self, variant_id: Optional[str], month: int) -> float:
+        """Seasonal index of a month (1-12) for a variant; 1.0 when nothing is known"""
+        row = self._row_for(variant_id)
+        return 1.0 if row is None else float(self.table.index[row, month - 1])
+    
+    def factors(self, variant_id: Optional[str], dates: Any) -> np.ndarray:
+        """Month x weekday seasonal factor for each date"""
+        row = self._row_for(variant_id)
+        index = pd.DatetimeIndex(dates)
+        if row is None:
+            return np.ones(len(index))
+        indices = self.table.index[row]
+        return indices[index.month.to_numpy() - 1] * indices[12 + index.dayofweek.to_numpy()]
+    
+    def fingerprint(self, variant_id: Optional[str]) -> str:
+        """Hash of the indices factors() reads for a variant ('' when it has none)"""
+        row = self._row_for(variant_id)
+        if row is None:
+            return ''
+        return hashlib.blake2b(self.table.index[row].tobytes(), digest_size=8).hexdigest()
+    
+    def ingest(self, sales: Dict[str, Tuple[np.ndarray, np.ndarray]],
+               categories: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+        """Absorb new sales days, {variant_id: (dates, quantities)}, and persist the table"""
+        with self.lock:
+            self._checked = 0.0
+            table = self._current()
+            table.categories.update(categories or {})
+            dirty: Set[int] = set()
+            applied = ignored = 0
             
-            predicted = (intercept + slope * (len(quantities) + i)) * season_factor
-            predicted = max(0, predicted)
+            for variant_id, (dates, quantities) in sales.items():
+                dates = np.asarray(dates, dtype='datetime64[D]')
+                quantities = np.asarray(quantities, dtype=np.float64)
+                last = table.last_dates.get(variant_id)
+                new = np.ones(len(dates), dtype=bool) if last is None else dates > last
+                # Keep the last value given for a repeated day
+                _, first = np.unique(dates[new][::-1], return_index=True)
+                keep = np.flatnonzero(new)[::-1][first]
+                applied += len(keep)
+                ignored += len(dates) - len(keep)
+                if not len(keep):
+                    continue
+                
+                day_numbers = dates[keep].astype(np.int64)
+                slots = np.concatenate([
+                    dates[keep].astype('datetime64[M]').astype(np.int64) % 12,
+                    12 + (day_numbers + 3) % 7  # 1970-01-01 was a Thursday
+                ])
+                slot_sums = np.bincount(slots, weights=np.tile(quantities[keep], 2), minlength=19)
+                slot_days = np.bincount(slots, minlength=19)
+                
+                keys = [f"variant:{variant_id}", 'overall']
+                if variant_id in table.categories:
+                    keys.append(f"category:{table.categories[variant_id]}")
+                for key in keys:
+                    row = table.row(key)
+                    table.sums[row] += slot_sums
+                    table.days[row] += slot_days
+                    dirty.add(row)
+                table.last_dates[variant_id] = dates[keep].max()
             
-            lower = max(0, predicted * 0.7)
-            upper = predicted * 1.3
+            if dirty:
+                self._recompute(table, np.fromiter(dirty, dtype=np.int64))
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self.path)
+                self._mtime = os.path.getmtime(self.path)
             
-            predictions.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'predicted_quantity': round(predicted),
-                'lower_bound': round(lower),
-                'upper_bound': round(upper)
-            })
-        
-        return {
-            'predictions': predictions,
-            'seasonality': {
-                'weekly_pattern': True,
-                'yearly_pattern': True
+            return {'applied_days': applied, 'ignored_days': ignored, 'rows': len(table.rows)}
+    
+    def _recompute(self, table: SeasonalityTable, rows: np.ndarray) -> None:
+        sums, days = table.sums[rows], table.days[rows]
+        # Every day lands in one month slot, so the month slots give the totals
+        mean = sums[:, :12].sum(axis=1) / np.maximum(days[:, :12].sum(axis=1), 1)
+        average = (sums + self.prior_days * mean[:, None]) / (days + self.prior_days)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            index = np.where(mean[:, None] > 0, average / mean[:, None], 1.0)
+        table.index[rows] = index
+    
+    def summary(self, variant_id: Optional[str] = None) -> Dict[str, Any]:
+        """Monthly and weekday indices for the overall row, each category and optionally one variant"""
+        table = self._current()
+        describe = lambda row: {
+            'monthly': {name: round(float(v), 2) for name, v in zip(MONTH_NAMES, table.index[row, :12])},
+            'weekday': {name: round(float(v), 2) for name, v in zip(WEEKDAY_NAMES, table.index[row, 12:])}
+        }
+        result = {
+            'overall': describe(table.rows['overall']) if 'overall' in table.rows else None,
+            'by_category': {
+                key.split(':', 1)[1]: describe(row) for key, row in table.rows.items() if key.startswith('category:')
             }
         }
+        if variant_id is not None:
+            row = self._row_for(variant_id)
+            result['variant'] = describe(row) if row is not None else None
+        return result
+
+# ============================================================================
+# Multi-Series Statistical Engine
+# ============================================================================
+
+# Fitted Fourier seasonal terms for bulk "statistical" requests. Off by default:
+# the single-product model (/api/forecast, /api/forecast/update, backtests) is a
+# trend the incremental state can update from running sums, and bulk answers
+# should match it. "1" opts bulk requests into the seasonal least-squares fit
+STATISTICAL_SEASONAL = os.environ.get("ML_STATISTICAL_SEASONAL", "0") == "1"
+# Series up to this many cells (series x days x terms) are solved per block
+STATISTICAL_BLOCK_CELLS = int(os.environ.get("ML_STATISTICAL_BLOCK_CELLS", 8_000_000))
+
+# (period in days, Fourier harmonics, minimum history days to fit them)
+SEASONAL_TERMS = [(7.0, 3, 14), (365.25, 2, 730)]
+
+def pack_columns(lengths: np.ndarray, quantities: np.ndarray,
+                 dates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Left-aligned N x T quantity and date matrices (NaN / NaT padded)
     
-    def forecast_random_forest(self, df: pd.DataFrame, days: int) -> Dict[str, Any]:
-        """Random Forest-based forecasting"""
-        features = self.extract_features(df)
-        target = df['quantity'].values
-        
-        # Train model
-        model = RandomForestRegressor(n_estimators=100, random_state=42)
-        model.fit(features, target)
-        
-        # Generate future features
-        future_features = []
-        base_date = df['date'].max()
-        
-        for i in range(days):
-            future_date = base_date + timedelta(days=i+1)
-            feat = [
-                future_date.dayofweek / 7.0,
-                future_date.month / 12.0,
-                future_date.day / 31.0,
-                (future_date.dayofweek >= 5).astype(int),
-                1 if future_date.month in [11, 12] else 0,
-            ]
-            future_features.append(feat)
-        
-        future_features = np.array(future_features)
-        predictions = model.predict(future_features)
-        
-        results = []
-        base_date = df['date'].max()
-        
-        for i, pred in enumerate(predictions):
-            date = base_date + timedelta(days=i+1)
-            std = np.std(target)
-            results.append({
-                'date': date.strftime('%Y-%m-%d'),
-                'predicted_quantity': max(0, round(pred)),
-                'lower_bound': max(0, round(pred - 1.96 * std)),
-                'upper_bound': round(pred + 1.96 * std)
-            })
-        
-        return {
-            'predictions': results,
-            'seasonality': {'weekly_pattern': True}
-        }
+    quantities and dates hold all series back to back, lengths[i] values
+    for series i; each series is sorted by date.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    width = int(lengths.max()) if len(lengths) else 0
+    values = np.full((len(lengths), width), np.nan)
+    date_matrix = np.full((len(lengths), width), np.datetime64('NaT'), dtype='datetime64[D]')
+    if width:
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        dates = np.asarray(dates).astype('datetime64[D]')
+        order = np.lexsort((dates, rows))
+        cols = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        values[rows, cols] = np.asarray(quantities, dtype=np.float64)[order]
+        date_matrix[rows, cols] = dates[order]
+    return values, date_matrix
+
+def pack_series(frames: List[pd.DataFrame]) -> Tuple[np.ndarray, np.ndarray]:
+    """pack_columns for per-series frames with 'date' and 'quantity' columns"""
+    return pack_columns(
+        np.array([len(frame) for frame in frames]),
+        np.concatenate([frame['quantity'].to_numpy(dtype=np.float64) for frame in frames]) if frames else [],
+        np.concatenate([frame['date'].to_numpy().astype('datetime64[D]') for frame in frames]) if frames else []
+    )
+
+def collect_series(histories: List[SalesInput],
+                   prepare: Callable[[SalesInput], pd.DataFrame]) -> Tuple[List[int], np.ndarray, np.ndarray, Dict[int, Exception]]:
+    """Pack many sales histories into pack_columns matrices
     
-    def predict(self, historical_sales: List[Dict[str, Any]], days: int = 30, model_type: str = "prophet") -> Dict[str, Any]:
-        """Main prediction method"""
-        df = self.prepare_data(historical_sales)
-        
-        if model_type == "prophet" and PROPHET_AVAILABLE:
-            result = self.forecast_prophet(df, days)
-            model_used = "prophet"
-        elif model_type == "random_forest":
-            result = self.forecast_random_forest(df, days)
-            model_used = "random_forest"
+    Record and columnar histories are read as raw columns and all their date
+    strings parsed in one call; empty and SalesColumns histories go through
+    prepare (DemandForecaster.prepare_data). Returns the indices of the
+    packed histories, the two matrices, and the exception for each history
+    that could not be read.
+    """
+    errors: Dict[int, Exception] = {}
+    indices, lengths, quantities, dates, raw_dates = [], [], [], [], []
+    for i, history in enumerate(histories):
+        try:
+            if not history or isinstance(history, SalesColumns):
+                frame = prepare(history)
+                series_dates, series_quantities = frame['date'].to_numpy(), frame['quantity'].to_numpy()
+            elif isinstance(history, ColumnarSales):
+                series_dates, series_quantities = history.dates, history.quantities
+            else:
+                series_dates = [record['date'] for record in history]
+                series_quantities = [record['quantity'] for record in history]
+            series_quantities = np.asarray(series_quantities, dtype=np.float64)
+        except Exception as e:
+            errors[i] = e
+            continue
+        indices.append(i)
+        lengths.append(len(series_quantities))
+        quantities.append(series_quantities)
+        if isinstance(series_dates, np.ndarray) and series_dates.dtype.kind == 'M':
+            dates.append(series_dates.astype('datetime64[D]'))
         else:
-            result = self.forecast_statistical(df, days)
-            model_used = "statistical"
-        
-        return result
+            dates.append(None)
+            raw_dates.extend(series_dates)
+    
+    try:
+        parsed = pd.to_datetime(raw_dates).to_numpy().astype('datetime64[D]') if raw_dates else None
+    except (ValueError, TypeError):
+        parsed = None  # some history has bad dates; parse per series to find it
+    offset = 0
+    for k, series_dates in enumerate(dates):
+        if series_dates is not None:
+            continue
+        start, offset = offset, offset + lengths[k]
+        try:
+            if parsed is not None:
+                dates[k] = parsed[start:offset]
+            else:
+                dates[k] = pd.to_datetime(raw_dates[start:offset]).to_numpy().astype('datetime64[D]')
+        except (ValueError, TypeError) as e:
+            errors[indices[k]] = e
+    
+    keep = [k for k, i in enumerate(indices) if i not in errors]
+    if not keep:
+        return [], np.empty((0, 0)), np.empty((0, 0), dtype='datetime64[D]'), errors
+    values, date_matrix = pack_columns(
+        np.array([lengths[k] for k in keep]),
+        np.concatenate([quantities[k] for k in keep]),
+        np.concatenate([dates[k] for k in keep])
+    )
+    return [indices[k] for k in keep], values, date_matrix, errors
 
+def _fourier(day_numbers: np.ndarray) -> np.ndarray:
+    """Sine/cosine columns for every SEASONAL_TERMS period, last axis"""
+    columns = []
+    for period, harmonics, _ in SEASONAL_TERMS:
+        angle = 2 * np.pi * day_numbers[..., None] * np.arange(1, harmonics + 1) / period
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.concatenate(columns, axis=-1)
 
-class PriceOptimizer:
-    """Price optimization based on elasticity"""
+RESPONSE_FORMATS = ("records", "columnar")
+
+# Sample paths per series behind quantile forecasts (bootstrap replicates)
+FORECAST_SAMPLES = int(os.environ.get("ML_FORECAST_SAMPLES", 200))
+MAX_QUANTILES = 20
+
+def quantile_label(level: float) -> str:
+    """Response key of a quantile level, e.g. 0.1 -> p10 and 0.025 -> p2.5"""
+    return f"p{level * 100:g}"
+
+def forecast_levels(quantiles: Optional[List[float]], service_level: Optional[float] = None) -> Tuple[float, ...]:
+    """Sorted distinct quantile levels a forecast has to compute"""
+    return tuple(sorted(set(quantiles or ()) | ({service_level} if service_level is not None else set())))
+
+def path_quantiles(paths: np.ndarray, levels: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Daily and cumulative quantiles of sample paths shaped (..., samples, horizon)
     
-    def optimize_price(self, current_price: float, cost_price: float, 
-                      historical_sales: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Calculate optimal price point"""
-        
-        if not historical_sales:
-            # Default recommendation for demo
-            return {
-                'optimal_price': round(current_price * 1.05, 2),
-                'price_elasticity': -1.2,
-                'predicted_demand': {'current': 100, 'optimal': 95},
-                'revenue_projection': {'current': 10000, 'optimal': 10500},
-                'confidence': 0.7
-            }
-        
-        # Extract price and quantity data
-        prices = np.array([s.get('price', current_price) for s in historical_sales])
-        quantities = np.array([s.get('quantity', 10) for s in historical_sales])
+    Both results are (..., levels, horizon). cumulative[..., h] is the
+    quantile of total demand over the first h + 1 days, which is what
+    safety stock needs; summing daily quantiles would overstate it.
+    """
+    paths = np.maximum(paths, 0.0)
+    daily = np.quantile(paths, levels, axis=-2)
+    cumulative = np.quantile(np.cumsum(paths, axis=-1), levels, axis=-2)
+    return np.moveaxis(daily, 0, -2), np.moveaxis(cumulative, 0, -2)
+
+def normal_quantiles(predicted: np.ndarray, sigma: np.ndarray,
+                     levels: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """path_quantiles for Gaussian errors with a per-day sigma, independent across days"""
+    z = stats.norm.ppf(np.asarray(levels))[:, None]
+    predicted, sigma = np.asarray(predicted)[..., None, :], np.asarray(sigma)[..., None, :]
+    daily = predicted + z * sigma
+    cumulative = np.cumsum(predicted, axis=-1) + z * np.sqrt(np.cumsum(sigma ** 2, axis=-1))
+    return np.maximum(daily, 0.0), np.maximum(cumulative, 0.0)
+
+def bootstrap_offsets(X: np.ndarray, residuals: np.ndarray, mask: np.ndarray, X_future: np.ndarray,
+                      samples: int, rng: np.random.Generator, ridge: float = 1e-6) -> np.ndarray:
+    """Residual-bootstrap forecast errors (N, samples, horizon) of batched least squares
+    
+    X is (N, T, terms) with padding rows zeroed, X_future (N, horizon,
+    terms). Putting resampled residuals back on the fit and refitting moves
+    the coefficients by (X'X)^-1 X' r*, whose covariance is s^2 (X'X)^-1
+    with s^2 the mean squared residual; that shift is drawn from its normal
+    limit rather than by refitting T draws per replicate. Future noise is a
+    run of consecutive resampled residuals, so multi-day totals keep the
+    residuals' autocorrelation.
+    """
+    n = mask.sum(axis=1)
+    s = np.sqrt((residuals ** 2).sum(axis=1) / n)
+    chol = np.linalg.cholesky(np.einsum('ntp,ntq->npq', X, X) + ridge * np.eye(X.shape[-1]))
+    # z / L' has covariance (L L')^-1 = (X'X)^-1
+    shift = np.linalg.solve(np.swapaxes(chol, 1, 2), rng.standard_normal((len(n), X.shape[-1], samples)))
+    offsets = np.einsum('nhp,nps->nsh', X_future, shift * s[:, None, None])
+    
+    # Each row's residuals moved to the front, then one wrapped run per path
+    packed = np.take_along_axis(residuals, np.argsort(~mask, axis=1, kind='stable'), axis=1)
+    starts = (rng.random((len(n), samples, 1)) * n[:, None, None]).astype(np.int64)
+    picks = (starts + np.arange(X_future.shape[1])) % n[:, None, None]
+    return offsets + np.take_along_axis(packed[:, None, :], picks, axis=2)
+
+def trend_quantiles(values: np.ndarray, slope: np.ndarray, intercept: np.ndarray, predicted: np.ndarray,
+                    levels: Sequence[float], samples: int = FORECAST_SAMPLES,
+                    block_cells: int = STATISTICAL_BLOCK_CELLS) -> Tuple[np.ndarray, np.ndarray]:
+    """path_quantiles of project_trend forecasts, by residual bootstrap of the linear trend
+    
+    values is N x T with NaN padding, the trend is on column positions
+    (as in MultiSeriesStatistical). Seeded, so identical requests get
+    identical quantiles.
+    """
+    rng = np.random.default_rng(0)
+    block = max(1, block_cells // max(1, values.shape[1] * 2 + samples * predicted.shape[1]))
+    daily, cumulative = [], []
+    for start in range(0, len(values), block):
+        part = slice(start, start + block)
+        mask = ~np.isnan(values[part])
+        positions = np.where(mask, np.arange(values.shape[1], dtype=np.float64), 0.0)
+        fitted = intercept[part, None] + slope[part, None] * positions
+        residuals = np.where(mask, values[part] - fitted, 0.0)
+        X = np.stack([mask.astype(np.float64), positions], axis=-1)
+        future = positions.max(axis=1)[:, None] + np.arange(1, predicted.shape[1] + 1)
+        X_future = np.stack([np.ones_like(future), future], axis=-1)
+        offsets = bootstrap_offsets(X, residuals, mask, X_future, samples, rng)
+        block_daily, block_cumulative = path_quantiles(predicted[part, None, :] + offsets, levels)
+        daily.append(block_daily)
+        cumulative.append(block_cumulative)
+    return np.concatenate(daily), np.concatenate(cumulative)
+
+@dataclass
+class ForecastArrays:
+    """One series' daily forecast, starting the day after its history ends
+    
+    Values are non-negative float32; responses round them to whole units,
+    either as one dict per day ("records") or as one array per field
+    ("columnar"). When quantile levels were requested, quantiles holds the
+    daily demand quantiles and cumulative the quantiles of demand summed
+    from the first day, one row per level.
+    """
+    start: np.datetime64  # datetime64[D] of the first forecast day
+    predicted: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    levels: Tuple[float, ...] = ()
+    quantiles: Optional[np.ndarray] = None  # (levels, horizon)
+    cumulative: Optional[np.ndarray] = None  # (levels, horizon)
+    
+    @classmethod
+    def from_values(cls, start: Any, predicted: np.ndarray, lower: np.ndarray, upper: np.ndarray,
+                    levels: Sequence[float] = (), quantiles: Optional[np.ndarray] = None,
+                    cumulative: Optional[np.ndarray] = None) -> "ForecastArrays":
+        def clip(values: np.ndarray) -> np.ndarray:
+            return np.maximum(np.asarray(values, dtype=np.float64), 0.0).astype(np.float32)
+        if not levels:
+            return cls(np.datetime64(start, 'D'), clip(predicted), clip(lower), clip(upper))
+        return cls(np.datetime64(start, 'D'), clip(predicted), clip(lower), clip(upper),
+                   tuple(levels), clip(quantiles), clip(cumulative))
+    
+    @property
+    def horizon(self) -> int:
+        return len(self.predicted)
+    
+    def dates(self) -> np.ndarray:
+        return self.start + np.arange(self.horizon)
+    
+    def rounded(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Prediction and bounds rounded to whole units (half to even, like round())"""
+        return tuple(np.rint(values).astype(np.int64) for values in (self.predicted, self.lower, self.upper))
+    
+    def rounded_quantiles(self, levels: Sequence[float]) -> Dict[str, np.ndarray]:
+        """Daily quantiles at some of the computed levels, rounded, keyed by quantile_label"""
+        return {quantile_label(level): np.rint(self.quantiles[self.levels.index(level)]).astype(np.int64)
+                for level in sorted(set(levels))}
+    
+    def cover_quantile(self, level: float, days: int) -> float:
+        """Quantile of total demand over the first `days` days
+        
+        Past the horizon, the horizon's total is scaled up proportionally.
+        """
+        covered = min(days, self.horizon)
+        return float(self.cumulative[self.levels.index(level), covered - 1]) * days / covered
+    
+    def records(self, quantiles: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+        predicted, lower, upper = (values.tolist() for values in self.rounded())
+        records = [
+            {'date': d, 'predicted_quantity': p, 'lower_bound': lo, 'upper_bound': up}
+            for d, p, lo, up in zip(np.datetime_as_string(self.dates()).tolist(), predicted, lower, upper)
+        ]
+        if quantiles:
+            labels, rows = zip(*((label, values.tolist()) for label, values in self.rounded_quantiles(quantiles).items()))
+            for record, day_values in zip(records, zip(*rows)):
+                record['quantiles'] = dict(zip(labels, day_values))
+        return records
+    
+    def intervals(self) -> List[Dict[str, Any]]:
+        return [
+            {'date': record['date'], 'lower': record['lower_bound'], 'upper': record['upper_bound']}
+            for record in self.records()
+        ]
+    
+    def columns(self, quantiles: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+        """Compact shape: start date and horizon, then one integer array per field"""
+        predicted, lower, upper = self.rounded()
+        columns = {
+            'start': str(self.start),
+            'horizon': self.horizon,
+            'predicted_quantity': predicted,
+            'lower_bound': lower,
+            'upper_bound': upper
+        }
+        if quantiles:
+            columns['quantiles'] = self.rounded_quantiles(quantiles)
+        return columns
+    
+    def payload(self, response_format: str = "records", quantiles: Optional[Sequence[float]] = None) -> Any:
+        """Forecast in the response format, with daily quantiles at the given (computed) levels"""
+        return self.columns(quantiles) if response_format == "columnar" else self.records(quantiles)
+
+@dataclass
+class ForecastMatrix:
+    """N x horizon forecasts for many series (multi-series and global models)"""
+    dates: np.ndarray  # datetime64[D]
+    predicted: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    patterns: np.ndarray  # (N, 2) bool: weekly and yearly pattern modelled
+    levels: Tuple[float, ...] = ()
+    quantiles: Optional[np.ndarray] = None  # (N, levels, horizon), as in ForecastArrays
+    cumulative: Optional[np.ndarray] = None
+    
+    def result(self, i: int) -> Dict[str, Any]:
+        """Series i in the per-product forecast format"""
+        weekly, yearly = (bool(flag) for flag in self.patterns[i])
+        quantiles = {}
+        if self.levels:
+            quantiles = {'levels': self.levels, 'quantiles': self.quantiles[i], 'cumulative': self.cumulative[i]}
+        return {
+            'forecast': ForecastArrays.from_values(self.dates[i, 0], self.predicted[i], self.lower[i], self.upper[i],
+                                                   **quantiles),
+            'seasonality': {'weekly_pattern': weekly, 'yearly_pattern': yearly}
+        }
+
+def project_trend(slope: np.ndarray, intercept: np.ndarray, n: np.ndarray,
+                  last_dates: np.ndarray, days: int) -> ForecastMatrix:
+    """Linear trends with the fixed sine seasonal adjustment, as forecast_statistical does
+    
+    Series i is at positions n[i], n[i] + 1, ... over the days after
+    last_dates[i]; intervals are the prediction -30% / +30%.
+    """
+    steps = np.arange(days)
+    dates = np.asarray(last_dates, dtype='datetime64[D]')[:, None] + (steps + 1)
+    day_of_year = (dates - dates.astype('datetime64[Y]')).astype(np.int64) + 1
+    season_factor = 1.0 + 0.1 * np.sin(2 * np.pi * day_of_year / 365)
+    
+    trend = np.asarray(intercept)[:, None] + np.asarray(slope)[:, None] * (np.asarray(n)[:, None] + steps)
+    predicted = np.maximum(trend * season_factor, 0.0)
+    return ForecastMatrix(
+        dates=dates,
+        predicted=predicted,
+        lower=predicted * 0.7,
+        upper=predicted * 1.3,
+        patterns=np.ones((len(predicted), 2), dtype=bool)
+    )
+
+class MultiSeriesStatistical:
+    """Least-squares trend (+ Fourier seasonality) forecasts for many series at once
+    
+    Input is an N x T matrix with one series per row, the column being the
+    time step (NaN where a series has no value). Without seasonal terms the
+    per-series trend matches stats.linregress on positions and the output
+    matches forecast_statistical. With them, weekly and yearly Fourier terms
+    are added for series long enough to support them, all series are solved
+    in batched normal equations, and intervals come from residual spread.
+    Quantiles, when levels are given, come from a residual bootstrap of the
+    same fits (bootstrap_offsets). The seasonal fit is opt-in
+    (ML_STATISTICAL_SEASONAL=1); by default bulk requests get the trend.
+    """
+    
+    def __init__(self, seasonal: bool = STATISTICAL_SEASONAL, ridge: float = 1e-6,
+                 block_cells: int = STATISTICAL_BLOCK_CELLS):
+        self.seasonal = seasonal
+        self.ridge = ridge
+        self.block_cells = block_cells
+    
+    # Fits and projects every series in one pass
+    @timed_stage("fit", "statistical_batch")
+    def forecast(self, values: np.ndarray, dates: np.ndarray, days: int,
+                 quantiles: Sequence[float] = ()) -> ForecastMatrix:
+        values = np.asarray(values, dtype=np.float64)
+        mask = ~np.isnan(values)
+        n = mask.sum(axis=1)
+        if (n == 0).any():
+            raise ValueError("Every series needs at least one observation")
+        positions = np.where(mask, np.arange(values.shape[1]), 0)
+        last_step = positions.max(axis=1)
+        last_dates = np.take_along_axis(np.asarray(dates, dtype='datetime64[D]'), last_step[:, None], axis=1)[:, 0]
+        
+        if not self.seasonal:
+            y = np.where(mask, values, 0.0)
+            x_mean = positions.sum(axis=1) / n
+            y_mean = y.sum(axis=1) / n
+            dx = np.where(mask, positions - x_mean[:, None], 0.0)
+            ss_x = (dx * dx).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                slope = np.where(ss_x > 0, (dx * (y - y_mean[:, None])).sum(axis=1) / ss_x, 0.0)
+            intercept = y_mean - slope * x_mean
+            forecast = project_trend(slope, intercept, last_step + 1, last_dates, days)
+            if quantiles:
+                forecast.levels = tuple(quantiles)
+                forecast.quantiles, forecast.cumulative = trend_quantiles(
+                    values, slope, intercept, forecast.predicted, quantiles, block_cells=self.block_cells
+                )
+            return forecast
+        
+        n_terms = 2 + sum(2 * harmonics for _, harmonics, _ in SEASONAL_TERMS)
+        # Quantile paths add (series, samples, horizon) per block
+        cells = values.shape[1] * n_terms + (FORECAST_SAMPLES * days if quantiles else 0)
+        block = max(1, self.block_cells // max(1, cells))
+        rng = np.random.default_rng(0)
+        parts = [
+            self._fit_block(values[start:start + block], mask[start:start + block],
+                            np.asarray(dates[start:start + block], dtype='datetime64[D]'),
+                            last_dates[start:start + block], days, quantiles, rng)
+            for start in range(0, len(values), block)
+        ]
+        return ForecastMatrix(
+            dates=np.concatenate([p.dates for p in parts]),
+            predicted=np.concatenate([p.predicted for p in parts]),
+            lower=np.concatenate([p.lower for p in parts]),
+            upper=np.concatenate([p.upper for p in parts]),
+            patterns=np.concatenate([p.patterns for p in parts]),
+            levels=tuple(quantiles),
+            quantiles=np.concatenate([p.quantiles for p in parts]) if quantiles else None,
+            cumulative=np.concatenate([p.cumulative for p in parts]) if quantiles else None
+        )
+    
+    def _design(self, steps: np.ndarray, day_numbers: np.ndarray, x_mean: np.ndarray,
+                active: np.ndarray) -> np.ndarray:
+        """Design tensor (N, T, terms): intercept, centered step, enabled Fourier columns"""
+        fourier = _fourier(day_numbers.astype(np.float64))
+        widths = [2 * harmonics for _, harmonics, _ in SEASONAL_TERMS]
+        fourier *= np.repeat(active, widths, axis=1)[:, None, :]
+        return np.concatenate([
+            np.ones(steps.shape + (1,)),
+            (steps - x_mean[:, None])[..., None],
+            fourier
+        ], axis=-1)
+    
+    def _fit_block(self, values: np.ndarray, mask: np.ndarray, dates: np.ndarray, last_dates: np.ndarray,
+                   days: int, quantiles: Sequence[float] = (),
+                   rng: Optional[np.random.Generator] = None) -> ForecastMatrix:
+        n = mask.sum(axis=1)
+        steps = np.arange(values.shape[1], dtype=np.float64)[None, :].repeat(len(values), axis=0)
+        x_mean = np.where(mask, steps, 0.0).sum(axis=1) / n
+        active = n[:, None] >= np.array([min_days for _, _, min_days in SEASONAL_TERMS])
+        
+        # Padding cells get day 0; they carry zero weight
+        day_numbers = np.where(mask, dates, np.datetime64(0, 'D')).astype(np.int64)
+        X = self._design(steps, day_numbers, x_mean, active) * mask[..., None]
+        y = np.where(mask, values, 0.0)
+        
+        XtX = np.einsum('ntp,ntq->npq', X, X)
+        Xty = np.einsum('ntp,nt->np', X, y)
+        XtX += self.ridge * np.eye(X.shape[-1])
+        coef = np.linalg.solve(XtX, Xty[..., None])[..., 0]
+        
+        residuals = (y - np.einsum('ntp,np->nt', X, coef)) * mask
+        n_params = 2 + (active * [2 * harmonics for _, harmonics, _ in SEASONAL_TERMS]).sum(axis=1)
+        sigma = np.sqrt((residuals ** 2).sum(axis=1) / np.maximum(n - n_params, 1))
+        
+        last_step = np.where(mask, steps, -1).max(axis=1)
+        horizon = np.arange(1, days + 1)
+        future_steps = last_step[:, None] + horizon
+        future_dates = last_dates[:, None] + horizon
+        X_future = self._design(future_steps, future_dates.astype(np.int64), x_mean, active)
+        
+        predicted = np.maximum(np.einsum('nhp,np->nh', X_future, coef), 0.0)
+        forecast = ForecastMatrix(
+            dates=future_dates,
+            predicted=predicted,
+            lower=np.maximum(predicted - 1.96 * sigma[:, None], 0.0),
+            upper=predicted + 1.96 * sigma[:, None],
+            patterns=active
+        )
+        if quantiles:
+            offsets = bootstrap_offsets(X, residuals, mask, X_future, FORECAST_SAMPLES, rng, self.ridge)
+            forecast.levels = tuple(quantiles)
+            forecast.quantiles, forecast.cumulative = path_quantiles(predicted[:, None, :] + offsets, quantiles)
+        return forecast
+
+# ============================================================================
+# Global Forecasting Model
+# ============================================================================
+
+GLOBAL_HORIZON = int(os.environ.get("ML_GLOBAL_HORIZON", 30))  # longest horizon trained directly
+GLOBAL_ORIGIN_STRIDE = int(os.environ.get("ML_GLOBAL_ORIGIN_STRIDE", 7))
+GLOBAL_MAX_ROWS = int(os.environ.get("ML_GLOBAL_MAX_ROWS", 250_000))
+
+# Lags (days before the forecast origin) used as features
+GLOBAL_LAGS = [0, 1, 2, 3, 4, 5, 6, 13, 20, 27]
+
+GLOBAL_FEATURES = (
+    [f"lag_{lag}" for lag in GLOBAL_LAGS]
+    + ['same_weekday_last', 'same_weekday_mean4', 'mean_7', 'mean_28', 'mean_all',
+       'zero_share', 'log_level', 'history_days', 'horizon']
+    + CALENDAR_FEATURES
+)
+
+@timed_stage("features")
+def global_features(values: np.ndarray, dates: np.ndarray, rows: np.ndarray, origins: np.ndarray,
+                    horizons: np.ndarray, horizon_cap: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Feature matrix (float32, GLOBAL_FEATURES order) and scale for (series, origin, horizon) rows
+    
+    values / dates are pack_columns matrices; the origin is the last day the
+    forecast may look at. Everything is relative to the series' recent
+    level (28-day mean + 1) so one model serves slow and fast movers; lags
+    before a series starts are NaN, which the gradient boosting handles.
+    The horizon feature is clipped to horizon_cap (the trained horizon).
+    """
+    observed = ~np.isnan(values)
+    filled = np.where(observed, values, 0.0)
+    width = values.shape[1]
+    totals = np.concatenate([np.zeros((len(values), 1)), np.cumsum(filled, axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(values), 1)), np.cumsum(observed, axis=1)], axis=1)
+    zeros = np.concatenate([np.zeros((len(values), 1)), np.cumsum(observed & (filled == 0), axis=1)], axis=1)
+    
+    def window_mean(window: Optional[int]) -> np.ndarray:
+        end = origins + 1
+        start = np.zeros_like(end) if window is None else np.maximum(end - window, 0)
+        n = counts[rows, end] - counts[rows, start]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (totals[rows, end] - totals[rows, start]) / n
+    
+    def at(positions: np.ndarray) -> np.ndarray:
+        """values[row, position] for an (n_rows, k) position array, NaN outside the series"""
+        valid = (positions >= 0) & (positions <= origins[:, None])
+        return np.where(valid, values[rows[:, None], np.clip(positions, 0, width - 1)], np.nan)
+    
+    mean_28 = window_mean(28)
+    scale = np.nan_to_num(mean_28) + 1.0
+    lags = at(origins[:, None] - np.array(GLOBAL_LAGS))
+    # Most recent observed day with the target's weekday, and the mean of the last four
+    back = 7 * np.ceil(horizons / 7).astype(np.int64)
+    same_weekday = at(origins[:, None] + horizons[:, None] - back[:, None] - 7 * np.arange(4))
+    weekday_seen = ~np.isnan(same_weekday)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        same_weekday_mean = np.nansum(same_weekday, axis=1) / weekday_seen.sum(axis=1)
+    
+    target_dates = dates[rows, origins] + horizons
+    features = np.column_stack([
+        lags / scale[:, None],
+        same_weekday[:, 0] / scale,
+        same_weekday_mean / scale,
+        window_mean(7) / scale,
+        mean_28 / scale,
+        window_mean(None) / scale,
+        (zeros[rows, origins + 1]) / np.maximum(counts[rows, origins + 1], 1),
+        np.log1p(np.nan_to_num(mean_28)),
+        counts[rows, origins + 1],
+        horizons if horizon_cap is None else np.minimum(horizons, horizon_cap),
+        build_calendar_features(target_dates)
+    ]).astype(np.float32)
+    return features, scale
+
+def training_rows(lengths: np.ndarray, horizon: int, stride: int, max_rows: int,
+                  seed: int = 42) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(series, origin, horizon) triples with known targets, at most max_rows of them
+    
+    Origins run back from each series' last day every `stride` days, so
+    the most recent behaviour is always represented.
+    """
+    series, origins = [], []
+    for i, n in enumerate(lengths):
+        series_origins = np.arange(n - 2, -1, -stride)
+        series.append(np.full(len(series_origins), i))
+        origins.append(series_origins)
+    series = np.concatenate(series) if series else np.empty(0, dtype=np.int64)
+    origins = np.concatenate(origins) if origins else np.empty(0, dtype=np.int64)
+    
+    available = np.minimum(lengths[series] - 1 - origins, horizon)
+    rows = np.repeat(series, available)
+    origin_rows = np.repeat(origins, available)
+    horizons = np.arange(available.sum()) - np.repeat(np.cumsum(available) - available, available) + 1
+    
+    if len(rows) > max_rows:
+        keep = np.sort(np.random.default_rng(seed).choice(len(rows), max_rows, replace=False))
+        rows, origin_rows, horizons = rows[keep], origin_rows[keep], horizons[keep]
+    return rows, origin_rows, horizons
+
+@dataclass
+class GlobalModel:
+    """One gradient boosting model shared by every series
+    
+    Trained on relative demand (quantity / recent level) for horizons
+    1..horizon; interval widths per horizon come from the validation
+    residuals (each series' most recent horizon days held out).
+    """
+    model: Any
+    horizon: int
+    residual_std: np.ndarray  # per horizon, in relative units
+    trained_at: str
+    n_series: int
+    n_rows: int
+    validation_wape: Optional[float]
+    
+    @timed_stage("predict")
+    def forecast(self, values: np.ndarray, dates: np.ndarray, days: int,
+                 quantiles: Sequence[float] = ()) -> ForecastMatrix:
+        """Forecast every series from its last day with one predict call
+        
+        Quantiles treat the validation residuals as Gaussian per horizon.
+        """
+        lengths = (~np.isnan(values)).sum(axis=1)
+        rows = np.repeat(np.arange(len(values)), days)
+        origins = np.repeat(lengths - 1, days)
+        steps = np.tile(np.arange(1, days + 1), len(values))
+        
+        features, scale = global_features(values, dates, rows, origins, steps, horizon_cap=self.horizon)
+        target_dates = dates[rows, origins] + steps
+        
+        relative = np.maximum(self.model.predict(features), 0.0)
+        sigma = self.residual_std[np.minimum(steps, self.horizon) - 1]
+        spread = 1.96 * sigma
+        shape = (len(values), days)
+        forecast = ForecastMatrix(
+            dates=target_dates.reshape(shape),
+            predicted=(relative * scale).reshape(shape),
+            lower=(np.maximum(relative - spread, 0.0) * scale).reshape(shape),
+            upper=((relative + spread) * scale).reshape(shape),
+            patterns=np.ones((len(values), 2), dtype=bool)
+        )
+        if quantiles:
+            forecast.levels = tuple(quantiles)
+            forecast.quantiles, forecast.cumulative = normal_quantiles(
+                forecast.predicted, (sigma * scale).reshape(shape), quantiles
+            )
+        return forecast
+    
+    def info(self) -> Dict[str, Any]:
+        return {
+            'horizon': self.horizon,
+            'n_series': self.n_series,
+            'n_rows': self.n_rows,
+            'validation_wape': self.validation_wape,
+            'trained_at': self.trained_at
+        }
+
+@timed_stage("fit", "global")
+def train_global_model(values: np.ndarray, dates: np.ndarray, horizon: int = GLOBAL_HORIZON,
+                       stride: int = GLOBAL_ORIGIN_STRIDE, max_rows: int = GLOBAL_MAX_ROWS) -> GlobalModel:
+    """Fit a GlobalModel on pack_columns matrices of every series in the catalog"""
+    lengths = (~np.isnan(values)).sum(axis=1)
+    rows, origins, horizons = training_rows(lengths, horizon, stride, max_rows)
+    if not len(rows):
+        raise ValueError("Global model needs series with at least two days of history")
+    features, scale = global_features(values, dates, rows, origins, horizons)
+    target = values[rows, origins + horizons] / scale
+    
+    # Hold out each series' last `horizon` days: fit on rows whose target is
+    # earlier, score the rows forecasting from inside the holdout window
+    holdout_start = lengths[rows] - horizon
+    fit_rows = origins + horizons < holdout_start
+    validation = origins + 1 >= holdout_start
+    model = sk_ensemble.HistGradientBoostingRegressor(
+        max_iter=300, learning_rate=0.05, early_stopping=True, random_state=42
+    )
+    
+    residual_std = np.full(horizon, np.nan)
+    validation_wape = None
+    if fit_rows.sum() >= 100 and validation.any():
+        model.fit(features[fit_rows], target[fit_rows])
+        predicted = np.maximum(model.predict(features[validation]), 0.0)
+        residuals = target[validation] - predicted
+        for h in range(1, horizon + 1):
+            at_h = horizons[validation] == h
+            if at_h.sum() > 1:
+                residual_std[h - 1] = residuals[at_h].std()
+        actual = target[validation] * scale[validation]
+        if actual.sum() > 0:
+            validation_wape = round(float(np.abs(residuals * scale[validation]).sum() / actual.sum()), 4)
+    model.fit(features, target)
+    fallback = float(np.nanmean(residual_std)) if np.isfinite(residual_std).any() else float(np.std(target))
+    residual_std = np.where(np.isfinite(residual_std), residual_std, fallback)
+    
+    return GlobalModel(
+        model=model,
+        horizon=horizon,
+        residual_std=residual_std,
+        trained_at=datetime.now().isoformat(),
+        n_series=len(values),
+        n_rows=len(rows),
+        validation_wape=validation_wape
+    )
+
+class GlobalModelStore:
+    """Pickled GlobalModel, loaded once per worker and re-read when retrained"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._cached: Optional[Tuple[GlobalModel, float]] = None
+        self._lock = threading.Lock()
+    
+    def load(self) -> Optional[GlobalModel]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        with self._lock:
+            if self._cached is None or self._cached[1] != mtime:
+                with open(self.path, 'rb') as f:
+                    self._cached = (pickle.load(f), mtime)
+            return self._cached[0]
+    
+    def save(self, model: GlobalModel) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self._cached = (model, os.path.getmtime(self.path))
+
+# ============================================================================
+# Model Routing
+# ============================================================================
+
+# sMAPE (%) a model must reach in backtests to be picked by model_type "auto"
+AUTO_SMAPE_TARGET = float(os.environ.get("ML_AUTO_SMAPE_TARGET", 35))
+
+# Starting estimates of milliseconds per series, replaced by measured averages
+DEFAULT_MODEL_COST_MS = {'statistical': 2.0, 'global': 5.0, 'random_forest': 400.0, 'prophet': 3000.0}
+
+# Average demand interval above which a series counts as intermittent (Syntetos-Boylan)
+INTERMITTENT_ADI = 1.32
+
+class ModelCostTracker:
+    """Moving average of the cost of fitting one series for each model, in milliseconds
+    
+    Only actual fits are measured (a model served from the model cache
+    costs nothing to record); the global model, never fitted per series,
+    is measured by its per-series predict time. With a path, the table is
+    shared through a small JSON file: each process folds its measurements
+    into it and picks up the others' (re-read at most once a second), so
+    the API and the bulk workers route with the same costs. The first
+    measurement of each model in a process is dropped, since it pays for
+    lazy imports and cold caches.
+    """
+    
+    def __init__(self, path: Optional[str] = None, defaults: Dict[str, float] = DEFAULT_MODEL_COST_MS,
+                 alpha: float = 0.2, refresh_seconds: float = 1.0):
+        self.path = path
+        self.costs = dict(defaults)
+        self.alpha = alpha
+        self.refresh_seconds = refresh_seconds
+        self._warm: Set[str] = set()
+        self._lock = threading.Lock()
+        self._mtime = 0.0
+        self._checked = 0.0
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    def _sync(self, force: bool = False) -> None:
+        """Adopt the shared table if another process changed it"""
+        now = time.monotonic()
+        if not self.path or (not force and now - self._checked < self.refresh_seconds):
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    self.costs.update(json.load(f))
+                self._mtime = mtime
+        except (OSError, ValueError):
+            pass
+    
+    def _save(self) -> None:
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.costs, f)
+            os.replace(tmp, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError:
+            pass
+    
+    def record(self, model: str, seconds: float, series: int = 1) -> None:
+        per_series = 1000 * seconds / max(series, 1)
+        with self._lock:
+            if model not in self._warm:
+                self._warm.add(model)
+                return
+            self._sync(force=True)
+            previous = self.costs.get(model)
+            self.costs[model] = per_series if previous is None else previous + self.alpha * (per_series - previous)
+            if self.path:
+                self._save()
+    
+    def expected(self, model: str) -> float:
+        with self._lock:
+            self._sync()
+            return round(self.costs.get(model, 0.0), 2)
+    
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            self._sync()
+            return {model: round(cost, 2) for model, cost in self.costs.items()}
+
+def series_traits(values: np.ndarray) -> Dict[str, np.ndarray]:
+    """Length, zero share, average demand interval and squared CV of demand sizes per row"""
+    observed = ~np.isnan(values)
+    filled = np.where(observed, values, 0.0)
+    length = observed.sum(axis=1)
+    demand = observed & (filled > 0)
+    demand_days = demand.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_size = np.where(demand, filled, 0.0).sum(axis=1) / demand_days
+        var_size = np.where(demand, (filled - mean_size[:, None]) ** 2, 0.0).sum(axis=1) / demand_days
+        return {
+            'length': length,
+            'zero_share': 1 - demand_days / np.maximum(length, 1),
+            'adi': np.where(demand_days > 0, length / demand_days, np.inf),
+            'cv2': np.where(demand_days > 0, var_size / mean_size ** 2, np.nan)
+        }
+
+def eligible_models(traits: Dict[str, Any], global_trained: bool) -> List[str]:
+    """Models worth trying on a series with these traits, cheapest first"""
+    intermittent = traits['adi'] >= INTERMITTENT_ADI
+    models = ['statistical']
+    if global_trained:
+        models.append('global')
+    if traits['length'] >= 28 and not intermittent:
+        models.append('random_forest')
+    if PROPHET_AVAILABLE and traits['length'] >= 90 and traits['zero_share'] < 0.3 and not intermittent:
+        models.append('prophet')
+    return sorted(models, key=model_costs.expected)
+
+def choose_model(traits: Dict[str, Any], scores: Dict[str, float], global_trained: bool,
+                 target: float = AUTO_SMAPE_TARGET) -> Dict[str, Any]:
+    """Cheapest eligible model whose known sMAPE meets the target
+    
+    scores maps model -> the product's backtested sMAPE. Models without a score are never assumed to meet the target;
+    if nothing does, the best-scoring eligible model wins, and with no
+    scores at all the cheapest one.
+    """
+    candidates = eligible_models(traits, global_trained)
+    scored = [model for model in candidates if scores.get(model) is not None]
+    meeting = [model for model in scored if scores[model] <= target]
+    if meeting:
+        model, reason = meeting[0], f"cheapest model within the sMAPE target of {target:g}%"
+    elif scored:
+        model = min(scored, key=lambda m: scores[m])
+        reason = f"no model within the sMAPE target of {target:g}%; most accurate backtested model"
+    else:
+        model, reason = candidates[0], "no backtest scores yet; cheapest eligible model"
+    
+    return {
+        'model': model,
+        'reason': reason,
+        'expected_cost_ms': model_costs.expected(model),
+        'expected_smape': scores.get(model),
+        'candidates': {m: {'expected_cost_ms': model_costs.expected(m), 'smape': scores.get(m)} for m in candidates},
+        'traits': {
+            'length': int(traits['length']),
+            'zero_share': round(float(traits['zero_share']), 3),
+            'adi': round(float(traits['adi']), 2) if np.isfinite(traits['adi']) else None,
+            'cv2': round(float(traits['cv2']), 3) if np.isfinite(traits['cv2']) else None,
+            'intermittent': bool(traits['adi'] >= INTERMITTENT_ADI)
+        }
+    }
+
+# ============================================================================
+# ML Service
+# ============================================================================
+
+# Seed of the demo history used when a forecast request has no sales
+MOCK_DATA_SEED = int(os.environ.get("ML_MOCK_DATA_SEED", 42))
+
+def prophet_seasonality(dates: pd.Series) -> Dict[str, bool]:
+    """Prophet seasonalities the history can support
+    
+    Daily seasonality only for sub-daily data (ours is aggregated per day);
+    weekly needs two full cycles, as in Prophet's own "auto"; yearly one, which
+    backtests better on a year of daily sales than leaving it out.
+    """
+    span = (dates.max() - dates.min()).days
+    spacing = dates.diff().median()
+    return {
+        'daily_seasonality': bool(pd.notna(spacing) and spacing < pd.Timedelta(days=1)),
+        'weekly_seasonality': span >= 14,
+        'yearly_seasonality': span >= 365
+    }
+
+class DemandForecaster:
+    """Demand forecasting using multiple models"""
+    
+    def __init__(self, seasonality: Optional[SeasonalityIndex] = None,
+                 global_models: Optional[GlobalModelStore] = None,
+                 backtests: Optional["BacktestStore"] = None):
+        self.seasonality = seasonality
+        self.global_models = global_models
+        self.backtests = backtests
+        self.models = ModelCache(
+            max_entries=int(os.environ.get("ML_MODEL_CACHE_SIZE", 256)),
+            ttl_seconds=float(os.environ.get("ML_MODEL_CACHE_TTL", 900)),
+            max_bytes=int(float(os.environ.get("ML_MODEL_CACHE_MAX_MB", 512)) * 1024 * 1024)
+        )
+        self.scalers = {}
+        # (product_id, seasonality flags) -> Stan init from the product's last Prophet fit
+        self.prophet_inits: "OrderedDict[Tuple[Any, ...], Dict[str, Any]]" = OrderedDict()
+        self._inits_lock = threading.Lock()
+        
+    @timed_stage("prepare_data")
+    def prepare_data(self, historical_sales: SalesInput) -> pd.DataFrame:
+        """Convert historical sales (records or columns) to DataFrame"""
+        if not historical_sales:
+            # Mock data for demo: seeded, ending today, so repeat requests get the same forecast
+            rng = np.random.default_rng(MOCK_DATA_SEED)
+            dates = pd.date_range(end=pd.Timestamp.now().normalize(), periods=90, freq='D')
+            data = {
+                'date': dates,
+                'quantity': rng.integers(5, 50, 90).tolist(),
+                'revenue': rng.uniform(100, 1000, 90).tolist()
+            }
+            return pd.DataFrame(data)
+        
+        if isinstance(historical_sales, ColumnarSales):
+            historical_sales = SalesColumns.from_model(historical_sales)
+        if isinstance(historical_sales, SalesColumns):
+            df = historical_sales.to_frame()
+            return df if df['date'].is_monotonic_increasing else df.sort_values('date', kind='stable')
+        
+        df = pd.DataFrame(historical_sales)
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date')
+        return df
+    
+    @timed_stage("features")
+    def extract_features(self, df: pd.DataFrame,
+                         extra_features: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Extract time-based features for ML models"""
+        return build_calendar_features(df['date'], extra_features)
+    
+    def seasonal_features(self, product_id: Optional[str], dates: Any) -> Dict[str, np.ndarray]:
+        """Seasonality-table factor as an extra feature, when the table knows the product"""
+        if self.seasonality is None or product_id is None or not self.seasonality.has(product_id):
+            return {}
+        return {'seasonal_factor': self.seasonality.factors(product_id, dates)}
+    
+    def seasonal_fingerprint(self, product_id: Optional[str]) -> str:
+        """Version of the seasonality-table feature seasonal_features gives a product"""
+        if self.seasonality is None or product_id is None or not self.seasonality.has(product_id):
+            return ''
+        return self.seasonality.fingerprint(product_id)
+    
+    def fit_prophet(self, df: pd.DataFrame, init: Optional[Dict[str, Any]] = None,
+                    product_id: Optional[str] = None) -> Any:
+        """Fit a Prophet model on the sales history, optionally warm-started from init
+        
+        In tuned mode, a product's previous fit seeds the optimizer when no
+        init is given. An init whose shape no longer matches (e.g. fewer
+        changepoints) falls back to a cold fit.
+        """
+        # Prepare data for Prophet
+        prophet_df = df.rename(columns={'date': 'ds', 'quantity': 'y'})
+        
+        if PROPHET_TUNED:
+            flags = prophet_seasonality(prophet_df['ds'])
+            options = {**flags, 'uncertainty_samples': PROPHET_UNCERTAINTY_SAMPLES, 'mcmc_samples': 0}
+            if PROPHET_STAN_BACKEND:
+                options['stan_backend'] = PROPHET_STAN_BACKEND
+            init_key = (product_id, *flags.values())
+            if init is None and product_id is not None:
+                with self._inits_lock:
+                    init = self.prophet_inits.get(init_key)
+        else:
+            options = {'daily_seasonality': True, 'weekly_seasonality': True, 'yearly_seasonality': True}
+        
+        model = _prophet.Prophet(interval_width=0.95, **options)
+        if init is not None:
+            try:
+                model.fit(prophet_df, init=init)
+            except Exception:
+                model = _prophet.Prophet(interval_width=0.95, **options)
+                model.fit(prophet_df)
+        else:
+            model.fit(prophet_df)
+        
+        if PROPHET_TUNED and product_id is not None:
+            with self._inits_lock:
+                self.prophet_inits[init_key] = prophet_warm_start(model)
+                self.prophet_inits.move_to_end(init_key)
+                while len(self.prophet_inits) > PROPHET_INIT_CACHE_SIZE:
+                    self.prophet_inits.popitem(last=False)
+        return model
+    
+    def forecast_prophet(self, df: pd.DataFrame, days: int, model: Any = None,
+                         quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+        """Prophet-based forecasting
+        
+        Quantiles treat Prophet's interval as Gaussian around yhat.
+        """
+        if not PROPHET_AVAILABLE:
+            return self.forecast_statistical(df, days, quantiles=quantiles)
+        
+        if model is None:
+            model = self.fit_prophet(df)
+        
+        # Only the future rows; predicting (and sampling) the history is wasted work
+        future = model.make_future_dataframe(periods=days, include_history=False)
+        forecast = model.predict(future)
+        
+        yhat = forecast['yhat'].to_numpy()
+        if 'yhat_lower' in forecast:
+            lower, upper = forecast['yhat_lower'].to_numpy(), forecast['yhat_upper'].to_numpy()
+            sigma = (upper - lower) / (2 * stats.norm.ppf(0.5 + model.interval_width / 2))
+        else:
+            # uncertainty_samples=0: observation noise only
+            sigma = np.full(days, float(model.params['sigma_obs'][0][0]) * model.y_scale)
+            lower, upper = yhat - 1.96 * sigma, yhat + 1.96 * sigma
+        
+        distribution = {}
+        if quantiles:
+            daily, cumulative = normal_quantiles(yhat, sigma, quantiles)
+            distribution = {'levels': quantiles, 'quantiles': daily, 'cumulative': cumulative}
+        return {
+            'forecast': ForecastArrays.from_values(forecast['ds'].iloc[0], yhat, lower, upper, **distribution),
+            'seasonality': {
+                'weekly_pattern': 'weekly' in model.seasonalities,
+                'yearly_pattern': 'yearly' in model.seasonalities
+            }
+        }
+    
+    def fit_statistical(self, df: pd.DataFrame) -> Dict[str, float]:
+        """Fit the linear trend used by the statistical forecaster"""
+        quantities = df['quantity'].values
+        if len(quantities) < 2:
+            # No trend in a single day (linregress would give NaN); flat at that day, as the batch path does
+            return {'slope': 0.0, 'intercept': float(np.mean(quantities))}
+        x = np.arange(len(quantities))
+        slope, intercept, _, _, _ = stats.linregress(x, quantities)
+        return {'slope': float(slope), 'intercept': float(intercept)}
+    
+    def forecast_statistical(self, df: pd.DataFrame, days: int, model: Optional[Dict[str, float]] = None,
+                             quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+        """Statistical fallback when Prophet not available
+        
+        Quantiles come from a residual bootstrap of the trend (trend_quantiles).
+        """
+        # Calculate trend
+        if model is None:
+            model = self.fit_statistical(df)
+        return self.project_statistical(model, len(df), df['date'].max(), days,
+                                        df['quantity'].to_numpy(dtype=np.float64) if quantiles else None, quantiles)
+    
+    def project_statistical(self, model: Dict[str, float], n: int, last_date: pd.Timestamp, days: int,
+                            values: Optional[np.ndarray] = None, quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+        """Project a fitted trend over the next days of a series of length n
+        
+        Quantiles need the n values the trend was fitted on.
+        """
+        slope, intercept = np.array([model['slope']]), np.array([model['intercept']])
+        forecast = project_trend(slope, intercept, np.array([n]), np.array([np.datetime64(last_date, 'D')]), days)
+        if quantiles:
+            forecast.levels = tuple(quantiles)
+            forecast.quantiles, forecast.cumulative = trend_quantiles(
+                values[None, :], slope, intercept, forecast.predicted, quantiles
+            )
+        return forecast.result(0)
+    
+    def fit_random_forest(self, df: pd.DataFrame, product_id: Optional[str] = None) -> Any:
+        """Fit a Random Forest on calendar (and, if known, seasonality-table) features"""
+        features = self.extract_features(df, self.seasonal_features(product_id, df['date']))
+        target = df['quantity'].values
+        
+        model = sk_ensemble.RandomForestRegressor(n_estimators=100, random_state=42)
+        model.fit(features, target)
+        return model
+    
+    def forecast_random_forest(self, df: pd.DataFrame, days: int, model: Any = None,
+                               product_id: Optional[str] = None, quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+        """Random Forest-based forecasting"""
+        target = df['quantity'].values
+        
+        # Train model
+        if model is None:
+            model = self.fit_random_forest(df, product_id)
+        return self.project_random_forest(model, df['date'].max(), float(np.std(target)), days, product_id,
+                                          quantiles)
+    
+    def project_random_forest(self, model: Any, base_date: pd.Timestamp, std: float, days: int,
+                              product_id: Optional[str] = None, quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+        """Predict the days after base_date with a fitted forest
+        
+        Quantiles are taken across the individual trees' predictions, each
+        tree giving one demand path over the horizon.
+        """
+        # Generate future features
+        dates = future_dates(base_date, days)
+        extra = {}
+        if model.n_features_in_ > len(CALENDAR_FEATURES):
+            # Trained with the seasonal factor; all ones if the table no longer knows the product
+            extra = self.seasonal_features(product_id, dates) or {'seasonal_factor': np.ones(days)}
+        future_features = build_calendar_features(dates, extra)
+        
+        predictions = model.predict(future_features)
+        
+        distribution = {}
+        if quantiles:
+            # Trees read float32; converting once lets every tree skip its own input check
+            tree_features = np.ascontiguousarray(future_features, dtype=np.float32)
+            paths = np.stack([tree.predict(tree_features, check_input=False) for tree in model.estimators_])
+            daily, cumulative = path_quantiles(paths, quantiles)
+            distribution = {'levels': quantiles, 'quantiles': daily, 'cumulative': cumulative}
+        return {
+            'forecast': ForecastArrays.from_values(
+                dates[0], predictions, predictions - 1.96 * std, predictions + 1.96 * std, **distribution
+            ),
+            'seasonality': {'weekly_pattern': True}
+        }
+    
+    def resolve_model_type(self, model_type: str) -> str:
+        """Model that will actually serve a requested model_type"""
+        if model_type == "prophet" and PROPHET_AVAILABLE:
+            return "prophet"
+        elif model_type == "random_forest":
+            return "random_forest"
+        elif model_type == "global" and self.global_models is not None and self.global_models.load() is not None:
+            return "global"
+        return "statistical"
+    
+    def get_model(self, df: pd.DataFrame, model_used: str, product_id: Optional[str] = None) -> Any:
+        """Fitted model for the history, reused from the model cache when possible"""
+        fit = {
+            'prophet': lambda frame: self.fit_prophet(frame, product_id=product_id),
+            'random_forest': lambda frame: self.fit_random_forest(frame, product_id),
+            'statistical': self.fit_statistical,
+        }[model_used]
+        
+        def fit_timed() -> Any:
+            start = time.perf_counter()
+            with timed_stage("fit", model_used):
+                model = fit(df)
+            model_costs.record(model_used, time.perf_counter() - start)
+            return model
+        
+        if product_id is None:
+            return fit_timed()
+        
+        key = (product_id, model_used, data_fingerprint(df))
+        if model_used == 'random_forest':
+            # The forest is trained on the seasonality-table factor too; a refreshed table needs a refit
+            key += (self.seasonal_fingerprint(product_id),)
+        model = self.models.get(key)
+        if model is None:
+            model = fit_timed()
+            self.models.put(key, model)
+        return model
+    
+    def model_scores(self, product_id: Optional[str]) -> Dict[str, float]:
+        """Known sMAPE per model for a product, from its backtests
+        
+        The global model is scored like the others, by backtesting it on the
+        product; its catalog-wide validation WAPE is a different metric.
+        """
+        cached = self.backtests.get(product_id) if self.backtests is not None and product_id else None
+        if cached is None:
+            return {}
+        return {model: metrics['smape'] for model, metrics in cached.get('metrics', {}).items()}
+    
+    def select_model(self, df: pd.DataFrame, product_id: Optional[str] = None) -> Dict[str, Any]:
+        """Routing decision of model_type "auto" for one series"""
+        values, _ = pack_series([df])
+        traits = {name: value[0] for name, value in series_traits(values).items()}
+        global_trained = self.global_models is not None and self.global_models.load() is not None
+        return choose_model(traits, self.model_scores(product_id), global_trained)
+    
+    def predict(self, historical_sales: SalesInput, days: int = 30, model_type: str = "prophet",
+                product_id: Optional[str] = None, quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+        """Main prediction method
+        
+        When product_id is given the fitted model is cached under
+        (product_id, model type, sales fingerprint), plus the product's
+        seasonality-table version for random forests, so a repeat request for
+        the same history only runs prediction. model_type "auto" picks the
+        model with select_model and reports the choice as model_selection.
+        quantiles are the (sorted) levels the forecast's quantiles cover.
+        model_used is the model that actually served the forecast (e.g.
+        "statistical" for an untrained global model).
+        """
+        df = self.prepare_data(historical_sales)
+        if not historical_sales:
+            # Demo data is not the product's history; keep it out of the product's models
+            product_id = None
+        
+        selection = None
+        if model_type == "auto":
+            selection = self.select_model(df, product_id)
+            model_type = selection['model']
+        
+        model_used = self.resolve_model_type(model_type)
+        if model_used == "global":
+            start = time.perf_counter()
+            values, dates = pack_series([df])
+            result = self.global_models.load().forecast(values, dates, days, quantiles).result(0)
+            model_costs.record(model_used, time.perf_counter() - start)
+        else:
+            model = self.get_model(df, model_used, product_id)
+            with timed_stage("predict"):
+                if model_used == "prophet":
+                    result = self.forecast_prophet(df, days, model, quantiles)
+                elif model_used == "random_forest":
+                    result = self.forecast_random_forest(df, days, model, product_id, quantiles)
+                else:
+                    result = self.forecast_statistical(df, days, model, quantiles)
+        
+        result['model_used'] = model_used
+        if selection is not None:
+            result['model_selection'] = selection
+        return result
+
+
+class PriceOptimizer:
+    """Price optimization based on elasticity"""
+    
+    def optimize_price(self, current_price: float, cost_price: float, 
+                      historical_sales: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Calculate optimal price point"""
+        
+        if not historical_sales:
+            # Default recommendation for demo
+            return {
+                'optimal_price': round(current_price * 1.05, 2),
+                'price_elasticity': -1.2,
+                'predicted_demand': {'current': 100, 'optimal': 95},
+                'revenue_projection': {'current': 10000, 'optimal': 10500},
+                'confidence': 0.7
+            }
+        
+        # Extract price and quantity data
+        prices = np.array([s.get('price', current_price) for s in historical_sales])
+        quantities = np.array([s.get('quantity', 10) for s in historical_sales])
         
         if len(prices) < 3 or np.std(prices) < 0.01:
             # Not enough price variation, use default
@@ -359,99 +2176,2210 @@ class PriceOptimizer:
             },
             'confidence': round(confidence, 2)
         }
+    
+    def optimize_prices(self, products: List[Tuple[float, float, SalesInput]]) -> List[Dict[str, Any]]:
+        """Optimal prices for many products at once
+        
+        products holds (current_price, cost_price, historical_sales) tuples.
+        All log-log elasticities are fitted together on a NaN-padded
+        products x observations matrix. Demand a * p^e makes revenue
+        a * p^(e+1) monotonic, so the optimum is the cheaper end of the
+        search range when e < -1 and the dearer end when e > -1; only rows
+        where that does not hold (e == -1, a <= 0, non-finite fits) fall back
+        to a vectorized 100-point grid. Results match optimize_price, except
+        that days with zero quantity are left out of the log-log fit.
+        """
+        n = len(products)
+        if n == 0:
+            return []
+        
+        current = np.array([p[0] for p in products], dtype=np.float64)
+        cost = np.array([p[1] for p in products], dtype=np.float64)
+        prices, quantities, lengths = self._price_matrix(products)
+        observed = ~np.isnan(prices)
+        count = np.maximum(lengths, 1)
+        mean_p = np.where(observed, prices, 0.0).sum(axis=1) / count
+        mean_q = np.where(observed, quantities, 0.0).sum(axis=1) / count
+        
+        # Rows that get the demo / low-variation defaults
+        std = np.sqrt(np.where(observed, (prices - mean_p[:, None]) ** 2, 0.0).sum(axis=1) / count)
+        empty = lengths == 0
+        flat = ~empty & ((lengths < 3) | (std < 0.01))
+        fitted = ~empty & ~flat
+        
+        # log-log regression for elasticity, all rows at once
+        usable = observed & (prices > 0) & (quantities > 0)
+        x = np.log(np.where(usable, prices, 1.0))
+        y = np.log(np.where(usable, quantities, 1.0))
+        k = usable.sum(axis=1)
+        sx, sy = (x * usable).sum(axis=1), (y * usable).sum(axis=1)
+        sxx, sxy = (x * x * usable).sum(axis=1), (x * y * usable).sum(axis=1)
+        denominator = k * sxx - sx * sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (k * sxy - sx * sy) / denominator
+        elasticity = np.where((k >= 3) & (denominator > 1e-12) & np.isfinite(slope), slope, -1.2)
+        
+        # Demand = a * Price^elasticity, anchored at the mean observation
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            a = np.where(elasticity != 0, mean_q / mean_p ** elasticity, 100.0)
+        
+        low, high = cost * 1.1, current * 2
+        optimal = np.where(elasticity + 1 < 0, np.minimum(low, high), np.maximum(low, high))
+        needs_grid = fitted & ((np.abs(elasticity + 1) < 1e-9) | ~np.isfinite(a) | (a <= 0))
+        if needs_grid.any():
+            grid = np.linspace(low[needs_grid], high[needs_grid], 100, axis=1)
+            e = elasticity[needs_grid, None]
+            with np.errstate(invalid='ignore', over='ignore'):
+                revenues = grid * (a[needs_grid, None] * grid ** e)
+            optimal[needs_grid] = grid[np.arange(grid.shape[0]), np.nanargmax(np.nan_to_num(revenues, nan=-np.inf), axis=1)]
+        
+        with np.errstate(invalid='ignore', over='ignore'):
+            demand_optimal = a * optimal ** elasticity
+            demand_current = a * current ** elasticity
+        
+        # Confidence based on data quality
+        confidence = np.minimum(np.minimum(0.95, 0.5 + 0.1 * lengths) + 0.1, 0.95)
+        
+        results = []
+        for i in range(n):
+            if empty[i]:
+                results.append({
+                    'optimal_price': round(current[i] * 1.05, 2),
+                    'price_elasticity': -1.2,
+                    'predicted_demand': {'current': 100, 'optimal': 95},
+                    'revenue_projection': {'current': 10000, 'optimal': 10500},
+                    'confidence': 0.7
+                })
+            elif flat[i]:
+                results.append({
+                    'optimal_price': round(current[i] * 1.05, 2),
+                    'price_elasticity': -1.2,
+                    'predicted_demand': {'current': 100, 'optimal': 95},
+                    'revenue_projection': {'current': current[i] * 100, 'optimal': current[i] * 1.05 * 95},
+                    'confidence': 0.6
+                })
+            else:
+                results.append({
+                    'optimal_price': round(float(optimal[i]), 2),
+                    'price_elasticity': round(float(elasticity[i]), 2),
+                    'predicted_demand': {
+                        'current': round(float(demand_current[i])),
+                        'optimal': round(float(demand_optimal[i]))
+                    },
+                    'revenue_projection': {
+                        'current': round(float(current[i] * demand_current[i]), 2),
+                        'optimal': round(float(optimal[i] * demand_optimal[i]), 2)
+                    },
+                    'confidence': round(float(confidence[i]), 2)
+                })
+        return results
+    
+    def _price_matrix(self, products: List[Tuple[float, float, SalesInput]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """NaN-padded price and quantity matrices plus per-product observation counts"""
+        price_parts, quantity_parts = [], []
+        for current_price, _, historical_sales in products:
+            if isinstance(historical_sales, (ColumnarSales, SalesColumns)):
+                quantity = np.asarray(historical_sales.quantities, dtype=np.float64)
+                price = (np.full(len(quantity), current_price) if historical_sales.prices is None
+                         else np.asarray(historical_sales.prices, dtype=np.float64))
+            else:
+                price = [s.get('price', current_price) for s in historical_sales]
+                quantity = [s.get('quantity', 10) for s in historical_sales]
+            price_parts.append(price)
+            quantity_parts.append(quantity)
+        
+        lengths = np.array([len(p) for p in price_parts], dtype=np.int64)
+        width = int(lengths.max()) if len(lengths) else 0
+        rows = np.repeat(np.arange(len(products)), lengths)
+        cols = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        
+        prices = np.full((len(products), width), np.nan)
+        quantities = np.full((len(products), width), np.nan)
+        if len(rows):
+            prices[rows, cols] = np.concatenate([np.asarray(p, dtype=np.float64) for p in price_parts])
+            quantities[rows, cols] = np.concatenate([np.asarray(q, dtype=np.float64) for q in quantity_parts])
+        return prices, quantities, lengths
+
+
+# Ordered RFM segment rules; the first matching rule wins. A rule matches an
+# exact list of "RFM" score codes, or every score listed under R, F and M.
+DEFAULT_SEGMENT_RULES: List[Dict[str, Any]] = [
+    {'name': 'Champions', 'codes': ['555', '554', '545', '455']},
+    {'name': 'Loyal Customers', 'F': [4, 5], 'M': [4, 5]},
+    {'name': 'Potential Loyalists', 'R': [4, 5], 'F': [3, 4]},
+    {'name': 'At Risk', 'R': [1, 2], 'F': [3, 4, 5]},
+    {'name': 'Hibernating', 'R': [1, 2], 'F': [1, 2]},
+]
+DEFAULT_SEGMENT = 'Needs Attention'
+
+SEGMENT_CHARACTERISTICS = {
+    'Champions': 'Best customers, highest value, frequent buyers',
+    'Loyal Customers': 'Regular buyers, good revenue',
+    'Potential Loyalists': 'Recent customers with potential',
+    'At Risk': 'Previously active, declining engagement',
+    'Hibernating': 'Inactive, may need win-back campaigns'
+}
+
+SEGMENT_RECOMMENDATIONS = {
+    'Champions': ['VIP rewards program', 'Early access to new products', 'Referral bonuses'],
+    'Loyal Customers': ['Loyalty rewards', 'Personalized recommendations', 'Exclusive offers'],
+    'Potential Loyalists': ['Engagement campaigns', 'First-purchase incentives', 'Product bundles'],
+    'At Risk': ['Win-back emails', 'Special discounts', 'Survey for feedback'],
+    'Hibernating': ['Reactivation campaigns', 'Deep discounts', 'Product updates']
+}
+
+# Lookup index used for customers without a full set of scores
+UNSCORED = 125
+
+def build_segment_lut(rules: List[Dict[str, Any]], default: str = DEFAULT_SEGMENT) -> Tuple[np.ndarray, List[str]]:
+    """Compile segment rules into a lookup table over every R/F/M score triple
+    
+    Returns (lut, names): lut[(R-1)*25 + (F-1)*5 + (M-1)] is the index into
+    names of that triple's segment, and lut[UNSCORED] is the default.
+    """
+    names = [rule['name'] for rule in rules] + [default]
+    lut = np.full(UNSCORED + 1, len(rules), dtype=np.int16)
+    
+    triples = np.arange(UNSCORED)
+    r, f, m = triples // 25 + 1, triples // 5 % 5 + 1, triples % 5 + 1
+    codes = r * 100 + f * 10 + m
+    unassigned = np.ones(UNSCORED, dtype=bool)
+    
+    for index, rule in enumerate(rules):
+        if not any(rule.get(key) for key in ('codes', 'R', 'F', 'M')):
+            raise ValueError(f"Segment rule '{rule['name']}' has no conditions")
+        match = np.ones(UNSCORED, dtype=bool)
+        if rule.get('codes'):
+            match &= np.isin(codes, [int(code) for code in rule['codes']])
+        for key, scores in (('R', r), ('F', f), ('M', m)):
+            if rule.get(key):
+                match &= np.isin(scores, rule[key])
+        lut[:UNSCORED][match & unassigned] = index
+        unassigned &= ~match
+    
+    return lut, names
+
+def rfm_scores(recency: pd.Series, frequency: pd.Series, monetary: pd.Series) -> Tuple[np.ndarray, ...]:
+    """1-5 quintile scores (0 where a score cannot be computed)
+    
+    Recency is scored on its values (recent = 5) and collapses to fewer
+    quintiles when values repeat; frequency and monetary are scored on
+    first-occurrence ranks, so ties are split as in pd.qcut on the ranks.
+    """
+    r_codes = pd.qcut(recency, q=5, labels=False, duplicates='drop').to_numpy()
+    f_codes = pd.qcut(frequency.rank(method='first'), q=5, labels=False, duplicates='drop').to_numpy()
+    m_codes = pd.qcut(monetary.rank(method='first'), q=5, labels=False, duplicates='drop').to_numpy()
+    
+    r_score = np.where(np.isnan(r_codes), 0, 5 - np.nan_to_num(r_codes)).astype(np.int16)
+    f_score = np.where(np.isnan(f_codes), 0, np.nan_to_num(f_codes) + 1).astype(np.int16)
+    m_score = np.where(np.isnan(m_codes), 0, np.nan_to_num(m_codes) + 1).astype(np.int16)
+    return r_score, f_score, m_score
+
+def assign_segments(r_score: np.ndarray, f_score: np.ndarray, m_score: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """Segment index per customer via one lookup-table gather"""
+    scored = (r_score > 0) & (f_score > 0) & (m_score > 0)
+    index = np.where(scored, (r_score - 1) * 25 + (f_score - 1) * 5 + (m_score - 1), UNSCORED)
+    return lut[index]
+
+class CustomerSegmenter:
+    """Customer segmentation using RFM analysis"""
+    
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None):
+        self.rules = rules or DEFAULT_SEGMENT_RULES
+        self.lut, self.segment_names = build_segment_lut(self.rules)
+    
+    def segment(self, customers: List[Dict[str, Any]],
+                rules: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Segment customers into groups, optionally with custom segment rules"""
+        
+        if not customers:
+            return {
+                'segments': [],
+                'segment_characteristics': {},
+                'marketing_recommendations': {}
+            }
+        
+        # RFM columns
+        df = pd.DataFrame({
+            'customer_id': [customer.get('id', 'unknown') for customer in customers],
+            'recency': [customer.get('days_since_last_order', 365) for customer in customers],
+            'frequency': [customer.get('order_count', 0) for customer in customers],
+            'monetary': [customer.get('total_spent', 0) for customer in customers]
+        })
+        
+        # Calculate scores (1-5) and map them to segments through the lookup table
+        lut, names = (self.lut, self.segment_names) if rules is None else build_segment_lut(rules)
+        r_score, f_score, m_score = rfm_scores(df['recency'], df['frequency'], df['monetary'])
+        df['segment_code'] = assign_segments(r_score, f_score, m_score, lut)
+        
+        # Build response
+        segments = df.groupby('segment_code').agg({
+            'customer_id': 'count',
+            'recency': 'mean',
+            'frequency': 'mean',
+            'monetary': 'mean'
+        }).reset_index()
+        segments['segment'] = np.asarray(names, dtype=object)[segments['segment_code'].to_numpy()]
+        segments = segments.sort_values('segment', kind='stable')
+        
+        segments_list = []
+        for _, row in segments.iterrows():
+            segments_list.append({
+                'name': row['segment'],
+                'count': int(row['customer_id']),
+                'avg_recency_days': round(float(row['recency']), 1),
+                'avg_orders': round(float(row['frequency']), 1),
+                'avg_spent': round(float(row['monetary']), 2)
+            })
+        
+        return {
+            'segments': segments_list,
+            'segment_characteristics': SEGMENT_CHARACTERISTICS,
+            'marketing_recommendations': SEGMENT_RECOMMENDATIONS
+        }
+
+
+# ============================================================================
+# Streaming Segmentation
+# ============================================================================
+
+DATA_DIR = os.environ.get("ML_DATA_DIR")  # local customer files allowed for /file mode
+SEGMENT_CHUNK_SIZE = int(os.environ.get("ML_SEGMENT_CHUNK_SIZE", 50_000))
+
+# Golden-ratio sequence used to break ties between equal values (see StreamingSegmenter)
+_TIE_BREAK_STEP = 0.6180339887498949
+
+class QuantileSketch:
+    """Mergeable KLL quantile sketch over float values
+    
+    Keeps O(k log(n/k)) items no matter how many values are added; rank
+    error is roughly 1.7 / k. Compaction offsets come from a seeded RNG, so
+    the same input in the same order always gives the same sketch.
+    """
+    
+    def __init__(self, k: int = 400, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+    
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+    
+    def update(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+    
+    def merge(self, other: "QuantileSketch") -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self._compress()
+    
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                even = items[:len(items) - len(keep)]
+                promoted = even[int(self._rng.integers(2))::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+    
+    def quantiles(self, qs: List[float]) -> np.ndarray:
+        items = np.concatenate(self.levels)
+        if not len(items):
+            return np.full(len(qs), np.nan)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cumulative = items[order], np.cumsum(weights[order])
+        targets = np.asarray(qs) * cumulative[-1]
+        return items[np.minimum(np.searchsorted(cumulative, targets, side='left'), len(items) - 1)]
+
+# Customer frame column -> (customer record field, default when missing)
+CUSTOMER_FIELDS = {
+    'recency': ('days_since_last_order', 365),
+    'frequency': ('order_count', 0),
+    'monetary': ('total_spent', 0),
+    'tenure': ('days_since_first_order', None),  # defaults to recency
+    'items_per_order': ('avg_items_per_order', 1),
+    'return_rate': ('return_rate', 0)
+}
+
+def customer_frame(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Map raw customer columns (JSON field names) to the numeric customer frame"""
+    frame = pd.DataFrame({
+        'customer_id': chunk['id'].astype(str) if 'id' in chunk else 'unknown'
+    }, index=chunk.index)
+    for column, (field, default) in CUSTOMER_FIELDS.items():
+        values = pd.to_numeric(chunk[field], errors='coerce') if field in chunk else np.nan
+        frame[column] = values if default is None else pd.Series(values, index=chunk.index, dtype=float).fillna(default)
+    frame['tenure'] = frame['tenure'].fillna(frame['recency'])
+    return frame.reset_index(drop=True)
+
+def _rfm_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    return customer_frame(pd.DataFrame.from_records(records))
+
+def iter_ndjson_customers(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Customer chunks from a file with one customer JSON object per line"""
+    records: List[Dict[str, Any]] = []
+    with open(path, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            records.append(json.loads(line))
+            if len(records) >= chunk_size:
+                yield _rfm_frame(records)
+                records = []
+    if records:
+        yield _rfm_frame(records)
+
+def iter_table_customers(path: str, file_format: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Customer chunks from a local CSV, Parquet or NDJSON file"""
+    columns = ['id'] + [field for field, _ in CUSTOMER_FIELDS.values()]
+    if file_format == 'csv':
+        for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=lambda c: c in columns):
+            yield customer_frame(chunk)
+    elif file_format == 'parquet':
+        if importlib.util.find_spec("pyarrow") is None:
+            raise PayloadUnsupported("Parquet input needs the pyarrow package")
+        import pyarrow.parquet as pq
+        
+        parquet = pq.ParquetFile(path)
+        present = [c for c in columns if c in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=present):
+            yield customer_frame(batch.to_pandas())
+    elif file_format == 'ndjson':
+        yield from iter_ndjson_customers(path, chunk_size)
+    else:
+        raise PayloadUnsupported(f"Unsupported customer file format '{file_format}'")
+
+class StreamingSegmenter:
+    """Two-pass RFM segmentation over customer chunks in bounded memory
+    
+    Pass 1 feeds recency, frequency and monetary into quantile sketches to
+    get approximate quintile edges; pass 2 scores and segments each chunk
+    against those edges and only keeps per-segment sums. Frequency and
+    monetary ties are broken by a tiny per-row jitter (deterministic in row
+    order), approximating the rank(method='first') scoring of the
+    in-memory segmenter.
+    """
+    
+    QUINTILES = [0.2, 0.4, 0.6, 0.8]
+    
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None, sketch_k: int = 400):
+        self.lut, self.segment_names = build_segment_lut(rules or DEFAULT_SEGMENT_RULES)
+        self.sketch_k = sketch_k
+    
+    @staticmethod
+    def _tie_broken(values: np.ndarray, offset: int) -> np.ndarray:
+        jitter = (np.arange(offset, offset + len(values)) * _TIE_BREAK_STEP) % 1.0
+        return values + jitter * 1e-9 * np.maximum(1.0, np.abs(values))
+    
+    def segment(self, chunks: Callable[[], Iterator[pd.DataFrame]],
+                assignments_path: Optional[str] = None) -> Dict[str, Any]:
+        """Segment every customer produced by chunks() (called once per pass)
+        
+        If assignments_path is given, customer_id/segment rows are appended
+        to that CSV chunk by chunk.
+        """
+        # Pass 1: approximate quintile edges
+        sketches = {name: QuantileSketch(self.sketch_k) for name in ('recency', 'frequency', 'monetary')}
+        offset = 0
+        for chunk in chunks():
+            sketches['recency'].update(chunk['recency'].to_numpy(dtype=np.float64))
+            for name in ('frequency', 'monetary'):
+                sketches[name].update(self._tie_broken(chunk[name].to_numpy(dtype=np.float64), offset))
+            offset += len(chunk)
+        
+        if offset == 0:
+            return {'segments': [], 'segment_characteristics': {}, 'marketing_recommendations': {}, 'total_customers': 0}
+        
+        edges = {name: np.unique(sketch.quantiles(self.QUINTILES)) for name, sketch in sketches.items()}
+        
+        # Pass 2: score, segment and aggregate chunk by chunk
+        n_segments = len(self.segment_names)
+        counts = np.zeros(n_segments, dtype=np.int64)
+        sums = {name: np.zeros(n_segments) for name in ('recency', 'frequency', 'monetary')}
+        offset = 0
+        
+        for chunk in chunks():
+            recency = chunk['recency'].to_numpy(dtype=np.float64)
+            frequency = chunk['frequency'].to_numpy(dtype=np.float64)
+            monetary = chunk['monetary'].to_numpy(dtype=np.float64)
+            
+            r_score = (5 - np.searchsorted(edges['recency'], recency, side='left')).astype(np.int16)
+            f_score = (np.searchsorted(edges['frequency'], self._tie_broken(frequency, offset), side='left') + 1).astype(np.int16)
+            m_score = (np.searchsorted(edges['monetary'], self._tie_broken(monetary, offset), side='left') + 1).astype(np.int16)
+            codes = assign_segments(r_score, f_score, m_score, self.lut)
+            
+            counts += np.bincount(codes, minlength=n_segments)
+            for name, values in (('recency', recency), ('frequency', frequency), ('monetary', monetary)):
+                sums[name] += np.bincount(codes, weights=values, minlength=n_segments)
+            
+            if assignments_path is not None:
+                pd.DataFrame({
+                    'customer_id': chunk['customer_id'].to_numpy(),
+                    'segment': np.asarray(self.segment_names, dtype=object)[codes]
+                }).to_csv(assignments_path, mode='w' if offset == 0 else 'a', header=offset == 0, index=False)
+            offset += len(chunk)
+        
+        segments_list = [
+            {
+                'name': name,
+                'count': int(counts[code]),
+                'avg_recency_days': round(float(sums['recency'][code] / counts[code]), 1),
+                'avg_orders': round(float(sums['frequency'][code] / counts[code]), 1),
+                'avg_spent': round(float(sums['monetary'][code] / counts[code]), 2)
+            }
+            for code, name in sorted(enumerate(self.segment_names), key=lambda item: item[1])
+            if counts[code]
+        ]
+        
+        return {
+            'segments': segments_list,
+            'segment_characteristics': SEGMENT_CHARACTERISTICS,
+            'marketing_recommendations': SEGMENT_RECOMMENDATIONS,
+            'total_customers': offset,
+            'quantile_edges': {name: [round(float(e), 4) for e in values] for name, values in edges.items()}
+        }
+
+def resolve_data_path(path: str) -> str:
+    """Resolve a client-supplied path, which must stay inside ML_DATA_DIR"""
+    if not DATA_DIR:
+        raise PermissionError("File input is disabled; set ML_DATA_DIR to enable it")
+    root = os.path.realpath(DATA_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise PermissionError(f"Path '{path}' is outside ML_DATA_DIR")
+    return resolved
+
+def customer_file_format(path: str, file_format: Optional[str] = None) -> str:
+    """Explicit format, or the one implied by the file extension"""
+    file_format = (file_format or os.path.splitext(path)[1].lstrip('.')).lower()
+    return {'jsonl': 'ndjson', 'pq': 'parquet'}.get(file_format, file_format)
+
+# ============================================================================
+# Behavioral Clustering
+# ============================================================================
+
+CLUSTER_COUNT = int(os.environ.get("ML_CLUSTER_COUNT", 6))
+CLUSTER_BATCH_SIZE = int(os.environ.get("ML_CLUSTER_BATCH_SIZE", 4096))
+
+CLUSTER_FEATURES = ['recency', 'frequency', 'monetary', 'avg_order_value',
+                    'tenure', 'items_per_order', 'return_rate']
+# Heavy-tailed features are clustered on a log1p scale
+_LOG_FEATURES = np.isin(CLUSTER_FEATURES, ['frequency', 'monetary', 'avg_order_value', 'items_per_order'])
+
+def behavior_matrix(frame: pd.DataFrame) -> np.ndarray:
+    """Clustering feature matrix (n_customers x CLUSTER_FEATURES) for a customer frame"""
+    frequency = frame['frequency'].to_numpy(dtype=np.float64)
+    monetary = frame['monetary'].to_numpy(dtype=np.float64)
+    X = np.column_stack([
+        frame['recency'].to_numpy(dtype=np.float64),
+        frequency,
+        monetary,
+        monetary / np.maximum(frequency, 1.0),
+        frame['tenure'].to_numpy(dtype=np.float64),
+        frame['items_per_order'].to_numpy(dtype=np.float64),
+        frame['return_rate'].to_numpy(dtype=np.float64)
+    ])
+    X[:, _LOG_FEATURES] = np.log1p(np.maximum(X[:, _LOG_FEATURES], 0.0))
+    return X
+
+@dataclass
+class ClusterModel:
+    """Fitted scaler and MiniBatchKMeans with stable cluster labels
+    
+    Labels are ordered by centroid spend at training time and kept through
+    later partial_fit updates, so "Cluster 1" stays the same group.
+    """
+    scaler: Any
+    kmeans: Any
+    order: np.ndarray  # kmeans center index -> label
+    n_samples: int
+    trained_at: str
+    updated_at: str
+    
+    def assign(self, X: np.ndarray) -> np.ndarray:
+        """Labels for a feature matrix; O(k) per customer, no refit"""
+        return self.order[self.kmeans.predict(self.scaler.transform(X))]
+    
+    def centroids(self) -> np.ndarray:
+        """Cluster centers in feature units, indexed by label"""
+        centers = self.scaler.inverse_transform(self.kmeans.cluster_centers_)
+        centers[:, _LOG_FEATURES] = np.expm1(centers[:, _LOG_FEATURES])
+        labeled = np.empty_like(centers)
+        labeled[self.order] = centers
+        return labeled
+    
+    def info(self) -> Dict[str, Any]:
+        return {
+            'n_clusters': int(self.kmeans.n_clusters),
+            'n_samples': self.n_samples,
+            'features': CLUSTER_FEATURES,
+            'trained_at': self.trained_at,
+            'updated_at': self.updated_at
+        }
+
+class ClusterModelStore:
+    """Pickled ClusterModel shared by workers, re-read when the file changes"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._cached: Optional[Tuple[ClusterModel, float]] = None
+        self.lock = threading.Lock()
+    
+    def load(self) -> Optional[ClusterModel]:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if self._cached is not None and self._cached[1] == mtime:
+            return self._cached[0]
+        with open(self.path, 'rb') as f:
+            model = pickle.load(f)
+        self._cached = (model, mtime)
+        return model
+    
+    def save(self, model: ClusterModel) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._cached = (model, os.path.getmtime(self.path))
+
+class CustomerClusterer:
+    """Behavioral customer clusters from a persisted MiniBatchKMeans model
+    
+    Training streams customer chunks twice or more (scaler, then k-means
+    epochs) in CLUSTER_BATCH_SIZE mini-batches, so memory is bounded by the
+    chunk size whatever the number of customers.
+    """
+    
+    def __init__(self, store: ClusterModelStore, n_clusters: int = CLUSTER_COUNT,
+                 batch_size: int = CLUSTER_BATCH_SIZE):
+        self.store = store
+        self.n_clusters = n_clusters
+        self.batch_size = batch_size
+    
+    def _batches(self, chunks: Callable[[], Iterator[pd.DataFrame]]) -> Iterator[np.ndarray]:
+        for chunk in chunks():
+            X = behavior_matrix(chunk)
+            for start in range(0, len(X), self.batch_size):
+                yield X[start:start + self.batch_size]
+    
+    def train(self, chunks: Callable[[], Iterator[pd.DataFrame]],
+              n_clusters: Optional[int] = None, epochs: int = 3) -> ClusterModel:
+        """Fit a new model over every customer produced by chunks() and persist it"""
+        n_clusters = n_clusters or self.n_clusters
+        scaler = sk_preprocessing.StandardScaler()
+        n_samples = 0
+        for X in self._batches(chunks):
+            scaler.partial_fit(X)
+            n_samples += len(X)
+        if n_samples < n_clusters:
+            raise ValueError(f"Need at least {n_clusters} customers to train {n_clusters} clusters")
+        
+        kmeans = sk_cluster.MiniBatchKMeans(
+            n_clusters=n_clusters, batch_size=self.batch_size, n_init=3, random_state=42
+        )
+        pending = np.empty((0, len(CLUSTER_FEATURES)))
+        for _ in range(epochs):
+            for X in self._batches(chunks):
+                if not hasattr(kmeans, 'cluster_centers_'):
+                    # The first partial_fit seeds the centers and needs >= k rows
+                    pending = np.vstack([pending, X])
+                    if len(pending) < max(n_clusters * 3, self.batch_size):
+                        continue
+                    X, pending = pending, pending[:0]
+                kmeans.partial_fit(scaler.transform(X))
+            if not hasattr(kmeans, 'cluster_centers_'):
+                kmeans.partial_fit(scaler.transform(pending))
+        
+        spend = scaler.inverse_transform(kmeans.cluster_centers_)[:, CLUSTER_FEATURES.index('monetary')]
+        order = np.empty(n_clusters, dtype=np.int64)
+        order[np.argsort(-spend)] = np.arange(n_clusters)
+        
+        now = datetime.now().isoformat()
+        model = ClusterModel(scaler, kmeans, order, n_samples, now, now)
+        with self.store.lock:
+            self.store.save(model)
+        return model
+    
+    def update(self, frame: pd.DataFrame) -> ClusterModel:
+        """partial_fit the stored model with new customer rows (scaler stays fixed)"""
+        with self.store.lock:
+            model = self.store.load()
+            if model is None:
+                raise LookupError("No cluster model trained yet")
+            X = model.scaler.transform(behavior_matrix(frame))
+            for start in range(0, len(X), self.batch_size):
+                model.kmeans.partial_fit(X[start:start + self.batch_size])
+            model.n_samples += len(X)
+            model.updated_at = datetime.now().isoformat()
+            self.store.save(model)
+        return model
+    
+    def segment(self, customers: List[Dict[str, Any]], n_clusters: Optional[int] = None,
+                retrain: bool = False, update_model: bool = False) -> Dict[str, Any]:
+        """Assign customers to behavioral clusters, training or updating the model first if asked"""
+        if not customers:
+            return {'segments': [], 'segment_characteristics': {}, 'marketing_recommendations': {}}
+        
+        frame = customer_frame(pd.DataFrame.from_records(customers))
+        model = None if retrain else self.store.load()
+        if model is None:
+            model = self.train(lambda: iter([frame]), n_clusters)
+        elif update_model:
+            model = self.update(frame)
+        
+        labels = model.assign(behavior_matrix(frame))
+        k = len(model.order)
+        counts = np.bincount(labels, minlength=k)
+        means = {
+            column: np.bincount(labels, weights=frame[column].to_numpy(dtype=np.float64), minlength=k) / np.maximum(counts, 1)
+            for column in ('recency', 'frequency', 'monetary')
+        }
+        
+        # Describe each cluster by the RFM segment most of its members fall into
+        r_score, f_score, m_score = rfm_scores(frame['recency'], frame['frequency'], frame['monetary'])
+        rfm_codes = assign_segments(r_score, f_score, m_score, segmenter.lut)
+        dominant = np.zeros((k, len(segmenter.segment_names)), dtype=np.int64)
+        np.add.at(dominant, (labels, rfm_codes), 1)
+        
+        centroids = model.centroids()
+        segments_list, characteristics, recommendations = [], {}, {}
+        for label in range(k):
+            name = f"Cluster {label + 1}"
+            rfm_segment = segmenter.segment_names[int(dominant[label].argmax())] if counts[label] else None
+            characteristics[name] = {
+                'centroid': {feature: round(float(value), 2) for feature, value in zip(CLUSTER_FEATURES, centroids[label])},
+                'dominant_rfm_segment': rfm_segment
+            }
+            recommendations[name] = SEGMENT_RECOMMENDATIONS.get(rfm_segment, [])
+            if counts[label]:
+                segments_list.append({
+                    'name': name,
+                    'count': int(counts[label]),
+                    'avg_recency_days': round(float(means['recency'][label]), 1),
+                    'avg_orders': round(float(means['frequency'][label]), 1),
+                    'avg_spent': round(float(means['monetary'][label]), 2)
+                })
+        
+        return {
+            'segments': segments_list,
+            'segment_characteristics': characteristics,
+            'marketing_recommendations': recommendations,
+            'model': model.info()
+        }
+
+# ============================================================================
+# Compute Executors
+# ============================================================================
+
+class ExecutorSaturated(Exception):
+    """Raised when an executor's queue is full"""
+    
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} executor is saturated, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+class ComputeExecutor:
+    """Bounded pool for CPU-heavy model work, kept off the asyncio event loop
+    
+    backend is "thread" or "process". Process workers run their own copy of
+    the module-level forecaster/optimizer/segmenter, so anything dispatched
+    must be a picklable module-level function. At most max_pending calls may
+    be queued or running; beyond that ExecutorSaturated is raised and the
+    request is answered with 503 + Retry-After instead of piling up. A call
+    keeps its slot until its pool jobs finish, even after its caller timed
+    out or disconnected, since a started job cannot be cancelled.
+    """
+    
+    def __init__(self, name: str, backend: str = "thread", max_workers: Optional[int] = None,
+                 max_pending: int = 64, retry_after: int = 5):
+        if backend not in ("thread", "process"):
+            raise ValueError(f"Unknown executor backend: {backend}")
+        self.name = name
+        self.backend = backend
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self.pending = 0
+        self.rejected = 0
+        self._pool: Optional[Executor] = None
+    
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.backend == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"ml-{self.name}")
+        return self._pool
+    
+    def check_capacity(self) -> None:
+        """Raise ExecutorSaturated now if a new call would be rejected"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ExecutorSaturated(self.name, self.retry_after)
+    
+    @contextmanager
+    def admit(self):
+        """Hold one slot; yields submit(fn, *args), which queues a pool job and returns an awaitable
+        
+        The slot is released once the scope has exited and every job
+        submitted through it is done (finished, failed or cancelled before
+        it started). Passing submit as slot= to run/as_completed makes
+        several calls share it, so a multi-step request is admitted (or
+        rejected) once, up front.
+        """
+        self.check_capacity()
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+        holders = [1]  # the scope itself plus each unfinished job
+        
+        def release() -> None:
+            holders[0] -= 1
+            if holders[0] == 0:
+                self.pending -= 1
+        
+        def job_done(_: Any) -> None:
+            # Runs on a pool thread; the count is only touched on the event loop
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                pass  # loop already closed
+        
+        def submit(fn: Callable[..., Any], *args: Any) -> "asyncio.Future[Any]":
+            job = self._get_pool().submit(fn, *args)
+            holders[0] += 1
+            job.add_done_callback(job_done)
+            return asyncio.wrap_future(job, loop=loop)
+        
+        try:
+            yield submit
+        finally:
+            release()
+    
+    @contextmanager
+    def _slot(self, slot: Optional[Callable[..., Any]]):
+        """The caller's slot, or a new one for this call"""
+        if slot is not None:
+            yield slot
+        else:
+            with self.admit() as submit:
+                yield submit
+    
+    async def run(self, fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None,
+                  slot: Optional[Callable[..., Any]] = None) -> Any:
+        """Run fn(*args) in the pool and await its result"""
+        with self._slot(slot) as submit:
+            start = time.perf_counter()
+            try:
+                return await asyncio.wait_for(submit(fn, *args), timeout=timeout)
+            except BrokenProcessPool:
+                self.shutdown()
+                raise
+            finally:
+                executor_latency.observe(time.perf_counter() - start, self.name)
+    
+    async def as_completed(self, fn: Callable[..., Any], arg_tuples: List[Tuple[Any, ...]],
+                           timeout: Optional[float] = None,
+                           slot: Optional[Callable[..., Any]] = None) -> AsyncIterator[Tuple[int, Any]]:
+        """Run fn over many argument tuples as one admitted request
+        
+        Yields (index, outcome) as each call finishes, where outcome is the
+        result or the exception that call raised (including per-call
+        timeouts).
+        """
+        with self._slot(slot) as submit:
+            async def run_one(index: int, args: Tuple[Any, ...]) -> Tuple[int, Any]:
+                start = time.perf_counter()
+                try:
+                    return index, await asyncio.wait_for(submit(fn, *args), timeout=timeout)
+                except Exception as e:
+                    return index, e
+                finally:
+                    executor_latency.observe(time.perf_counter() - start, self.name)
+            
+            tasks = [asyncio.ensure_future(run_one(i, args)) for i, args in enumerate(arg_tuples)]
+            broken = False
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    index, outcome = await next_done
+                    broken = broken or isinstance(outcome, BrokenProcessPool)
+                    yield index, outcome
+            finally:
+                for task in tasks:
+                    task.cancel()
+        
+        if broken:
+            # A worker died (e.g. OOM); start a fresh pool for the next request
+            self.shutdown()
+    
+    async def map(self, fn: Callable[..., Any], arg_tuples: List[Tuple[Any, ...]],
+                  timeout: Optional[float] = None) -> List[Any]:
+        """Like as_completed, but returns all outcomes in input order"""
+        results: List[Any] = [None] * len(arg_tuples)
+        async for index, outcome in self.as_completed(fn, arg_tuples, timeout=timeout):
+            results[index] = outcome
+        return results
+    
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': self.backend,
+            'max_workers': self.max_workers,
+            'pending': self.pending,
+            'max_pending': self.max_pending,
+            'rejected': self.rejected
+        }
+
+VARIANT_TIMEOUT = float(os.environ.get("ML_VARIANT_TIMEOUT", 120))
+REORDER_COVER_DAYS = 21  # days of demand a recommended order covers
+# Most Prophet series fitted per bulk worker call
+PROPHET_BATCH_SIZE = int(os.environ.get("ML_PROPHET_BATCH_SIZE", 4))
+
+# Single-request model work (forecast, price, segmentation)
+compute_executor = ComputeExecutor(
+    "compute",
+    backend=os.environ.get("ML_EXECUTOR_BACKEND", "thread"),
+    max_workers=int(os.environ.get("ML_EXECUTOR_WORKERS", 0)) or None,
+    max_pending=int(os.environ.get("ML_EXECUTOR_MAX_QUEUE", 32)),
+    retry_after=int(os.environ.get("ML_EXECUTOR_RETRY_AFTER", 5))
+)
+
+# Per-variant fan-out for /api/demand-forecast; each bulk request is one queue slot
+bulk_executor = ComputeExecutor(
+    "bulk",
+    backend=os.environ.get("ML_BULK_BACKEND", "process"),
+    max_workers=int(os.environ.get("ML_BULK_WORKERS", 0)) or None,
+    max_pending=int(os.environ.get("ML_BULK_MAX_QUEUE", 4)),
+    retry_after=int(os.environ.get("ML_EXECUTOR_RETRY_AFTER", 5)) * 6
+)
+
+def shutdown_executors() -> None:
+    compute_executor.shutdown()
+    bulk_executor.shutdown()
+
+def run_forecast(historical: SalesInput, days: int, model_type: str,
+                 product_id: Optional[str], quantiles: Sequence[float] = ()) -> Dict[str, Any]:
+    """Forecast entry point for executor workers (uses the worker's own forecaster)"""
+    return forecaster.predict(historical, days, model_type, product_id=product_id, quantiles=quantiles)
+
+def run_forecast_batch(histories: List[SalesInput], days: int, model_type: str,
+                       product_ids: List[str], quantiles: Sequence[float] = ()) -> List[Any]:
+    """run_forecast over a chunk of series in one worker call; failures become entries"""
+    outcomes: List[Any] = []
+    for historical, product_id in zip(histories, product_ids):
+        try:
+            outcomes.append(forecaster.predict(historical, days, model_type, product_id=product_id,
+                                               quantiles=quantiles))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
+
+def run_statistical_batch(histories: List[SalesInput], days: int, quantiles: Sequence[float] = ()) -> List[Any]:
+    """Statistical forecasts for many series in one vectorized pass
+    
+    Returns one entry per history: its forecast, or the exception raised
+    while reading that history.
+    """
+    outcomes: List[Any] = [None] * len(histories)
+    start = time.perf_counter()
+    indices, values, dates, errors = collect_series(histories, forecaster.prepare_data)
+    for i, error in errors.items():
+        outcomes[i] = error
+    if indices:
+        forecast = MultiSeriesStatistical().forecast(values, dates, days, quantiles)
+        for row, i in enumerate(indices):
+            outcomes[i] = forecast.result(row)
+        model_costs.record("statistical", time.perf_counter() - start, len(indices))
+    return outcomes
+
+def run_global_batch(histories: List[SalesInput], days: int, quantiles: Sequence[float] = ()) -> List[Any]:
+    """Global-model forecasts for many series with one predict call
+    
+    Forecasting never trains the shared model (that is POST
+    /api/forecast/global/train); while none is trained, this is
+    run_statistical_batch.
+    """
+    model = global_models.load()
+    if model is None:
+        return run_statistical_batch(histories, days, quantiles)
+    outcomes: List[Any] = [None] * len(histories)
+    indices, values, dates, errors = collect_series(histories, forecaster.prepare_data)
+    for i, error in errors.items():
+        outcomes[i] = error
+    if indices:
+        start = time.perf_counter()
+        forecast = model.forecast(values, dates, days, quantiles)
+        for row, i in enumerate(indices):
+            outcomes[i] = forecast.result(row)
+        model_costs.record("global", time.perf_counter() - start, len(indices))
+    return outcomes
+
+def run_model_routing(histories: List[SalesInput], product_ids: List[str]) -> List[Any]:
+    """model_type "auto" decisions for many series, for executor workers"""
+    outcomes: List[Any] = [None] * len(histories)
+    indices, values, _, errors = collect_series(histories, forecaster.prepare_data)
+    for i, error in errors.items():
+        outcomes[i] = error
+    if indices:
+        traits = series_traits(values)
+        global_trained = global_models.load() is not None
+        for row, i in enumerate(indices):
+            row_traits = {name: value[row] for name, value in traits.items()}
+            outcomes[i] = choose_model(row_traits, forecaster.model_scores(product_ids[i]), global_trained)
+    return outcomes
+
+def run_global_training(historical_sales: Dict[str, SalesInput], horizon: int = GLOBAL_HORIZON) -> Dict[str, Any]:
+    """Global model training entry point for executor workers"""
+    indices, values, dates, errors = collect_series(list(historical_sales.values()), forecaster.prepare_data)
+    if not indices:
+        raise ValueError("No readable sales histories to train on")
+    model = train_global_model(values, dates, horizon)
+    global_models.save(model)
+    return {**model.info(), 'skipped_series': len(errors)}
+
+def run_backtest_statistical(histories: List[SalesInput], horizon: int,
+                             folds: int) -> Tuple[List[List[Dict[str, float]]], Dict[int, str]]:
+    """Vectorized statistical backtest entry point for executor workers"""
+    indices, values, dates, errors = collect_series(histories, forecaster.prepare_data)
+    per_series: List[List[Dict[str, float]]] = [[] for _ in histories]
+    if indices:
+        for row, fold_list in enumerate(backtest_statistical(values, dates, horizon, folds)):
+            per_series[indices[row]] = fold_list
+    return per_series, {i: str(error) for i, error in errors.items()}
+
+def run_backtest_fold(history: SalesInput, model_type: str, origin: int, horizon: int) -> Dict[str, float]:
+    """Error sums of one model on one rolling-origin fold, for executor workers"""
+    df = forecaster.prepare_data(history).reset_index(drop=True)
+    train, test = df.iloc[:origin], df.iloc[origin:origin + horizon]
+    if model_type == "random_forest":
+        result = forecaster.forecast_random_forest(train, horizon)
+    elif model_type == "global":
+        values, dates = pack_series([train])
+        result = global_models.load().forecast(values, dates, horizon).result(0)
+    else:
+        result = forecaster.forecast_prophet(train, horizon)
+    
+    dates, predicted, lower, upper = result_arrays(result)
+    actual = pd.Series(test['quantity'].to_numpy(dtype=np.float64),
+                       index=test['date'].to_numpy().astype('datetime64[D]'))
+    actual = actual[~actual.index.duplicated(keep='last')].reindex(dates).to_numpy()
+    errors = fold_errors(actual[None], predicted[None], lower[None], upper[None],
+                         np.array([naive_scale(train['quantity'].to_numpy(dtype=np.float64))]))
+    return {name: float(error[0]) for name, error in errors.items()}
+
+def run_price_optimization(current_price: float, cost_price: float,
+                           historical_sales: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Price optimization entry point for executor workers"""
+    return optimizer.optimize_price(current_price, cost_price, historical_sales)
+
+def run_forecast_update(product_id: str, new_sales: List[Dict[str, Any]], days: int, model_type: str,
+                        historical_sales: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Incremental forecast update entry point for executor workers"""
+    return incremental.update(product_id, new_sales, days, model_type, historical_sales)
+
+def run_batch_price_optimization(products: List[Tuple[float, float, SalesInput]]) -> List[Dict[str, Any]]:
+    """Batch price optimization entry point for executor workers"""
+    return optimizer.optimize_prices(products)
+
+def run_segmentation(customers: List[Dict[str, Any]],
+                     rules: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Customer segmentation entry point for executor workers"""
+    return segmenter.segment(customers, rules)
+
+def run_cluster_segmentation(customers: List[Dict[str, Any]], n_clusters: Optional[int] = None,
+                             retrain: bool = False, update_model: bool = False) -> Dict[str, Any]:
+    """Behavioral clustering entry point for executor workers"""
+    return clusterer.segment(customers, n_clusters, retrain, update_model)
+
+def run_cluster_training(path: str, file_format: str, chunk_size: int,
+                         n_clusters: Optional[int] = None, epochs: int = 3) -> Dict[str, Any]:
+    """Out-of-core cluster training entry point for executor workers"""
+    model = clusterer.train(lambda: iter_table_customers(path, file_format, chunk_size), n_clusters, epochs)
+    return model.info()
+
+def run_seasonality_ingest(historical_sales: Dict[str, SalesInput],
+                           categories: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """Seasonality table ingest entry point for executor workers"""
+    sales = {}
+    for variant_id, history in historical_sales.items():
+        if not history:
+            continue
+        df = forecaster.prepare_data(history)
+        sales[variant_id] = (df['date'].to_numpy(), df['quantity'].to_numpy(dtype=np.float64))
+    return seasonality.ingest(sales, categories)
+
+def run_streaming_segmentation(path: str, file_format: str, chunk_size: int,
+                               rules: Optional[List[Dict[str, Any]]] = None,
+                               assignments_path: Optional[str] = None) -> Dict[str, Any]:
+    """Out-of-core segmentation entry point for executor workers"""
+    return StreamingSegmenter(rules).segment(
+        lambda: iter_table_customers(path, file_format, chunk_size), assignments_path
+    )
+
+# ============================================================================
+# Bulk Forecasting
+# ============================================================================
+
+def variant_history(request: DemandForecastRequest, variant: Dict[str, Any]) -> SalesInput:
+    """Sales history for a variant, looked up by SKU and then by id"""
+    variant_id = variant.get('id', 'unknown')
+    sales_key = variant.get('sku', variant_id)
+    return request.historical_sales.get(sales_key, [])
+
+def request_levels(request: DemandForecastRequest) -> Tuple[float, ...]:
+    """Quantile levels every variant's forecast needs: the requested ones and the service level"""
+    return forecast_levels(request.quantiles, request.service_level)
+
+def variant_forecast_args(request: DemandForecastRequest) -> List[Tuple[Any, ...]]:
+    """run_forecast arguments for each variant, in request order"""
+    levels = request_levels(request)
+    return [
+        (variant_history(request, variant), request.forecast_days, request.model_type, variant.get('id', 'unknown'),
+         levels)
+        for variant in request.product_variants
+    ]
+
+async def iter_variant_forecasts(request: DemandForecastRequest) -> AsyncIterator[Tuple[int, Any]]:
+    """(index, outcome) per variant, in completion order
+    
+    Statistical and global-model forecasts run as one vectorized batch on
+    the bulk executor, Prophet fits in small chunks across its workers, and
+    other models fan out one call per variant. outcome is the forecast
+    result or the exception that variant raised (including timeouts).
+    """
+    if request.model_type == "auto":
+        async for index, outcome in iter_routed_forecasts(request):
+            yield index, outcome
+        return
+    
+    # Without a trained global model, "global" resolves to the statistical batch
+    batch = {"global": run_global_batch, "statistical": run_statistical_batch}.get(
+        forecaster.resolve_model_type(request.model_type)
+    )
+    if batch is not None:
+        histories = [variant_history(request, variant) for variant in request.product_variants]
+        try:
+            outcomes = await bulk_executor.run(batch, histories, request.forecast_days, request_levels(request),
+                                               timeout=VARIANT_TIMEOUT)
+        except ExecutorSaturated:
+            raise
+        except Exception as e:
+            outcomes = [e] * len(histories)
+        for index, outcome in enumerate(outcomes):
+            yield index, outcome
+        return
+    
+    if forecaster.resolve_model_type(request.model_type) == "prophet":
+        histories = [variant_history(request, variant) for variant in request.product_variants]
+        product_ids = [variant.get('id', 'unknown') for variant in request.product_variants]
+        async for index, outcome in iter_chunked_forecasts(
+                histories, product_ids, list(range(len(histories))), request.forecast_days, "prophet",
+                request_levels(request)):
+            yield index, outcome
+        return
+    
+    async for index, outcome in bulk_executor.as_completed(
+            run_forecast, variant_forecast_args(request), timeout=VARIANT_TIMEOUT):
+        yield index, outcome
+
+async def iter_chunked_forecasts(histories: List[SalesInput], product_ids: List[str], indices: List[int],
+                                 days: int, model_type: str, quantiles: Sequence[float] = (),
+                                 slot: Optional[Callable[..., Any]] = None) -> AsyncIterator[Tuple[int, Any]]:
+    """(index, outcome) for the given variants, fitted in chunks spread over the bulk workers
+    
+    Chunks are small enough for every worker to get a few, so the pool
+    stays busy while slow fits (Prophet) finish; each chunk gets the
+    per-variant timeout once per series in it.
+    """
+    size = max(1, min(PROPHET_BATCH_SIZE, -(-len(indices) // (2 * bulk_executor.max_workers))))
+    chunks = [indices[start:start + size] for start in range(0, len(indices), size)]
+    args = [([histories[i] for i in chunk], days, model_type, [product_ids[i] for i in chunk], quantiles)
+            for chunk in chunks]
+    async for position, outcome in bulk_executor.as_completed(run_forecast_batch, args,
+                                                              timeout=VARIANT_TIMEOUT * size, slot=slot):
+        chunk = chunks[position]
+        outcomes = [outcome] * len(chunk) if isinstance(outcome, BaseException) else outcome
+        for index, result in zip(chunk, outcomes):
+            yield index, result
+
+async def iter_routed_forecasts(request: DemandForecastRequest) -> AsyncIterator[Tuple[int, Any]]:
+    """iter_variant_forecasts for model_type "auto"
+    
+    Routing decisions for the whole catalog come from one executor call;
+    variants routed to statistical or global then run as one batch per
+    model, the rest fan out per variant. All of it holds one bulk executor
+    slot, so the request is only ever rejected before its first result.
+    Each result carries its model_selection.
+    """
+    histories = [variant_history(request, variant) for variant in request.product_variants]
+    product_ids = [variant.get('id', 'unknown') for variant in request.product_variants]
+    levels = request_levels(request)
+    with bulk_executor.admit() as slot:
+        selections = await bulk_executor.run(run_model_routing, histories, product_ids, slot=slot)
+        
+        groups: Dict[str, List[int]] = {}
+        for index, selection in enumerate(selections):
+            if isinstance(selection, BaseException):
+                yield index, selection
+            else:
+                groups.setdefault(selection['model'], []).append(index)
+        
+        def with_selection(index: int, outcome: Any) -> Any:
+            if not isinstance(outcome, BaseException):
+                outcome['model_selection'] = selections[index]
+            return outcome
+        
+        for model, batch in (("statistical", run_statistical_batch), ("global", run_global_batch)):
+            indices = groups.pop(model, [])
+            if not indices:
+                continue
+            try:
+                outcomes = await bulk_executor.run(
+                    batch, [histories[i] for i in indices], request.forecast_days, levels,
+                    timeout=VARIANT_TIMEOUT, slot=slot
+                )
+            except Exception as e:
+                outcomes = [e] * len(indices)
+            for index, outcome in zip(indices, outcomes):
+                yield index, with_selection(index, outcome)
+        
+        indices = groups.pop("prophet", [])
+        if indices:
+            async for index, outcome in iter_chunked_forecasts(
+                    histories, product_ids, indices, request.forecast_days, "prophet", levels, slot):
+                yield index, with_selection(index, outcome)
+        
+        indices = [index for group in groups.values() for index in group]
+        args = [(histories[i], request.forecast_days, selections[i]['model'], product_ids[i], levels)
+                for i in indices]
+        async for position, outcome in bulk_executor.as_completed(run_forecast, args, timeout=VARIANT_TIMEOUT,
+                                                                  slot=slot):
+            yield indices[position], with_selection(indices[position], outcome)
+
+async def run_variant_forecasts(request: DemandForecastRequest) -> List[Any]:
+    """Outcomes of iter_variant_forecasts in request order"""
+    results: List[Any] = [None] * len(request.product_variants)
+    async for index, outcome in iter_variant_forecasts(request):
+        results[index] = outcome
+    return results
+
+def describe_variant_error(error: BaseException) -> str:
+    if isinstance(error, asyncio.TimeoutError):
+        return f"Forecast timed out after {VARIANT_TIMEOUT:g}s"
+    return str(error) or error.__class__.__name__
+
+def summarize_variant_forecast(variant: Dict[str, Any], result: Any, response_format: str = "records",
+                               quantiles: Optional[List[float]] = None,
+                               service_level: Optional[float] = None) -> Dict[str, Any]:
+    """Forecast entry, reorder recommendation and trend for one variant
+    
+    result may be the exception the variant's forecast raised, in which case
+    the forecast entry carries an 'error' instead of predictions. With a
+    service_level, the recommended order is the demand quantile at that
+    level over the cover period, i.e. mean demand plus safety stock; the
+    forecast must have been computed with that level.
+    """
+    variant_id = variant.get('id', 'unknown')
+    if isinstance(result, BaseException):
+        # One bad SKU history must not fail the whole batch
+        return {
+            'forecast': {
+                'variant_id': variant_id,
+                'name': variant.get('name', 'Unknown'),
+                'forecast': [],
+                'avg_daily_demand': None,
+                'error': describe_variant_error(result)
+            },
+            'reorder': None,
+            'trend': None
+        }
+    
+    predicted = result['forecast'].rounded()[0]
+    avg_demand = float(predicted.mean())
+    
+    forecast = {
+        'variant_id': variant_id,
+        'name': variant.get('name', 'Unknown'),
+        'forecast': result['forecast'].payload(response_format, quantiles),
+        'avg_daily_demand': round(avg_demand, 1)
+    }
+    if 'model_selection' in result:
+        forecast['model_selection'] = result['model_selection']
+    
+    # Reorder recommendation
+    reorder = None
+    current_stock = variant.get('stock', 0)
+    days_of_stock = current_stock / avg_demand if avg_demand > 0 else 999
+    
+    if days_of_stock < 14:
+        order_quantity = avg_demand * REORDER_COVER_DAYS
+        reorder = {
+            'variant_id': variant_id,
+            'current_stock': current_stock,
+            'days_remaining': round(days_of_stock, 1),
+            'recommended_order_quantity': round(order_quantity),
+            'priority': 'high' if days_of_stock < 7 else 'medium'
+        }
+        if service_level is not None:
+            covered = result['forecast'].cover_quantile(service_level, REORDER_COVER_DAYS)
+            safety_stock = max(covered - order_quantity, 0.0)
+            reorder.update({
+                'recommended_order_quantity': round(order_quantity + safety_stock),
+                'safety_stock': round(safety_stock),
+                'service_level': service_level
+            })
+    
+    # Trend detection
+    trend = None
+    if len(predicted) >= 7:
+        recent_avg = np.mean(predicted[:7])
+        older_avg = np.mean(predicted[7:14])
+        
+        if recent_avg > older_avg * 1.1:
+            trend = 'increasing'
+        elif recent_avg < older_avg * 0.9:
+            trend = 'decreasing'
+        else:
+            trend = 'stable'
+    
+    return {'forecast': forecast, 'reorder': reorder, 'trend': trend}
+
+def build_bulk_summary(summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Catalog-level part of a bulk response (everything except the forecasts)
+    
+    Only each summary's forecast['variant_id'], 'error' and
+    'model_selection' are read, so callers streaming forecasts out may drop
+    the predictions beforehand.
+    """
+    reorder_recs = []
+    demand_trends = {}
+    seasonal_index = {}
+    model_mix: Dict[str, int] = {}
+    expected_cost_ms = 0.0
+    failed = 0
+    month = datetime.now().month
+    
+    for summary in summaries:
+        variant_id = summary['forecast']['variant_id']
+        if 'error' in summary['forecast']:
+            failed += 1
+            continue
+        
+        selection = summary['forecast'].get('model_selection')
+        if selection is not None:
+            model_mix[selection['model']] = model_mix.get(selection['model'], 0) + 1
+            expected_cost_ms += selection['expected_cost_ms']
+        
+        if summary['reorder'] is not None:
+            reorder_recs.append(summary['reorder'])
+        if summary['trend'] is not None:
+            demand_trends[variant_id] = summary['trend']
+        
+        # Seasonal index of the current month, from the precomputed table
+        seasonal_index[variant_id] = round(seasonality.month_index(variant_id, month), 2)
+    
+    low_stock_alerts = len([r for r in reorder_recs if r['priority'] == 'high'])
+    stock_optimization = {
+        'total_variants': len(summaries),
+        'failed_variants': failed,
+        'low_stock_alerts': low_stock_alerts,
+        # 85-95, higher with fewer urgent reorders (deterministic so responses can be cached)
+        'optimization_score': round(85 + 10 * (1 - low_stock_alerts / max(len(summaries) - failed, 1)), 1)
+    }
+    if model_mix:
+        # model_type "auto": how variants were routed and what that was expected to cost
+        stock_optimization['model_mix'] = model_mix
+        stock_optimization['expected_cost_ms'] = round(expected_cost_ms, 2)
+    
+    return {
+        'reorder_recommendations': reorder_recs,
+        'demand_trends': demand_trends,
+        'seasonal_index': seasonal_index,
+        'stock_optimization': stock_optimization
+    }
+
+def build_bulk_response(summaries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-variant summaries (in request order) into a bulk forecast response"""
+    return {
+        'forecasts': [summary['forecast'] for summary in summaries],
+        **build_bulk_summary(summaries)
+    }
+
+def ndjson_line(obj: Dict[str, Any]) -> bytes:
+    return dump_json(obj) + b'\n'
+
+async def stream_bulk_forecast(request: DemandForecastRequest) -> AsyncIterator[bytes]:
+    """NDJSON lines for a bulk forecast, one per variant as soon as it is done
+    
+    Lines are {"type": "start"}, then one {"type": "variant"} per variant in
+    completion order (with its request "index"), then a final
+    {"type": "summary"}. Only reorder/trend data is kept between lines, so
+    memory does not grow with the forecasts already sent.
+    """
+    yield ndjson_line({'type': 'start', 'total_variants': len(request.product_variants)})
+    
+    summaries: List[Optional[Dict[str, Any]]] = [None] * len(request.product_variants)
+    try:
+        async for index, outcome in iter_variant_forecasts(request):
+            summary = summarize_variant_forecast(request.product_variants[index], outcome, request.response_format,
+                                                 request.quantiles, request.service_level)
+            yield ndjson_line({
+                'type': 'variant',
+                'index': index,
+                'forecast': summary['forecast'],
+                'reorder_recommendation': summary['reorder'],
+                'trend': summary['trend']
+            })
+            summary['forecast'] = {
+                k: v for k, v in summary['forecast'].items() if k in ('variant_id', 'error', 'model_selection')
+            }
+            summaries[index] = summary
+    except ExecutorSaturated as e:
+        yield ndjson_line({'type': 'error', 'detail': str(e), 'retry_after': e.retry_after})
+        return
+    
+    yield ndjson_line({'type': 'summary', **build_bulk_summary(summaries)})
+
+# ============================================================================
+# Background Jobs
+# ============================================================================
+
+JOB_TTL = float(os.environ.get("ML_JOB_TTL", 24 * 3600))
+JOB_DB_PATH = os.environ.get("ML_JOB_DB", os.path.join(tempfile.gettempdir(), "ml-service-jobs.sqlite3"))
+
+class JobStore:
+    """SQLite-backed job status and result store with expiry
+    
+    Shared by all uvicorn workers on the host, so a job submitted to one
+    worker can be polled through any other. Per-variant results are written
+    as they complete and double as the job's partial results.
+    """
+    
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (job_id, idx)
+                );
+            """)
+    
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def create(self, kind: str, total: int) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, total, created_at, updated_at, expires_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, total, now, now, now + self.ttl_seconds)
+            )
+        self.purge_expired()
+        return job_id
+    
+    def set_status(self, job_id: str, status: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id))
+    
+    def add_item(self, job_id: str, index: int, payload: Dict[str, Any]) -> None:
+        """Record one completed unit of work and advance the progress counter"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_items (job_id, idx, payload) VALUES (?, ?, ?)",
+                (job_id, index, dump_json(payload).decode())
+            )
+            # Distinct items, so a variant recorded twice (e.g. a retried run) counts once
+            conn.execute(
+                "UPDATE jobs SET completed = (SELECT COUNT(*) FROM job_items WHERE job_id = ?), updated_at = ? "
+                "WHERE id = ?",
+                (job_id, time.time(), job_id)
+            )
+    
+    def finish(self, job_id: str, result: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'completed', result = ?, updated_at = ?, expires_at = ? WHERE id = ?",
+                (dump_json(result).decode(), now, now + self.ttl_seconds, job_id)
+            )
+    
+    def fail(self, job_id: str, error: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+    
+    def get(self, job_id: str, include_items: bool = True) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, total, completed, created_at, updated_at, expires_at, result, error "
+                "FROM jobs WHERE id = ? AND expires_at > ?",
+                (job_id, time.time())
+            ).fetchone()
+            if row is None:
+                return None
+            
+            job = {
+                'job_id': row[0],
+                'kind': row[1],
+                'status': row[2],
+                'progress': {'completed': row[4], 'total': row[3]},
+                'created_at': datetime.fromtimestamp(row[5]).isoformat(),
+                'updated_at': datetime.fromtimestamp(row[6]).isoformat(),
+                'expires_at': datetime.fromtimestamp(row[7]).isoformat(),
+            }
+            if row[8] is not None:
+                job['result'] = json.loads(row[8])
+            elif include_items:
+                items = conn.execute(
+                    "SELECT payload FROM job_items WHERE job_id = ? ORDER BY idx", (job_id,)
+                ).fetchall()
+                job['partial_results'] = [json.loads(item[0]) for item in items]
+            if row[9] is not None:
+                job['error'] = row[9]
+            return job
+    
+    def purge_expired(self) -> None:
+        with self._connect() as conn:
+            expired = "SELECT id FROM jobs WHERE expires_at <= ?"
+            now = time.time()
+            conn.execute(f"DELETE FROM job_items WHERE job_id IN ({expired})", (now,))
+            conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,))
 
+job_store = JobStore(JOB_DB_PATH, JOB_TTL)
 
-class CustomerSegmenter:
-    """Customer segmentation using RFM analysis"""
-    
-    def segment(self, customers: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Segment customers into groups"""
+# Strong references so running job tasks are not garbage collected
+_job_tasks: Set["asyncio.Task[None]"] = set()
+
+async def run_demand_forecast_job(job_id: str, request: DemandForecastRequest) -> None:
+    """Run a bulk demand forecast in the background, recording progress per variant"""
+    try:
+        summaries: List[Optional[Dict[str, Any]]] = [None] * len(request.product_variants)
+        while True:
+            try:
+                job_store.set_status(job_id, 'running')
+                async for index, outcome in iter_variant_forecasts(request):
+                    summaries[index] = summarize_variant_forecast(
+                        request.product_variants[index], outcome, request.response_format,
+                        request.quantiles, request.service_level
+                    )
+                    job_store.add_item(job_id, index, summaries[index]['forecast'])
+                break
+            except ExecutorSaturated as e:
+                # Jobs wait for capacity instead of being rejected
+                job_store.set_status(job_id, 'queued')
+                await asyncio.sleep(e.retry_after)
         
-        if not customers:
-            return {
-                'segments': [],
-                'segment_characteristics': {},
-                'marketing_recommendations': {}
-            }
+        job_store.finish(job_id, build_bulk_response(summaries))
+    except asyncio.CancelledError:
+        job_store.fail(job_id, "Service shut down before the job finished")
+        raise
+    except Exception as e:
+        job_store.fail(job_id, str(e) or e.__class__.__name__)
+
+# ============================================================================
+# Incremental Updates
+# ============================================================================
+
+STATE_DIR = os.environ.get("ML_STATE_DIR", os.path.join(tempfile.gettempdir(), "ml-service-state"))
+FOREST_UPDATE_TREES = int(os.environ.get("ML_FOREST_UPDATE_TREES", 10))
+FOREST_MAX_TREES = int(os.environ.get("ML_FOREST_MAX_TREES", 200))
+FOREST_WINDOW_DAYS = int(os.environ.get("ML_FOREST_WINDOW_DAYS", 90))
+
+def prophet_warm_start(model: Any) -> Dict[str, Any]:
+    """Stan initialization taken from a fitted Prophet model's parameters"""
+    init = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        init[name] = model.params[name][0][0]
+    for name in ['delta', 'beta']:
+        init[name] = model.params[name][0]
+    return init
+
+@dataclass
+class ProductState:
+    """Incremental forecasting state for one product and model type
+    
+    The running sums reproduce the least-squares trend fitted by
+    forecast_statistical (x = position in the series) and the target std
+    used for forest intervals, without keeping the history around.
+    """
+    product_id: str
+    model_type: str
+    last_date: Optional[pd.Timestamp] = None
+    n: int = 0
+    sum_x: float = 0.0
+    sum_y: float = 0.0
+    sum_xx: float = 0.0
+    sum_xy: float = 0.0
+    sum_yy: float = 0.0
+    model: Any = None
+    window: Optional[pd.DataFrame] = None  # recent days the forest refreshes on
+    history: Optional[pd.DataFrame] = None  # Prophet refits need the full series
+    
+    def absorb(self, df: pd.DataFrame) -> None:
+        """Add the next days of the series to the running sums"""
+        y = df['quantity'].to_numpy(dtype=np.float64)
+        x = np.arange(self.n, self.n + len(y), dtype=np.float64)
+        self.n += len(y)
+        self.sum_x += x.sum()
+        self.sum_y += y.sum()
+        self.sum_xx += (x * x).sum()
+        self.sum_xy += (x * y).sum()
+        self.sum_yy += (y * y).sum()
+        self.last_date = df['date'].max()
+    
+    def trend(self) -> Dict[str, float]:
+        denominator = self.n * self.sum_xx - self.sum_x ** 2
+        slope = (self.n * self.sum_xy - self.sum_x * self.sum_y) / denominator if denominator else 0.0
+        intercept = (self.sum_y - slope * self.sum_x) / self.n if self.n else 0.0
+        return {'slope': float(slope), 'intercept': float(intercept)}
+    
+    def std(self) -> float:
+        if not self.n:
+            return 0.0
+        mean = self.sum_y / self.n
+        return float(np.sqrt(max(0.0, self.sum_yy / self.n - mean ** 2)))
+
+class ProductStateStore:
+    """Pickled ProductState per (product, model type) with an in-memory copy
+    
+    Files are re-read when another worker has written a newer version.
+    """
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._states: Dict[Tuple[str, str], Tuple[ProductState, float]] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+    
+    def _path(self, product_id: str, model_type: str) -> str:
+        name = hashlib.sha1(product_id.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}-{model_type}.pkl")
+    
+    def lock(self, product_id: str, model_type: str) -> threading.Lock:
+        """Lock serializing updates to one product's state"""
+        with self._lock:
+            return self._locks.setdefault((product_id, model_type), threading.Lock())
+    
+    def load(self, product_id: str, model_type: str) -> Optional[ProductState]:
+        path = self._path(product_id, model_type)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
         
-        # RFM scoring
-        rfm_data = []
-        for customer in customers:
-            rfm_data.append({
-                'customer_id': customer.get('id', 'unknown'),
-                'recency': customer.get('days_since_last_order', 365),
-                'frequency': customer.get('order_count', 0),
-                'monetary': customer.get('total_spent', 0)
-            })
+        cached = self._states.get((product_id, model_type))
+        if cached is not None and cached[1] == mtime:
+            return cached[0]
         
-        df = pd.DataFrame(rfm_data)
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        self._states[(product_id, model_type)] = (state, mtime)
+        return state
+    
+    def save(self, state: ProductState) -> None:
+        path = self._path(state.product_id, state.model_type)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._states[(state.product_id, state.model_type)] = (state, os.path.getmtime(path))
+
+class IncrementalForecaster:
+    """Update per-product models with only the newly arrived sales days"""
+    
+    def __init__(self, forecaster: DemandForecaster, store: ProductStateStore):
+        self.forecaster = forecaster
+        self.store = store
+    
+    def update(self, product_id: str, new_sales: List[Dict[str, Any]], days: int = 30,
+               model_type: str = "statistical",
+               historical_sales: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Apply new days to the product's state and forecast from it
         
-        # Calculate scores (1-5)
-        df['R_score'] = pd.qcut(df['recency'], q=5, labels=[5, 4, 3, 2, 1], duplicates='drop')
-        df['F_score'] = pd.qcut(df['frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5])
-        df['M_score'] = pd.qcut(df['monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5])
+        Without stored state the model is initialized from historical_sales
+        plus new_sales. Afterwards only days later than the last seen date
+        are applied; the statistical trend and forest updates cost time
+        proportional to the delta, Prophet refits warm-started from the
+        previous parameters. Empty new_sales leaves stored state untouched;
+        no sales at all for a new product is a ValueError (prepare_data
+        would substitute demo data, which must never be stored).
+        """
+        start = time.perf_counter()
+        model_used = self.forecaster.resolve_model_type(model_type)
+        if model_used == "global":
+            # The global model is retrained catalog-wide, not per product
+            model_used = "statistical"
         
-        df['RFM_score'] = df['R_score'].astype(str) + df['F_score'].astype(str) + df['M_score'].astype(str)
+        with self.store.lock(product_id, model_used):
+            state = self.store.load(product_id, model_used)
+            initialized = state is None
+            
+            if initialized:
+                if not historical_sales and not new_sales:
+                    raise ValueError(f"No sales to initialize product {product_id} from")
+                df = self.forecaster.prepare_data((historical_sales or []) + new_sales)
+                df = df.drop_duplicates('date', keep='last')
+                state = self._initialize(product_id, model_used, df)
+                applied, ignored = len(df), 0
+            elif not new_sales:
+                applied, ignored = 0, 0
+            else:
+                df = self.forecaster.prepare_data(new_sales)
+                delta = df[df['date'] > state.last_date].drop_duplicates('date', keep='last')
+                applied, ignored = len(delta), len(df) - len(delta)
+                if applied:
+                    self._apply(state, delta)
+            
+            if applied:
+                self.store.save(state)
+            result = self._project(state, days)
         
-        # Segment mapping
-        segment_rules = {
-            'Champions': lambda x: x.startswith(('555', '554', '545', '455')),
-            'Loyal Customers': lambda x: x[1] in ('4', '5') and x[2] in ('4', '5'),
-            'Potential Loyalists': lambda x: x[0] in ('4', '5') and x[1] in ('3', '4'),
-            'At Risk': lambda x: x[0] in ('1', '2') and x[1] in ('3', '4', '5'),
-            'Hibernating': lambda x: x[0] in ('1', '2') and x[1] in ('1', '2')
+        return {
+            'product_id': product_id,
+            'model_used': model_used,
+            'forecast': result['forecast'].records(),
+            'initialized': initialized,
+            'days_applied': applied,
+            'days_ignored': ignored,
+            'history_length': state.n,
+            'last_date': state.last_date.strftime('%Y-%m-%d'),
+            'update_seconds': round(time.perf_counter() - start, 4)
         }
+    
+    def _initialize(self, product_id: str, model_used: str, df: pd.DataFrame) -> ProductState:
+        state = ProductState(product_id=product_id, model_type=model_used)
+        state.absorb(df)
         
-        def get_segment(score):
-            for segment, rule in segment_rules.items():
-                if rule(score):
-                    return segment
-            return 'Needs Attention'
-        
-        df['segment'] = df['RFM_score'].apply(get_segment)
-        
-        # Build response
-        segments = df.groupby('segment').agg({
-            'customer_id': 'count',
-            'recency': 'mean',
-            'frequency': 'mean',
-            'monetary': 'mean'
-        }).reset_index()
-        
-        segments_list = []
-        for _, row in segments.iterrows():
-            segments_list.append({
-                'name': row['segment'],
-                'count': int(row['customer_id']),
-                'avg_recency_days': round(float(row['recency']), 1),
-                'avg_orders': round(float(row['frequency']), 1),
-                'avg_spent': round(float(row['monetary']), 2)
-            })
+        if model_used == "random_forest":
+            state.model = self.forecaster.fit_random_forest(df)
+            state.window = df[['date', 'quantity']].tail(FOREST_WINDOW_DAYS).reset_index(drop=True)
+        elif model_used == "prophet":
+            state.history = df[['date', 'quantity']].reset_index(drop=True)
+            state.model = self.forecaster.fit_prophet(state.history)
+        return state
+    
+    def _apply(self, state: ProductState, delta: pd.DataFrame) -> None:
+        state.absorb(delta)
         
-        # Segment characteristics
-        characteristics = {
-            'Champions': 'Best customers, highest value, frequent buyers',
-            'Loyal Customers': 'Regular buyers, good revenue',
-            'Potential Loyalists': 'Recent customers with potential',
-            'At Risk': 'Previously active, declining engagement',
-            'Hibernating': 'Inactive, may need win-back campaigns'
+        if state.model_type == "random_forest":
+            # Grow a few trees on the recent window and retire the oldest ones
+            window = pd.concat([state.window, delta[['date', 'quantity']]], ignore_index=True)
+            state.window = window.tail(FOREST_WINDOW_DAYS).reset_index(drop=True)
+            
+            model = state.model
+            model.set_params(warm_start=True, n_estimators=len(model.estimators_) + FOREST_UPDATE_TREES)
+            model.fit(self.forecaster.extract_features(state.window), state.window['quantity'].values)
+            if len(model.estimators_) > FOREST_MAX_TREES:
+                model.estimators_ = model.estimators_[-FOREST_MAX_TREES:]
+                model.set_params(n_estimators=FOREST_MAX_TREES)
+        elif state.model_type == "prophet":
+            state.history = pd.concat([state.history, delta[['date', 'quantity']]], ignore_index=True)
+            state.model = self.forecaster.fit_prophet(state.history, init=prophet_warm_start(state.model))
+    
+    def _project(self, state: ProductState, days: int) -> Dict[str, Any]:
+        if state.model_type == "random_forest":
+            return self.forecaster.project_random_forest(state.model, state.last_date, state.std(), days)
+        elif state.model_type == "prophet":
+            return self.forecaster.forecast_prophet(state.history, days, state.model)
+        return self.forecaster.project_statistical(state.trend(), state.n, state.last_date, days)
+
+# ============================================================================
+# Backtesting
+# ============================================================================
+
+BACKTEST_HORIZON = int(os.environ.get("ML_BACKTEST_HORIZON", 14))
+BACKTEST_FOLDS = int(os.environ.get("ML_BACKTEST_FOLDS", 3))
+BACKTEST_MIN_TRAIN = 14  # days of history a fold must train on
+BACKTEST_MODELS = ["statistical", "random_forest", "prophet", "global"]
+
+def fold_origins(length: int, horizon: int, folds: int) -> List[int]:
+    """Rolling-origin split points, oldest first: fold k trains on the first origin days"""
+    origins = [length - horizon * k for k in range(folds, 0, -1)]
+    return [origin for origin in origins if origin >= BACKTEST_MIN_TRAIN]
+
+def naive_scale(train: np.ndarray) -> float:
+    """MASE denominator: in-sample MAE of the weekly (else daily) naive forecast"""
+    lag = 7 if len(train) > 7 else 1
+    if len(train) <= lag:
+        return float('nan')
+    return float(np.nanmean(np.abs(train[lag:] - train[:-lag])))
+
+def fold_errors(actual: np.ndarray, predicted: np.ndarray, lower: np.ndarray,
+                upper: np.ndarray, scale: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-row error sums for (rows, horizon) matrices; NaN actuals are skipped
+    
+    Sums rather than means, so folds combine exactly in combine_folds.
+    """
+    seen = ~np.isnan(actual)
+    actual = np.where(seen, actual, 0.0)
+    abs_error = np.where(seen, np.abs(actual - predicted), 0.0)
+    nonzero = seen & (actual != 0)
+    denominator = np.abs(actual) + np.abs(predicted)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ape = np.where(nonzero, abs_error / np.abs(actual), 0.0)
+        smape = np.where(seen & (denominator > 0), 2 * abs_error / denominator, 0.0)
+    covered = seen & (actual >= lower) & (actual <= upper)
+    n = seen.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mase = np.where((n > 0) & (scale > 0), abs_error.sum(axis=1) / np.maximum(n, 1) / scale, np.nan)
+    return {
+        'n': n,
+        'ape_sum': ape.sum(axis=1),
+        'ape_n': nonzero.sum(axis=1),
+        'smape_sum': smape.sum(axis=1),
+        'covered': covered.sum(axis=1),
+        'mase': mase
+    }
+
+def combine_folds(folds: List[Dict[str, float]]) -> Optional[Dict[str, Any]]:
+    """Accuracy metrics of one model on one product from its folds' error sums"""
+    folds = [fold for fold in folds if fold['n'] > 0]
+    if not folds:
+        return None
+    n = sum(fold['n'] for fold in folds)
+    ape_n = sum(fold['ape_n'] for fold in folds)
+    mase = [fold['mase'] for fold in folds if np.isfinite(fold['mase'])]
+    return {
+        'mape': round(100 * sum(fold['ape_sum'] for fold in folds) / ape_n, 2) if ape_n else None,
+        'smape': round(100 * sum(fold['smape_sum'] for fold in folds) / n, 2),
+        'mase': round(float(np.mean(mase)), 3) if mase else None,
+        'coverage': round(sum(fold['covered'] for fold in folds) / n, 3),
+        'folds': len(folds),
+        'points': int(n)
+    }
+
+def result_arrays(result: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Dates, predictions and interval bounds of a per-product forecast result, as reported"""
+    forecast = result['forecast']
+    return (forecast.dates(), *(values.astype(np.float64) for values in forecast.rounded()))
+
+def backtest_statistical(values: np.ndarray, dates: np.ndarray, horizon: int,
+                         folds: int) -> List[List[Dict[str, float]]]:
+    """Fold error sums of the statistical forecaster for every series, in one engine call
+    
+    Every (series, fold) pair becomes one row of a truncated matrix, so all
+    folds of all series are fitted and projected together; actuals are
+    matched to forecast days by date.
+    """
+    lengths = (~np.isnan(values)).sum(axis=1)
+    pairs = [(i, origin) for i, n in enumerate(lengths) for origin in fold_origins(int(n), horizon, folds)]
+    per_series: List[List[Dict[str, float]]] = [[] for _ in range(len(values))]
+    if not pairs:
+        return per_series
+    
+    rows = np.array([i for i, _ in pairs])
+    origins = np.array([origin for _, origin in pairs])
+    columns = np.arange(values.shape[1])
+    truncated = np.where(columns < origins[:, None], values[rows], np.nan)
+    forecast = MultiSeriesStatistical(seasonal=False).forecast(truncated, dates[rows], horizon)
+    
+    positions = origins[:, None] + np.arange(horizon)
+    in_range = positions < values.shape[1]
+    clipped = np.minimum(positions, values.shape[1] - 1)
+    actual = values[rows[:, None], clipped]
+    actual = np.where(in_range & (dates[rows[:, None], clipped] == forecast.dates), actual, np.nan)
+    
+    scale = np.array([naive_scale(values[i, :origin]) for i, origin in pairs])
+    errors = fold_errors(actual, np.round(forecast.predicted), np.round(forecast.lower),
+                         np.round(forecast.upper), scale)
+    for row, (i, _) in enumerate(pairs):
+        per_series[i].append({name: float(error[row]) for name, error in errors.items()})
+    return per_series
+
+class BacktestStore:
+    """Latest backtest result per product, as JSON files shared by all workers"""
+    
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+    
+    def _path(self, product_id: str) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha1(product_id.encode()).hexdigest()}.json")
+    
+    def get(self, product_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(product_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def put(self, product_id: str, result: Dict[str, Any]) -> None:
+        path = self._path(product_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f)
+        os.replace(tmp_path, path)
+
+async def run_backtests(historical_sales: Dict[str, SalesInput], models: List[str],
+                        horizon: int, folds: int) -> Dict[str, Dict[str, Any]]:
+    """Walk-forward backtest of each requested model on each product, cached per product
+    
+    Statistical folds for the whole catalog run as one vectorized batch;
+    random forest, Prophet and global-model folds fan out one (product,
+    model, fold) call at a time across the bulk executor. The global model
+    is only backtested once trained (it is not refitted per fold, so its
+    folds may overlap its training data).
+    """
+    product_ids = list(historical_sales)
+    histories = [historical_sales[product_id] for product_id in product_ids]
+    fold_results: Dict[str, Dict[str, List[Dict[str, float]]]] = {product_id: {} for product_id in product_ids}
+    errors: Dict[str, str] = {}
+    
+    if "statistical" in models:
+        per_series, read_errors = await bulk_executor.run(run_backtest_statistical, histories, horizon, folds)
+        for i, product_id in enumerate(product_ids):
+            if i in read_errors:
+                errors[product_id] = read_errors[i]
+            else:
+                fold_results[product_id]["statistical"] = per_series[i]
+    
+    fold_models = [model for model in models if model in ("random_forest", "prophet", "global")]
+    if "prophet" in fold_models and not PROPHET_AVAILABLE:
+        fold_models.remove("prophet")
+    if "global" in fold_models and global_models.load() is None:
+        fold_models.remove("global")
+    args = [
+        (historical_sales[product_id], model, origin, horizon)
+        for product_id in product_ids if product_id not in errors
+        for model in fold_models
+        for origin in fold_origins(history_length(historical_sales[product_id]), horizon, folds)
+    ]
+    keys = [
+        (product_id, model)
+        for product_id in product_ids if product_id not in errors
+        for model in fold_models
+        for _ in fold_origins(history_length(historical_sales[product_id]), horizon, folds)
+    ]
+    async for index, outcome in bulk_executor.as_completed(run_backtest_fold, args, timeout=VARIANT_TIMEOUT):
+        product_id, model = keys[index]
+        if not isinstance(outcome, BaseException):
+            fold_results[product_id].setdefault(model, []).append(outcome)
+    
+    tested_at = datetime.now().isoformat()
+    results = {}
+    for product_id in product_ids:
+        if product_id in errors:
+            results[product_id] = {'error': errors[product_id]}
+            continue
+        metrics = {model: combine_folds(folds_) for model, folds_ in fold_results[product_id].items()}
+        metrics = {model: value for model, value in metrics.items() if value is not None}
+        ranked = sorted(metrics, key=lambda model: metrics[model]['smape'])
+        results[product_id] = {
+            'metrics': metrics,
+            'best_model': ranked[0] if ranked else None,
+            'horizon': horizon,
+            'history_days': history_length(historical_sales[product_id]),
+            'tested_at': tested_at
         }
+        if metrics:
+            backtests.put(product_id, results[product_id])
+    return results
+
+def backtest_accuracy(product_id: Optional[str], model_used: str) -> Optional[Dict[str, Any]]:
+    """Cached backtest metrics of model_used for a product, if it has been backtested"""
+    if product_id is None:
+        return None
+    cached = backtests.get(product_id)
+    if cached is None or model_used not in cached.get('metrics', {}):
+        return None
+    return {**cached['metrics'][model_used], 'tested_at': cached['tested_at'], 'horizon': cached['horizon']}
+
+# ============================================================================
+# Response Cache
+# ============================================================================
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("ML_RESPONSE_CACHE_SIZE", 256))
+RESPONSE_CACHE_MAX_BYTES = int(float(os.environ.get("ML_RESPONSE_CACHE_MAX_MB", 64)) * 1024 * 1024)
+RESPONSE_CACHE_TTL = float(os.environ.get("ML_RESPONSE_CACHE_TTL", 300))
+# SQLite file shared by all workers on the host; empty keeps the cache in memory only
+RESPONSE_CACHE_DB = os.environ.get("ML_RESPONSE_CACHE_DB", "")
+RESPONSE_CACHE_DISK_BYTES = int(float(os.environ.get("ML_RESPONSE_CACHE_DISK_MB", 256)) * 1024 * 1024)
+# Longest a request waits on an identical in-flight computation before answering 503
+COALESCE_MAX_WAIT = float(os.environ.get("ML_COALESCE_MAX_WAIT", 30))
+
+def file_version(path: str) -> int:
+    """mtime of a persisted store (0 if missing), for cache keys that must change with it"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+class ResponseCache:
+    """Rendered JSON responses keyed by a canonical hash of route and request
+    
+    The key hashes the validated request (defaults filled in, keys sorted),
+    so payloads that differ only in field order or omitted defaults share an
+    entry; callers add the versions of any persisted state the response
+    reads. Memory is an LRU bounded by entries and bytes. With a database
+    path, misses fall through to an SQLite tier shared by every worker,
+    evicted oldest-first once it outgrows max_disk_bytes.
+    """
+    
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 300,
+                 db_path: str = "", max_disk_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if db_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS responses (
+                        key TEXT PRIMARY KEY,
+                        body BLOB NOT NULL,
+                        etag TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+    
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def key(route: str, request: Any, state: Tuple[Any, ...] = ()) -> str:
+        canonical = request.model_dump(mode='json') if isinstance(request, BaseModel) else request
+        digest = hashlib.sha256(route.encode())
+        digest.update(dump_json([canonical, list(state)], sort_keys=True))
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """(body, etag) of a live entry, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
         
-        # Marketing recommendations
-        recommendations = {
-            'Champions': ['VIP rewards program', 'Early access to new products', 'Referral bonuses'],
-            'Loyal Customers': ['Loyalty rewards', 'Personalized recommendations', 'Exclusive offers'],
-            'Potential Loyalists': ['Engagement campaigns', 'First-purchase incentives', 'Product bundles'],
-            'At Risk': ['Win-back emails', 'Special discounts', 'Survey for feedback'],
-            'Hibernating': ['Reactivation campaigns', 'Deep discounts', 'Product updates']
-        }
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT body, etag, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Response cache read failed: {e}")
+                row = None
+            if row is not None:
+                body, etag, expires_at = bytes(row[0]), row[1], row[2]
+                self._remember(key, body, etag, expires_at)
+                with self._lock:
+                    self.disk_hits += 1
+                return body, etag
         
-        return {
-            'segments': segments_list,
-            'segment_characteristics': characteristics,
-            'marketing_recommendations': recommendations
-        }
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def put(self, key: str, body: bytes) -> str:
+        """Store a rendered response and return its ETag"""
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        self._remember(key, body, etag, expires_at)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, body, etag, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, body, etag, now, expires_at)
+                    )
+                    self._trim_disk(conn, now)
+            except sqlite3.Error as e:
+                print(f"Response cache write failed: {e}")
+        return etag
+    
+    def _remember(self, key: str, body: bytes, etag: str, expires_at: float) -> None:
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous[0])
+            self._entries[key] = (body, etag, expires_at)
+            self.current_bytes += len(body)
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+    
+    def _trim_disk(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses").fetchone()[0] - self.max_disk_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in conn.execute("SELECT key, LENGTH(body) FROM responses ORDER BY created_at"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'disk': bool(self.db_path),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0
+            }
+
+class SingleFlight:
+    """Run one computation per key at a time; concurrent callers with the key share it
+    
+    The computation runs as its own task, so a leader whose client goes
+    away does not cancel it for the others. Followers wait at most
+    max_wait seconds, then get 503 with Retry-After. Per worker process.
+    """
+    
+    def __init__(self, max_wait: float = 30, retry_after: int = 5):
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self.coalesced: Dict[str, int] = {}
+        self.timeouts = 0
+    
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+    
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]], label: str = "") -> Tuple[Any, bool]:
+        """(result, shared): shared is True when another caller's computation was reused"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            
+            def finished(done: "asyncio.Task[Any]") -> None:
+                self._inflight.pop(key, None)
+                if not done.cancelled():
+                    done.exception()  # retrieved even if every caller went away
+            
+            task.add_done_callback(finished)
+            return await asyncio.shield(task), False
+        
+        self.coalesced[label] = self.coalesced.get(label, 0) + 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=self.max_wait), True
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise HTTPException(
+                status_code=503,
+                detail=f"Identical request still running after {self.max_wait:g}s, retry in {self.retry_after}s",
+                headers={"Retry-After": str(self.retry_after)}
+            )
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or etag in tags or f'W/{etag}' in tags
 
+async def cached_response(raw: Request, request: Any, compute: Callable[[], Awaitable[Any]],
+                          state: Tuple[Any, ...] = ()) -> Response:
+    """Serve a JSON response from the response cache, computing and storing it on a miss
+    
+    Concurrent misses for the same key share one computation (X-Cache:
+    coalesced), whether or not the cache itself is enabled. Every response
+    carries an ETag; a request whose If-None-Match matches it gets 304 Not
+    Modified with no body. Errors raised by compute are not cached.
+    """
+    route = raw.url.path
+    key = response_cache.key(route, request, state)
+    
+    async def render() -> Tuple[bytes, str]:
+        content = await compute()
+        if isinstance(content, Response):
+            body = bytes(content.body)
+        else:
+            with timed_stage("serialize"):
+                body = dump_json(content)
+        return body, response_cache.put(key, body)
+    
+    entry = response_cache.get(key)
+    status = 'hit'
+    if entry is None:
+        entry, shared = await in_flight.run(key, render, route)
+        status = 'coalesced' if shared else 'miss'
+    
+    body, etag = entry
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Cache': status}
+    if etag_matches(raw.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
 
 # ============================================================================
 # FastAPI App
@@ -462,16 +4390,82 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     print("🚀 ShennaStudio ML Service starting...")
     print(f"   Prophet available: {PROPHET_AVAILABLE}")
+    if os.environ.get("ML_WARMUP", "0").lower() in ("1", "true", "yes"):
+        # Runs in a thread so the worker starts answering /health immediately
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+        print("   Model warm-up started in background")
+    print(f"   Compute executor: {compute_executor.backend} x{compute_executor.max_workers}")
+    print(f"   Bulk executor: {bulk_executor.backend} x{bulk_executor.max_workers}")
     print("   ML Service ready!")
     yield
+    for task in list(_job_tasks):
+        task.cancel()
+    shutdown_executors()
     print("👋 ShennaStudio ML Service shutting down...")
 
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse written with dump_json (orjson when installed), timed as the serialize stage"""
+    
+    def render(self, content: Any) -> bytes:
+        with timed_stage("serialize"):
+            return dump_json(content)
+
+class TimedRoute(APIRoute):
+    """Route that records request latency and times JSON body decoding
+    
+    The body is parsed here, inside the decode stage; FastAPI reuses the
+    parsed body, and reports any error itself. Latency is labelled with the
+    route template so path parameters do not create new series. Streaming
+    responses are timed until their headers are sent.
+    """
+    
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path
+        
+        async def timed_handler(request: Request) -> Response:
+            start = time.perf_counter()
+            status = 500
+            try:
+                if request.headers.get('content-type', '').startswith('application/json'):
+                    with timed_stage("decode"):
+                        try:
+                            await request.json()
+                        except Exception:
+                            pass
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            except ExecutorSaturated:
+                status = 503
+                raise
+            finally:
+                request_latency.observe(time.perf_counter() - start, request.method, route, str(status))
+        
+        return timed_handler
+
 app = FastAPI(
     title="ShennaStudio ML Service",
     description="Demand Forecasting & Price Optimization for ShennaStudio E-commerce",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse
 )
+app.router.route_class = TimedRoute
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # CORS
 app.add_middleware(
@@ -483,14 +4477,99 @@ app.add_middleware(
 )
 
 # Initialize ML models
-forecaster = DemandForecaster()
+seasonality = SeasonalityIndex(os.path.join(STATE_DIR, "seasonality.pkl"))
+global_models = GlobalModelStore(os.path.join(STATE_DIR, "global-model.pkl"))
+model_costs = ModelCostTracker(os.path.join(STATE_DIR, "model-costs.json"))
+backtests = BacktestStore(os.path.join(STATE_DIR, "backtests"))
+forecaster = DemandForecaster(seasonality, global_models, backtests)
 optimizer = PriceOptimizer()
 segmenter = CustomerSegmenter()
+incremental = IncrementalForecaster(forecaster, ProductStateStore(STATE_DIR))
+clusterer = CustomerClusterer(ClusterModelStore(os.path.join(STATE_DIR, "customer-clusters.pkl")))
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DB, RESPONSE_CACHE_DISK_BYTES
+)
+in_flight = SingleFlight(COALESCE_MAX_WAIT)
+
+def forecast_state() -> Tuple[Any, ...]:
+    """Versions of the persisted state a /api/forecast response depends on"""
+    return (file_version(seasonality.path), file_version(global_models.path), file_version(backtests.directory))
+
+def _cache_metric(field: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    return lambda: {(): forecaster.models.stats()[field]}
+
+def _executor_metric(field: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    return lambda: {(executor.name,): getattr(executor, field) for executor in (compute_executor, bulk_executor)}
+
+metrics.gauge("ml_model_cache_entries", "Fitted models in the model cache", (), _cache_metric('entries'))
+metrics.gauge("ml_model_cache_bytes", "Approximate size of the model cache", (), _cache_metric('bytes'))
+metrics.gauge("ml_model_cache_hits_total", "Model cache hits", (), _cache_metric('hits'), kind="counter")
+metrics.gauge("ml_model_cache_misses_total", "Model cache misses", (), _cache_metric('misses'), kind="counter")
+metrics.gauge("ml_model_cache_evictions_total", "Model cache evictions", (), _cache_metric('evictions'), kind="counter")
+metrics.gauge("ml_response_cache_hits_total", "Response cache hits by tier", ("tier",),
+              lambda: {('memory',): response_cache.hits, ('disk',): response_cache.disk_hits}, kind="counter")
+metrics.gauge("ml_response_cache_misses_total", "Response cache misses", (),
+              lambda: {(): response_cache.misses}, kind="counter")
+metrics.gauge("ml_response_cache_bytes", "Size of the in-memory response cache", (),
+              lambda: {(): response_cache.current_bytes})
+metrics.gauge("ml_coalesced_requests_total", "Requests answered by sharing an identical in-flight computation",
+              ("route",), lambda: {(route,): count for route, count in in_flight.coalesced.items()}, kind="counter")
+metrics.gauge("ml_coalesce_timeouts_total", "Requests that gave up waiting on an identical in-flight computation",
+              (), lambda: {(): in_flight.timeouts}, kind="counter")
+metrics.gauge("ml_inflight_computations", "Distinct cacheable computations currently running", (),
+              lambda: {(): in_flight.inflight})
+metrics.gauge("ml_executor_pending", "Executor calls queued or running", ("executor",), _executor_metric('pending'))
+metrics.gauge("ml_executor_max_pending", "Executor admission limit", ("executor",), _executor_metric('max_pending'))
+metrics.gauge("ml_executor_workers", "Executor pool size", ("executor",), _executor_metric('max_workers'))
+metrics.gauge("ml_executor_rejected_total", "Calls rejected with 503 because the executor was full",
+              ("executor",), _executor_metric('rejected'), kind="counter")
+metrics.gauge("ml_backend_load_seconds", "Import time of each lazily loaded model backend", ("backend",),
+              lambda: {(name,): seconds for name, seconds in backend_load_times.items()})
 
 # ============================================================================
 # Endpoints
 # ============================================================================
 
+async def decode_binary_request(raw: Request) -> Tuple[Dict[str, Any], Dict[str, SalesColumns]]:
+    body = await raw.body()
+    try:
+        with timed_stage("decode"):
+            return decode_sales_payload(body, raw.headers.get('content-type', ''))
+    except PayloadUnsupported as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid binary payload: {e}")
+
+def parse_binary_request(model: Any, payload: Dict[str, Any]) -> Any:
+    """Validate the non-history fields of a decoded binary payload"""
+    try:
+        return model.model_validate({**payload, 'historical_sales': {} if model is DemandForecastRequest else []})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+def check_response_format(response_format: str) -> None:
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown response_format '{response_format}'")
+
+def check_quantiles(quantiles: Optional[List[float]], service_level: Optional[float] = None) -> None:
+    """400 unless every quantile level (and the service level) is strictly between 0 and 1"""
+    levels = list(quantiles or []) + ([service_level] if service_level is not None else [])
+    if any(not 0 < level < 1 for level in levels):
+        raise HTTPException(status_code=400, detail="quantiles and service_level must be between 0 and 1")
+    if len(forecast_levels(quantiles)) > MAX_QUANTILES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_QUANTILES} quantiles per request")
+
+def validate_segment_rules(segment_rules: Optional[List[SegmentRule]]) -> Optional[List[Dict[str, Any]]]:
+    """Rules as plain dicts, or 400 if they cannot be turned into a lookup table"""
+    if segment_rules is None:
+        return None
+    rules = [rule.model_dump(exclude_none=True) for rule in segment_rules]
+    try:
+        build_segment_lut(rules)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return rules
+
 @app.get("/")
 async def root():
     return {
@@ -502,20 +4581,64 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "models_loaded": True}
+    """Liveness: answers as soon as the worker is up, models loaded or not"""
+    return {
+        "status": "healthy",
+        "models_loaded": models_ready(),
+        "backend_load_seconds": backend_load_times,
+        "model_cache": forecaster.models.stats(),
+        "model_cost_ms": model_costs.snapshot(),
+        "response_cache": response_cache.stats(),
+        "coalescing": {
+            "inflight": in_flight.inflight,
+            "coalesced": dict(in_flight.coalesced),
+            "timeouts": in_flight.timeouts
+        },
+        "executors": {
+            "compute": compute_executor.stats(),
+            "bulk": bulk_executor.stats()
+        }
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus metrics: request and stage latency, model fit times, cache and executor gauges"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 200 once every model backend is imported, 503 before that"""
+    ready = models_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "loading",
+            "backends": {backend.__name__: backend.loaded for backend in MODEL_BACKENDS}
+        }
+    )
 
 @app.post("/api/forecast", response_model=ForecastResponse)
-async def forecast_demand(request: ForecastRequest):
+async def forecast_demand_cached(request: ForecastRequest, raw: Request):
+    """Generate demand forecast for a product (cached, with ETag revalidation)"""
+    return await cached_response(raw, request, lambda: forecast_demand(request), forecast_state())
+
+async def forecast_demand(request: ForecastRequest) -> Response:
     """Generate demand forecast for a product"""
+    check_response_format(request.response_format)
+    check_quantiles(request.quantiles)
     try:
-        result = forecaster.predict(
+        result = await compute_executor.run(
+            run_forecast,
             request.historical_sales,
             request.forecast_days,
-            request.model_type
+            request.model_type,
+            request.product_id,
+            forecast_levels(request.quantiles)
         )
         
         # Calculate recommendations
-        avg_predicted = np.mean([p['predicted_quantity'] for p in result['predictions']])
+        forecast = result['forecast']
+        avg_predicted = float(forecast.rounded()[0].mean())
         recommendations = []
         
         if avg_predicted > 20:
@@ -525,105 +4648,175 @@ async def forecast_demand(request: ForecastRequest):
         
         recommendations.append(f"Forecast suggests average daily sales of {round(avg_predicted)} units")
         
-        # Simple accuracy metric (based on recent data variance)
-        recent_sales = request.historical_sales[-7:] if len(request.historical_sales) >= 7 else request.historical_sales
-        if recent_sales:
-            quantities = [s.get('quantity', 0) for s in recent_sales]
+        selection = result.get('model_selection')
+        model_used = result['model_used']
+        
+        # Backtested accuracy when available, else a rough one from recent variance
+        backtested = backtest_accuracy(request.product_id, model_used)
+        quantities = recent_quantities(request.historical_sales, 7)
+        if backtested is not None:
+            accuracy = 1 - min(1, backtested['smape'] / 200)
+        elif len(quantities):
             accuracy = 1 - min(1, np.std(quantities) / (np.mean(quantities) + 1))
         else:
             accuracy = 0.75
         
-        return ForecastResponse(
+        columnar = request.response_format == "columnar"
+        response = ForecastResponse.model_construct(
             product_id=request.product_id,
-            forecast=result['predictions'],
-            confidence_intervals=[{
-                'date': p['date'],
-                'lower': p['lower_bound'],
-                'upper': p['upper_bound']
-            } for p in result['predictions']],
+            forecast=forecast.payload(request.response_format, request.quantiles),
+            confidence_intervals=None if columnar else forecast.intervals(),
             seasonality_patterns=result['seasonality'],
             recommendations=recommendations,
-            model_used=request.model_type if request.model_type != "prophet" or PROPHET_AVAILABLE else "statistical",
+            model_used=model_used,
             accuracy_metrics={
                 'confidence_score': round(accuracy, 2),
-                'model_accuracy': 'estimated'
-            }
+                'model_accuracy': 'backtested' if backtested is not None else 'estimated',
+                **({'backtest': backtested} if backtested is not None else {})
+            },
+            model_selection=selection
+        )
+        return TimedJSONResponse(response.model_dump())
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/forecast/update", response_model=ForecastUpdateResponse)
+async def update_forecast(request: ForecastUpdateRequest):
+    """Apply newly arrived sales days to a product's stored model and re-forecast"""
+    if not request.new_sales and not request.historical_sales:
+        raise HTTPException(status_code=400, detail="new_sales is empty")
+    try:
+        result = await compute_executor.run(
+            run_forecast_update,
+            request.product_id,
+            request.new_sales,
+            request.forecast_days,
+            request.model_type,
+            request.historical_sales
         )
+        return ForecastUpdateResponse(**result)
+    except ExecutorSaturated:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/forecast/global/train")
+async def train_global_forecaster(request: GlobalTrainingRequest):
+    """Train the cross-series global model on a catalog of sales histories"""
+    try:
+        return await bulk_executor.run(run_global_training, request.historical_sales, request.horizon)
+    except ExecutorSaturated:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/forecast/global")
+async def get_global_forecaster():
+    """Currently trained global model"""
+    model = global_models.load()
+    if model is None:
+        raise HTTPException(status_code=404, detail="No global model trained yet")
+    return model.info()
+
+@app.post("/api/backtest")
+async def backtest_models(request: BacktestRequest):
+    """Walk-forward backtest of forecasting models per product (results are cached)"""
+    unknown = set(request.models) - set(BACKTEST_MODELS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown models: {', '.join(sorted(unknown))}")
+    try:
+        results = await run_backtests(request.historical_sales, request.models, request.horizon, request.folds)
+        return {'results': results, 'count': len(results)}
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/backtest/{product_id}")
+async def get_backtest(product_id: str):
+    """Latest cached backtest of a product"""
+    result = backtests.get(product_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Product has not been backtested")
+    return result
+
+@app.post("/api/forecast/binary", response_model=ForecastResponse)
+async def forecast_demand_binary(raw: Request):
+    """Same as /api/forecast, with a msgpack or Arrow IPC request body"""
+    payload, sales = await decode_binary_request(raw)
+    request = parse_binary_request(ForecastRequest, payload)
+    request.historical_sales = sales.get('', SalesColumns.from_arrays([], []))
+    return await forecast_demand(request)
+
+@app.post("/api/demand-forecast/binary", response_model=DemandForecastResponse)
+async def bulk_demand_forecast_binary(raw: Request):
+    """Same as /api/demand-forecast, with a msgpack or Arrow IPC request body"""
+    payload, sales = await decode_binary_request(raw)
+    request = parse_binary_request(DemandForecastRequest, payload)
+    request.historical_sales = sales
+    return await bulk_demand_forecast(request)
+
 @app.post("/api/demand-forecast", response_model=DemandForecastResponse)
 async def bulk_demand_forecast(request: DemandForecastRequest):
     """Generate forecasts for multiple product variants"""
-    forecasts = []
-    reorder_recs = []
-    demand_trends = {}
-    seasonal_index = {}
+    check_response_format(request.response_format)
+    check_quantiles(request.quantiles, request.service_level)
+    results = await run_variant_forecasts(request)
+    summaries = [
+        summarize_variant_forecast(variant, result, request.response_format, request.quantiles, request.service_level)
+        for variant, result in zip(request.product_variants, results)
+    ]
+    # Built as plain data and written by orjson; no per-day model validation
+    return TimedJSONResponse(build_bulk_response(summaries))
+
+@app.post("/api/demand-forecast/stream")
+async def bulk_demand_forecast_stream(request: DemandForecastRequest):
+    """Bulk forecast streamed as NDJSON, one line per variant as it completes"""
+    check_response_format(request.response_format)
+    check_quantiles(request.quantiles, request.service_level)
+    bulk_executor.check_capacity()
+    return StreamingResponse(stream_bulk_forecast(request), media_type="application/x-ndjson")
+
+@app.post("/api/jobs/demand-forecast", response_model=JobSubmissionResponse, status_code=202)
+async def submit_demand_forecast_job(request: DemandForecastRequest):
+    """Queue a bulk demand forecast and return its job id immediately"""
+    check_response_format(request.response_format)
+    check_quantiles(request.quantiles, request.service_level)
+    job_id = job_store.create('demand-forecast', total=len(request.product_variants))
+    task = asyncio.create_task(run_demand_forecast_job(job_id, request))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
     
-    for variant in request.product_variants:
-        variant_id = variant.get('id', 'unknown')
-        sales_key = variant.get('sku', variant_id)
-        historical = request.historical_sales.get(sales_key, [])
-        
-        # Get forecast
-        result = forecaster.predict(historical, request.forecast_days)
-        avg_demand = np.mean([p['predicted_quantity'] for p in result['predictions']])
-        
-        # Add to forecasts
-        forecasts.append({
-            'variant_id': variant_id,
-            'name': variant.get('name', 'Unknown'),
-            'forecast': result['predictions'],
-            'avg_daily_demand': round(avg_demand, 1)
-        })
-        
-        # Reorder recommendation
-        current_stock = variant.get('stock', 0)
-        days_of_stock = current_stock / avg_demand if avg_demand > 0 else 999
-        
-        if days_of_stock < 14:
-            reorder_recs.append({
-                'variant_id': variant_id,
-                'current_stock': current_stock,
-                'days_remaining': round(days_of_stock, 1),
-                'recommended_order_quantity': round(avg_demand * 21),  # 3 weeks
-                'priority': 'high' if days_of_stock < 7 else 'medium'
-            })
-        
-        # Trend detection
-        if len(result['predictions']) >= 7:
-            recent_avg = np.mean([p['predicted_quantity'] for p in result['predictions'][:7]])
-            older_avg = np.mean([p['predicted_quantity'] for p in result['predictions'][7:14]])
-            
-            if recent_avg > older_avg * 1.1:
-                trend = 'increasing'
-            elif recent_avg < older_avg * 0.9:
-                trend = 'decreasing'
-            else:
-                trend = 'stable'
-            
-            demand_trends[variant_id] = trend
-        
-        # Seasonal index (simple)
-        seasonal_index[variant_id] = round(1.0 + (np.random.random() - 0.5) * 0.2, 2)
-    
-    return DemandForecastResponse(
-        forecasts=forecasts,
-        reorder_recommendations=reorder_recs,
-        demand_trends=demand_trends,
-        seasonal_index=seasonal_index,
-        stock_optimization={
-            'total_variants': len(forecasts),
-            'low_stock_alerts': len([r for r in reorder_recs if r['priority'] == 'high']),
-            'optimization_score': 85 + np.random.random() * 10
-        }
+    return JobSubmissionResponse(
+        job_id=job_id,
+        status='queued',
+        status_url=f"/api/jobs/{job_id}"
     )
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, include_partial: bool = True):
+    """Job status, progress and (partial) results"""
+    job = job_store.get(job_id, include_items=include_partial)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found or expired")
+    return job
+
 @app.post("/api/price-optimize", response_model=PriceOptimizationResponse)
-async def optimize_price(request: PriceOptimizationRequest):
+async def optimize_price_cached(request: PriceOptimizationRequest, raw: Request):
+    """Get optimal price recommendation (cached, with ETag revalidation)"""
+    return await cached_response(raw, request, lambda: optimize_price(request))
+
+async def optimize_price(request: PriceOptimizationRequest) -> PriceOptimizationResponse:
     """Get optimal price recommendation"""
     try:
-        result = optimizer.optimize_price(
+        result = await compute_executor.run(
+            run_price_optimization,
             request.current_price,
             request.cost_price,
             request.historical_sales
@@ -637,51 +4830,212 @@ async def optimize_price(request: PriceOptimizationRequest):
             revenue_projection=result['revenue_projection'],
             confidence=result['confidence']
         )
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/price-optimize/batch", response_model=BatchPriceOptimizationResponse)
+async def optimize_prices_batch(request: BatchPriceOptimizationRequest):
+    """Optimal prices for many products in one vectorized pass"""
+    try:
+        results = await compute_executor.run(
+            run_batch_price_optimization,
+            [(p.current_price, p.cost_price, p.historical_sales) for p in request.products]
+        )
+        
+        return BatchPriceOptimizationResponse(
+            results=[
+                PriceOptimizationResponse(product_id=product.product_id, **result)
+                for product, result in zip(request.products, results)
+            ],
+            count=len(results)
+        )
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/customer-segmentation", response_model=CustomerSegmentationResponse)
-async def segment_customers(request: CustomerSegmentationRequest):
+async def segment_customers_cached(request: CustomerSegmentationRequest, raw: Request):
+    """Segment customers; RFM results are cached (with ETag revalidation)"""
+    if request.mode != "rfm":
+        # Cluster mode may train or update the shared model
+        return await segment_customers(request)
+    return await cached_response(raw, request, lambda: segment_customers(request))
+
+async def segment_customers(request: CustomerSegmentationRequest) -> CustomerSegmentationResponse:
     """Segment customers using RFM analysis"""
+    if request.mode not in ("rfm", "cluster"):
+        raise HTTPException(status_code=400, detail=f"Unknown segmentation mode '{request.mode}'")
+    rules = validate_segment_rules(request.segment_rules)
+    
     try:
-        result = segmenter.segment(request.customers)
+        if request.mode == "cluster":
+            result = await compute_executor.run(
+                run_cluster_segmentation, request.customers, request.n_clusters,
+                request.retrain, request.update_model
+            )
+        else:
+            result = await compute_executor.run(run_segmentation, request.customers, rules)
         
         return CustomerSegmentationResponse(
             segments=result['segments'],
             segment_characteristics=result['segment_characteristics'],
-            marketing_recommendations=result['marketing_recommendations']
+            marketing_recommendations=result['marketing_recommendations'],
+            model=result.get('model')
         )
+    except ExecutorSaturated:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/seasonality")
-async def get_seasonality_analysis():
-    """Get seasonal patterns for the business"""
-    month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                   'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-    
-    # Simulated seasonal indices (should be calculated from real data)
-    seasonal_indices = {
-        'overall': {month: round(0.8 + np.random.random() * 0.4, 2) for month in month_names},
-        'by_category': {
-            'bracelets': {month: round(0.9 + np.random.random() * 0.3, 2) for month in month_names},
-            'tshirts': {month: round(0.7 + np.random.random() * 0.5, 2) for month in month_names}
+@app.post("/api/customer-segmentation/stream", response_model=StreamingSegmentationResponse)
+async def segment_customers_stream(raw: Request, chunk_size: int = SEGMENT_CHUNK_SIZE,
+                                   segment_rules: Optional[str] = None):
+    """Segment an NDJSON body of customers in bounded memory
+    
+    The body is spooled to a temporary file so both passes can re-read it;
+    segment_rules may be passed as a JSON-encoded query parameter.
+    """
+    try:
+        parsed = None if segment_rules is None else [SegmentRule.model_validate(r) for r in json.loads(segment_rules)]
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid segment_rules: {e}")
+    rules = validate_segment_rules(parsed)
+    
+    fd, spool_path = tempfile.mkstemp(suffix='.ndjson', prefix='ml-customers-')
+    try:
+        with os.fdopen(fd, 'wb') as spool:
+            async for block in raw.stream():
+                spool.write(block)
+        
+        result = await compute_executor.run(
+            run_streaming_segmentation, spool_path, 'ndjson', max(chunk_size, 1000), rules
+        )
+        return StreamingSegmentationResponse(**result)
+    except ExecutorSaturated:
+        raise
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid NDJSON line: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.remove(spool_path)
+
+@app.post("/api/customer-segmentation/file", response_model=StreamingSegmentationResponse)
+async def segment_customers_file(request: CustomerFileSegmentationRequest):
+    """Segment customers from a local CSV, Parquet or NDJSON file under ML_DATA_DIR"""
+    rules = validate_segment_rules(request.segment_rules)
+    try:
+        path = resolve_data_path(request.path)
+        output_path = resolve_data_path(request.output_path) if request.output_path else None
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"File '{request.path}' not found")
+    
+    try:
+        result = await compute_executor.run(
+            run_streaming_segmentation, path, customer_file_format(path, request.format),
+            request.chunk_size, rules, output_path
+        )
+        return StreamingSegmentationResponse(**result, assignments_path=request.output_path)
+    except ExecutorSaturated:
+        raise
+    except PayloadUnsupported as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/customer-segmentation/clusters/train")
+async def train_customer_clusters(request: ClusterTrainingRequest):
+    """Train the behavioral cluster model from a local customer file under ML_DATA_DIR"""
+    try:
+        path = resolve_data_path(request.path)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"File '{request.path}' not found")
+    
+    try:
+        return await compute_executor.run(
+            run_cluster_training, path, customer_file_format(path, request.format),
+            request.chunk_size, request.n_clusters, request.epochs
+        )
+    except ExecutorSaturated:
+        raise
+    except PayloadUnsupported as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/customer-segmentation/clusters")
+async def get_customer_clusters():
+    """Current behavioral cluster model and its centroids"""
+    model = clusterer.store.load()
+    if model is None:
+        raise HTTPException(status_code=404, detail="No cluster model trained yet")
+    centroids = model.centroids()
+    return {
+        **model.info(),
+        'centroids': {
+            f"Cluster {label + 1}": {feature: round(float(value), 2) for feature, value in zip(CLUSTER_FEATURES, center)}
+            for label, center in enumerate(centroids)
         }
     }
+
+@app.get("/api/seasonality")
+async def get_seasonality_analysis_cached(raw: Request, variant_id: Optional[str] = None):
+    """Get seasonal patterns (cached until the table changes, with ETag revalidation)"""
+    return await cached_response(
+        raw, {'variant_id': variant_id}, lambda: get_seasonality_analysis(variant_id), (file_version(seasonality.path),)
+    )
+
+async def get_seasonality_analysis(variant_id: Optional[str] = None) -> Dict[str, Any]:
+    """Get seasonal patterns for the business, from the precomputed seasonality table"""
+    seasonal_indices = seasonality.summary(variant_id)
+    overall = seasonal_indices['overall']
+    if overall is None:
+        return {
+            'seasonal_indices': seasonal_indices,
+            'peak_seasons': [],
+            'recommendations': ['Ingest sales history via /api/seasonality/ingest to compute seasonal indices']
+        }
     
-    # Peak seasons
-    peak_months = [6, 7, 8, 11, 12]  # Summer + Holiday season
+    monthly = overall['monthly']
+    peak_months = [month for month, index in monthly.items() if index >= 1.1]
+    slow_months = [month for month, index in monthly.items() if index <= 0.9]
+    recommendations = []
+    if peak_months:
+        top = max(monthly.values())
+        recommendations.append(f"Increase inventory for peak months ({', '.join(peak_months)}); "
+                               f"busiest month needs {top:.1f}x normal inventory")
+    if slow_months:
+        recommendations.append(f"Plan promotions for slower months ({', '.join(slow_months)})")
+    if not recommendations:
+        recommendations.append('Demand is flat across the year; keep inventory levels steady')
     
     return {
         'seasonal_indices': seasonal_indices,
-        'peak_seasons': ['Summer (Jun-Aug)', 'Holiday Season (Nov-Dec)'],
-        'recommendations': [
-            'Increase inventory for summer months',
-            'Plan promotions for slower months (Jan-Feb)',
-            'Holiday season requires 2x normal inventory'
-        ]
+        'peak_seasons': peak_months,
+        'recommendations': recommendations
     }
 
+@app.post("/api/seasonality/ingest")
+async def ingest_seasonality(request: SeasonalityIngestRequest):
+    """Fold new sales days into the seasonality table"""
+    try:
+        return await compute_executor.run(run_seasonality_ingest, request.historical_sales, request.categories)
+    except ExecutorSaturated:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ============================================================================
 # Main
 # ============================================================================
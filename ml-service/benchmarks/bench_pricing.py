@@ -0,0 +1,70 @@
+"""
+Benchmark: batch price optimization
+
+Times PriceOptimizer.optimize_prices (vectorized, all products at once)
+against calling optimize_price once per product, and checks both agree.
+
+Run with: python benchmarks/bench_pricing.py [--products 10000] [--days 60]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import PriceOptimizer  # noqa: E402
+
+
+def make_products(n: int, days: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    products = []
+    for i in range(n):
+        current = float(rng.uniform(5, 80))
+        cost = current * float(rng.uniform(0.3, 0.7))
+        elasticity = float(rng.uniform(-2.5, -0.3))
+        if i % 50 == 0:
+            history = []  # no sales yet
+        else:
+            prices = current * rng.uniform(0.8, 1.2, days)
+            if i % 50 == 1:
+                prices[:] = current  # no price variation
+            demand = 200 * prices ** elasticity * rng.lognormal(0, 0.1, days)
+            history = [{'price': float(p), 'quantity': max(1, int(q))} for p, q in zip(prices, demand)]
+        products.append((current, cost, history))
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch price optimization benchmark")
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--single-sample', type=int, default=1_000,
+                        help="products timed through optimize_price (extrapolated)")
+    args = parser.parse_args()
+    
+    optimizer = PriceOptimizer()
+    products = make_products(args.products, args.days)
+    
+    start = time.perf_counter()
+    batch = optimizer.optimize_prices(products)
+    batch_seconds = time.perf_counter() - start
+    
+    sample = products[:args.single_sample]
+    start = time.perf_counter()
+    single = [optimizer.optimize_price(*product) for product in sample]
+    single_seconds = (time.perf_counter() - start) * len(products) / len(sample)
+    
+    mismatches = sum(1 for a, b in zip(single, batch) if a != b)
+    print(f"products:            {len(products)} x {args.days} days")
+    print(f"optimize_prices:     {batch_seconds:.3f}s")
+    print(f"optimize_price loop: {single_seconds:.3f}s (extrapolated from {len(sample)})")
+    print(f"speedup:             {single_seconds / batch_seconds:.0f}x")
+    print(f"mismatches:          {mismatches} / {len(sample)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: RFM segment assignment
+
+Compares CustomerSegmenter.segment (integer scores + 125-entry lookup
+table) with the previous string-building implementation, and asserts the
+two produce identical output.
+
+Run with: python benchmarks/bench_segmentation.py [--sizes 10000 100000 300000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import CustomerSegmenter  # noqa: E402
+
+
+def segment_strings(customers):
+    """String/lambda implementation the lookup table replaced (segments only)"""
+    rfm_data = []
+    for customer in customers:
+        rfm_data.append({
+            'customer_id': customer.get('id', 'unknown'),
+            'recency': customer.get('days_since_last_order', 365),
+            'frequency': customer.get('order_count', 0),
+            'monetary': customer.get('total_spent', 0)
+        })
+    df = pd.DataFrame(rfm_data)
+    
+    df['R_score'] = pd.qcut(df['recency'], q=5, labels=[5, 4, 3, 2, 1], duplicates='drop')
+    df['F_score'] = pd.qcut(df['frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5])
+    df['M_score'] = pd.qcut(df['monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5])
+    df['RFM_score'] = df['R_score'].astype(str) + df['F_score'].astype(str) + df['M_score'].astype(str)
+    
+    segment_rules = {
+        'Champions': lambda x: x.startswith(('555', '554', '545', '455')),
+        'Loyal Customers': lambda x: x[1] in ('4', '5') and x[2] in ('4', '5'),
+        'Potential Loyalists': lambda x: x[0] in ('4', '5') and x[1] in ('3', '4'),
+        'At Risk': lambda x: x[0] in ('1', '2') and x[1] in ('3', '4', '5'),
+        'Hibernating': lambda x: x[0] in ('1', '2') and x[1] in ('1', '2')
+    }
+    
+    def get_segment(score):
+        for segment, rule in segment_rules.items():
+            if rule(score):
+                return segment
+        return 'Needs Attention'
+    
+    df['segment'] = df['RFM_score'].apply(get_segment)
+    segments = df.groupby('segment').agg({
+        'customer_id': 'count', 'recency': 'mean', 'frequency': 'mean', 'monetary': 'mean'
+    }).reset_index()
+    return [{
+        'name': row['segment'],
+        'count': int(row['customer_id']),
+        'avg_recency_days': round(float(row['recency']), 1),
+        'avg_orders': round(float(row['frequency']), 1),
+        'avg_spent': round(float(row['monetary']), 2)
+    } for _, row in segments.iterrows()]
+
+
+def make_customers(n, seed=42):
+    rng = np.random.default_rng(seed)
+    return [
+        {'id': f'c{i}', 'days_since_last_order': int(r), 'order_count': int(f), 'total_spent': round(float(m), 2)}
+        for i, (r, f, m) in enumerate(zip(
+            rng.integers(0, 730, n), rng.poisson(4, n), rng.lognormal(5, 1, n)
+        ))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RFM segmentation benchmark")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 300_000])
+    args = parser.parse_args()
+    
+    segmenter = CustomerSegmenter()
+    print(f"{'customers':>10}  {'strings (s)':>12}  {'lookup (s)':>11}  {'speedup':>8}  match")
+    for n in args.sizes:
+        customers = make_customers(n)
+        
+        start = time.perf_counter()
+        expected = segment_strings(customers)
+        legacy = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        actual = segmenter.segment(customers)['segments']
+        lookup = time.perf_counter() - start
+        
+        assert actual == expected, f"segment mismatch at n={n}"
+        print(f"{n:>10}  {legacy:>12.3f}  {lookup:>11.3f}  {legacy / lookup:>7.1f}x  yes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Start-up benchmark: import time and first-request latency
+
+Each scenario runs in a fresh interpreter so module imports are cold:
+  lazy    - default, model backends load on first use
+  warmup  - ML_WARMUP=1, backends load in the background from lifespan
+
+Prints one JSON document with import seconds, peak RSS after import,
+time until /health/ready reports ready, and first-request latencies.
+
+Run with: python benchmarks/bench_startup.py [--repeats 3]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CHILD = r'''
+import json, os, resource, time
+start = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start
+import_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+from fastapi.testclient import TestClient
+
+history = [{'date': f'2024-{m:02d}-{d:02d}', 'quantity': (m * d) % 17 + 1, 'revenue': 10.0}
+           for m in range(1, 13) for d in range(1, 29)]
+result = {'import_seconds': import_seconds, 'import_peak_rss_mb': import_rss_mb}
+
+with TestClient(app.app) as client:
+    t = time.perf_counter()
+    client.get('/health')
+    result['first_health_seconds'] = time.perf_counter() - t
+    
+    if os.environ.get('ML_WARMUP'):
+        t = time.perf_counter()
+        while client.get('/health/ready').status_code != 200 and time.perf_counter() - t < 120:
+            time.sleep(0.05)
+        result['ready_after_seconds'] = time.perf_counter() - t
+    
+    for model_type in ('statistical', 'random_forest'):
+        t = time.perf_counter()
+        response = client.post('/api/forecast', json={
+            'product_id': f'bench-{model_type}', 'historical_sales': history,
+            'forecast_days': 30, 'model_type': model_type
+        })
+        assert response.status_code == 200, response.text
+        result[f'first_{model_type}_seconds'] = time.perf_counter() - t
+
+result['final_peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print('RESULT ' + json.dumps(result))
+'''
+
+SCENARIOS = {
+    'lazy': {},
+    'warmup': {'ML_WARMUP': '1'},
+}
+
+
+def run_scenario(extra_env):
+    env = {k: v for k, v in os.environ.items() if k != 'ML_WARMUP'}
+    env.update(extra_env)
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=SERVICE_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    line = next(l for l in output.splitlines() if l.startswith('RESULT '))
+    return json.loads(line[len('RESULT '):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    
+    report = {}
+    for name, extra_env in SCENARIOS.items():
+        runs = [run_scenario(extra_env) for _ in range(args.repeats)]
+        report[name] = {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
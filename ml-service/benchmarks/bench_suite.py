@@ -0,0 +1,216 @@
+"""
+Benchmark suite: DemandForecaster, PriceOptimizer, CustomerSegmenter and the HTTP routes
+
+Every case runs on seeded synthetic data (benchmarks/synthetic.py), once
+untimed to warm lazy imports and caches, then --repeats timed iterations,
+then once more under tracemalloc for its peak Python/numpy allocation.
+Routes are called in-process through FastAPI's TestClient.
+
+Prints (or writes with --output) one JSON document with throughput, p50/p99
+latency and peak memory per case. With --baseline, cases whose p50 grew by
+more than --tolerance against an earlier report are listed and the exit
+status is 1.
+
+Run with: python benchmarks/bench_suite.py [--scale small|medium|large] [--only forecast]
+          [--output report.json] [--baseline previous.json]
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+# Keep persisted state (model stores, job database) out of the real state directory
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-bench-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+# Repeated identical requests would otherwise be answered from the response cache
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+# The service logs with print; keep stdout for the JSON report
+with contextlib.redirect_stdout(sys.stderr):
+    import app  # noqa: E402
+import synthetic  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+SCALES = {
+    'small': {'series': 20, 'days': 120, 'customers': 5_000, 'products': 200, 'price_days': 60, 'repeats': 5},
+    'medium': {'series': 200, 'days': 365, 'customers': 50_000, 'products': 2_000, 'price_days': 90, 'repeats': 10},
+    'large': {'series': 2_000, 'days': 730, 'customers': 300_000, 'products': 10_000, 'price_days': 180, 'repeats': 10},
+}
+
+
+def measure(fn, items, repeats):
+    """Latency percentiles, throughput and tracemalloc peak of fn()"""
+    fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    return {
+        'items': items,
+        'repeats': repeats,
+        'throughput_per_s': round(items * repeats / latencies.sum(), 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+        'peak_mem_mb': round(peak / 2 ** 20, 2)
+    }
+
+
+def expect_ok(response):
+    assert response.status_code == 200, f"{response.status_code}: {response.text[:200]}"
+    return response
+
+
+def library_cases(config):
+    """(name, items, fn) for direct calls into the service classes"""
+    forecaster, optimizer, segmenter = app.forecaster, app.optimizer, app.segmenter
+    rng = np.random.default_rng(config['seed'])
+    history = synthetic.sales_history(rng, config['days'])
+    histories = synthetic.sales_histories(config['series'], config['days'], seed=config['seed'])
+    products = synthetic.price_products(config['products'], config['price_days'], seed=config['seed'])
+    product_args = [(p['current_price'], p['cost_price'], p['historical_sales']) for p in products]
+    customers = synthetic.customers(config['customers'], seed=config['seed'])
+
+    cases = [('forecaster.prepare_data', 1, lambda: forecaster.prepare_data(history))]
+    for model_type in ('statistical', 'random_forest', 'auto'):
+        # No product_id: every call fits, nothing is served from the model cache
+        cases.append((f'forecaster.predict[{model_type}]', 1,
+                      lambda model_type=model_type: forecaster.predict(history, 30, model_type)))
+    cases += [
+        ('forecaster.statistical_batch', len(histories),
+         lambda: app.run_statistical_batch(list(histories.values()), 30)),
+        ('optimizer.optimize_price', 1, lambda: optimizer.optimize_price(*product_args[0])),
+        ('optimizer.optimize_prices', len(product_args), lambda: optimizer.optimize_prices(product_args)),
+        ('segmenter.segment', len(customers), lambda: segmenter.segment(customers)),
+    ]
+    return cases
+
+
+def route_cases(client, config):
+    """(name, items, fn) for HTTP routes called through the test client"""
+    rng = np.random.default_rng(config['seed'] + 1)
+    history = synthetic.sales_history(rng, config['days'])
+    histories = synthetic.sales_histories(config['series'], config['days'], seed=config['seed'] + 1)
+    variants = synthetic.product_variants(histories, seed=config['seed'])
+    products = synthetic.price_products(config['products'], config['price_days'], seed=config['seed'] + 1)
+    customers = synthetic.customers(config['customers'], seed=config['seed'] + 1)
+    fresh_ids = (f'bench-{i}' for i in itertools.count())
+
+    def forecast(product_id):
+        return expect_ok(client.post('/api/forecast', json={
+            'product_id': product_id, 'historical_sales': history, 'forecast_days': 30, 'model_type': 'statistical'
+        }))
+
+    bulk = {'product_variants': variants, 'historical_sales': histories, 'forecast_days': 30,
+            'model_type': 'statistical'}
+    return [
+        ('GET /health', 1, lambda: expect_ok(client.get('/health'))),
+        ('POST /api/forecast[fit]', 1, lambda: forecast(next(fresh_ids))),
+        ('POST /api/forecast[cached model]', 1, lambda: forecast('bench-cached')),
+        ('POST /api/demand-forecast', len(variants), lambda: expect_ok(client.post('/api/demand-forecast', json=bulk))),
+        ('POST /api/price-optimize', 1, lambda: expect_ok(client.post('/api/price-optimize', json=products[0]))),
+        ('POST /api/price-optimize/batch', len(products),
+         lambda: expect_ok(client.post('/api/price-optimize/batch', json={'products': products}))),
+        ('POST /api/customer-segmentation', len(customers),
+         lambda: expect_ok(client.post('/api/customer-segmentation', json={'customers': customers}))),
+        ('GET /metrics', 1, lambda: expect_ok(client.get('/metrics'))),
+    ]
+
+
+def compare(results, baseline_path, tolerance):
+    """Cases whose p50 latency regressed by more than tolerance against a baseline report"""
+    with open(baseline_path) as f:
+        baseline = {case['name']: case for case in json.load(f)['results']}
+    regressions = []
+    for case in results:
+        before = baseline.get(case['name'])
+        if before and case['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append({'name': case['name'], 'baseline_p50_ms': before['p50_ms'],
+                                'p50_ms': case['p50_ms'], 'ratio': round(case['p50_ms'] / before['p50_ms'], 2)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--series', type=int, help="variants in bulk cases")
+    parser.add_argument('--days', type=int, help="days of sales history per series")
+    parser.add_argument('--customers', type=int)
+    parser.add_argument('--products', type=int)
+    parser.add_argument('--repeats', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', help="run only cases whose name contains this text")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON report to check for p50 regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative p50 growth")
+    args = parser.parse_args()
+
+    config = dict(SCALES[args.scale], seed=args.seed)
+    for key in ('series', 'days', 'customers', 'products', 'repeats'):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+
+    results = []
+
+    def run(cases):
+        for name, items, fn in cases:
+            if args.only and args.only not in name:
+                continue
+            print(f"running {name}", file=sys.stderr)
+            results.append({'name': name, **measure(fn, items, config['repeats'])})
+
+    with contextlib.redirect_stdout(sys.stderr):
+        run(library_cases(config))
+        with TestClient(app.app) as client:
+            run(route_cases(client, config))
+
+    report = {
+        'meta': {
+            'scale': args.scale,
+            'config': config,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpu_count': os.cpu_count(),
+            'prophet_available': app.PROPHET_AVAILABLE,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        },
+        'results': results
+    }
+    if args.baseline:
+        report['regressions'] = compare(results, args.baseline, args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Seeded synthetic data for the ML service benchmarks
+
+Every generator takes a seed and returns plain request-shaped Python data
+(lists of dicts), so the same call always yields the same payload. None of
+them produce empty histories: DemandForecaster.prepare_data substitutes
+random mock data for those, which would make timings irreproducible.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+
+END_DATE = date(2025, 6, 30)
+
+
+def sales_history(rng, days, level=None, intermittency=0.0, end=END_DATE):
+    """Daily sales records with trend, weekly and yearly seasonality and Poisson noise
+
+    intermittency is the share of days forced to zero sales.
+    """
+    level = float(rng.gamma(2.0, 8.0)) if level is None else level
+    t = np.arange(days)
+    start = end - timedelta(days=days - 1)
+    weekday = (start.weekday() + t) % 7
+    rate = level * (1 + 0.002 * t) * np.where(weekday >= 5, 1.4, 1.0) * (1 + 0.25 * np.sin(2 * np.pi * t / 365.25))
+    quantity = rng.poisson(rate)
+    if intermittency:
+        quantity[rng.random(days) < intermittency] = 0
+    price = float(rng.uniform(10, 60))
+    return [
+        {'date': (start + timedelta(days=int(i))).isoformat(), 'quantity': int(q), 'revenue': round(float(q) * price, 2)}
+        for i, q in enumerate(quantity)
+    ]
+
+
+def sales_histories(n, days, seed=42, intermittent_share=0.2):
+    """{variant id: sales records} for n variants with histories of up to `days` days"""
+    rng = np.random.default_rng(seed)
+    histories = {}
+    for i in range(n):
+        length = int(rng.integers(max(14, days // 3), days + 1))
+        intermittency = 0.7 if rng.random() < intermittent_share else 0.0
+        histories[f'v{i}'] = sales_history(rng, length, intermittency=intermittency)
+    return histories
+
+
+def product_variants(histories, seed=42):
+    """product_variants entries (id and stock) for a sales_histories result"""
+    rng = np.random.default_rng(seed)
+    return [{'id': variant_id, 'name': f'Variant {variant_id}', 'stock': int(rng.integers(0, 200))}
+            for variant_id in histories]
+
+
+def price_history(rng, days, current_price, elasticity):
+    """Price/quantity records around current_price with constant-elasticity demand"""
+    prices = current_price * rng.uniform(0.8, 1.2, days)
+    demand = 200 * prices ** elasticity * rng.lognormal(0, 0.1, days)
+    return [{'price': round(float(p), 2), 'quantity': max(1, int(q))} for p, q in zip(prices, demand)]
+
+
+def price_products(n, days, seed=42):
+    """PriceOptimizationRequest payloads for n products"""
+    rng = np.random.default_rng(seed)
+    products = []
+    for i in range(n):
+        current = round(float(rng.uniform(5, 80)), 2)
+        products.append({
+            'product_id': f'p{i}',
+            'current_price': current,
+            'cost_price': round(current * float(rng.uniform(0.3, 0.7)), 2),
+            'historical_sales': price_history(rng, days, current, float(rng.uniform(-2.5, -0.3))),
+            'competitors_prices': [round(current * float(f), 2) for f in rng.uniform(0.85, 1.15, 3)]
+        })
+    return products
+
+
+def customers(n, seed=42):
+    """Customer RFM records as accepted by /api/customer-segmentation"""
+    rng = np.random.default_rng(seed)
+    return [
+        {'id': f'c{i}', 'days_since_last_order': int(r), 'order_count': int(f), 'total_spent': round(float(m), 2)}
+        for i, (r, f, m) in enumerate(zip(
+            rng.integers(0, 730, n), rng.poisson(4, n) + 1, rng.lognormal(5, 1, n)
+        ))
+    ]
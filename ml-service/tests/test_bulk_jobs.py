@@ -0,0 +1,56 @@
+"""
+Bulk forecasts: executor admission of routed ("auto") requests and job progress
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(app.app) as client:
+        yield client
+
+
+def test_routed_request_takes_one_executor_slot(client, monkeypatch):
+    histories = synthetic.sales_histories(6, 90, seed=7)
+    admissions = []
+    admit = app.bulk_executor.admit
+
+    def counting_admit():
+        admissions.append(app.bulk_executor.pending)
+        return admit()
+
+    monkeypatch.setattr(app.bulk_executor, 'admit', counting_admit)
+    response = client.post('/api/demand-forecast', json={
+        'product_variants': synthetic.product_variants(histories), 'historical_sales': histories,
+        'forecast_days': 7, 'model_type': 'auto'
+    })
+    assert response.status_code == 200
+    assert admissions == [0]
+
+
+def test_job_progress_counts_each_variant_once():
+    store = app.JobStore(os.path.join(tempfile.mkdtemp(prefix='ml-test-'), 'jobs.sqlite3'), ttl_seconds=60)
+    job_id = store.create('demand-forecast', total=2)
+    for index in (0, 1, 0, 1):
+        store.add_item(job_id, index, {'variant_id': f'v{index}'})
+    job = store.get(job_id)
+    assert job['progress'] == {'completed': 2, 'total': 2}
+    assert [item['variant_id'] for item in job['partial_results']] == ['v0', 'v1']
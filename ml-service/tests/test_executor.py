@@ -0,0 +1,59 @@
+"""
+ComputeExecutor admission: queue slots follow the pool jobs, not the awaiting caller
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import app  # noqa: E402
+
+
+def wait_for(event: threading.Event) -> str:
+    event.wait(5)
+    return 'done'
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes():
+    async def scenario():
+        executor = app.ComputeExecutor('test', max_workers=1, max_pending=1)
+        release = threading.Event()
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.run(wait_for, release, timeout=0.05)
+        
+        # The job is still running on the pool, so its slot is still taken
+        assert executor.pending == 1
+        with pytest.raises(app.ExecutorSaturated):
+            await executor.run(wait_for, release)
+        
+        release.set()
+        for _ in range(100):
+            if executor.pending == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert executor.pending == 0
+        assert await executor.run(wait_for, release) == 'done'
+        executor.shutdown()
+    
+    asyncio.run(scenario())
+
+
+def test_as_completed_releases_after_every_job():
+    async def scenario():
+        executor = app.ComputeExecutor('test', max_workers=2, max_pending=1)
+        release = threading.Event()
+        release.set()
+        outcomes = await executor.map(wait_for, [(release,)] * 4, timeout=5)
+        assert outcomes == ['done'] * 4
+        await asyncio.sleep(0.05)
+        assert executor.pending == 0
+        executor.shutdown()
+    
+    asyncio.run(scenario())
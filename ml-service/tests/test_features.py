@@ -0,0 +1,61 @@
+"""
+Columnar calendar features (build_calendar_features) against their per-date definitions
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+
+
+def row_features(date):
+    """One date's features as the row-by-row builder computed them"""
+    return [
+        date.dayofweek / 7.0,
+        date.month / 12.0,
+        date.day / 31.0,
+        int(date.dayofweek >= 5),
+        1 if date.month in [11, 12] else 0,
+    ]
+
+
+def test_calendar_features_match_the_per_date_definition():
+    # Crosses a year end, month ends and a leap day
+    dates = pd.date_range('2023-10-15', '2024-03-15', freq='D')
+    features = app.build_calendar_features(dates)
+    
+    assert features.dtype == np.float32
+    assert features.shape == (len(dates), len(app.CALENDAR_FEATURES))
+    assert np.allclose(features, [row_features(date) for date in dates], atol=1e-6)
+
+
+def test_extract_features_reads_the_date_column_in_order():
+    dates = pd.to_datetime(['2025-12-27', '2025-06-02', '2025-11-01'])
+    df = pd.DataFrame({'date': dates, 'quantity': [1, 2, 3]})
+    features = app.forecaster.extract_features(df)
+    assert np.allclose(features, [row_features(date) for date in dates], atol=1e-6)
+
+
+def test_extra_features_follow_the_calendar_columns():
+    dates = pd.date_range('2025-01-01', periods=4, freq='D')
+    lag = [0.0, 1.0, 2.0, 3.0]
+    features = app.build_calendar_features(dates, {'lag_1': lag, 'promo': np.array([0, 1, 0, 1])})
+    
+    assert features.shape == (4, len(app.CALENDAR_FEATURES) + 2)
+    assert features[:, -2].tolist() == lag
+    assert features[:, -1].tolist() == [0, 1, 0, 1]
+    with pytest.raises(ValueError):
+        app.build_calendar_features(dates, {'short': [1.0, 2.0]})
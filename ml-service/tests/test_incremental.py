@@ -0,0 +1,94 @@
+"""
+Incremental forecast updates (/api/forecast/update)
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+def days(start: date, quantities):
+    return [{'date': (start + timedelta(days=i)).isoformat(), 'quantity': q} for i, q in enumerate(quantities)]
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(app.app) as client:
+        yield client
+
+
+def update(client, product_id, new_sales, historical_sales=None):
+    return client.post('/api/forecast/update', json={
+        'product_id': product_id, 'new_sales': new_sales, 'historical_sales': historical_sales,
+        'forecast_days': 7, 'model_type': 'statistical'
+    })
+
+
+def test_empty_new_sales_leave_stored_state_untouched(client):
+    seed = days(date(2025, 1, 1), [5 + i % 3 for i in range(29)])
+    assert update(client, 'empty-update', [], seed).json()['history_length'] == 29
+    
+    response = update(client, 'empty-update', [])
+    assert response.status_code == 400  # endpoint guard: nothing to apply, nothing to seed from
+    
+    body = update(client, 'empty-update', [], seed).json()
+    assert (body['history_length'], body['days_applied'], body['last_date']) == (29, 0, '2025-01-29')
+
+
+def test_initialization_without_sales_is_rejected():
+    with pytest.raises(ValueError):
+        app.incremental.update('never-seeded', [], 7, 'statistical', historical_sales=[])
+
+
+def test_statistical_updates_match_a_full_refit(client):
+    quantities = [10 + (i * 7) % 5 + i // 10 for i in range(60)]
+    history = days(date(2025, 3, 1), quantities)
+    update(client, 'incremental-refit', history[40:], history[:40])
+    for chunk in (history[40:45], history[45:52], history[52:]):
+        body = update(client, 'incremental-refit', chunk).json()
+    
+    assert body['history_length'] == 60
+    state = app.incremental.store.load('incremental-refit', 'statistical')
+    refit = app.forecaster.fit_statistical(app.forecaster.prepare_data(history))
+    assert state.trend() == pytest.approx(refit)
+    full = app.forecaster.predict(history, 7, 'statistical')['forecast'].records()
+    assert body['forecast'] == full
+
+
+def test_only_days_after_the_last_seen_date_are_applied(client):
+    history = days(date(2025, 5, 1), [4, 5, 6, 7, 8, 9, 10])
+    update(client, 'incremental-overlap', history)
+    
+    overlap = history[-3:] + days(date(2025, 5, 8), [11, 12])
+    body = update(client, 'incremental-overlap', overlap).json()
+    assert (body['days_applied'], body['days_ignored']) == (2, 3)
+    assert (body['history_length'], body['last_date']) == (9, '2025-05-09')
+    
+    body = update(client, 'incremental-overlap', overlap).json()
+    assert (body['days_applied'], body['days_ignored']) == (0, 5)
+
+
+def test_forest_updates_keep_the_tree_count_bounded():
+    history = days(date(2025, 1, 1), [5 + i % 7 for i in range(120)])
+    app.incremental.update('incremental-forest', history[:90], 7, 'random_forest')
+    for start in range(90, 120, 5):
+        result = app.incremental.update('incremental-forest', history[start:start + 5], 7, 'random_forest')
+    
+    state = app.incremental.store.load('incremental-forest', 'random_forest')
+    assert len(state.model.estimators_) <= app.FOREST_MAX_TREES
+    assert len(state.window) <= app.FOREST_WINDOW_DAYS
+    assert result['history_length'] == 120 and len(result['forecast']) == 7
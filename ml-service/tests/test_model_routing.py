@@ -0,0 +1,80 @@
+"""
+model_type "auto": what the router compares and how costs are measured
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def trained_global_store(histories):
+    store = app.GlobalModelStore(os.path.join(tempfile.mkdtemp(prefix='ml-test-'), 'global.pkl'))
+    values, dates = app.pack_series([app.forecaster.prepare_data(h) for h in histories])
+    store.save(app.train_global_model(values, dates, horizon=14))
+    return store
+
+
+def test_global_holdout_wape_is_not_scored_as_product_smape(monkeypatch):
+    histories = list(synthetic.sales_histories(12, 120, seed=3, intermittent_share=0).values())
+    store = trained_global_store(histories)
+    assert store.load().validation_wape is not None
+    monkeypatch.setattr(app.forecaster, 'global_models', store)
+    
+    assert 'global' not in app.forecaster.model_scores('never-backtested')
+    selection = app.forecaster.select_model(app.forecaster.prepare_data(histories[0]), 'never-backtested')
+    assert selection['model'] == 'statistical'
+    assert selection['reason'].startswith('no backtest scores yet')
+
+
+def test_global_model_backtests_per_product_on_smape(monkeypatch):
+    histories = list(synthetic.sales_histories(12, 120, seed=4, intermittent_share=0).values())
+    monkeypatch.setattr(app, 'global_models', trained_global_store(histories))
+    
+    history = histories[0]
+    errors = app.run_backtest_fold(history, 'global', len(history) - 14, 14)
+    metrics = app.combine_folds([errors])
+    assert 0 <= metrics['smape'] <= 200
+
+
+class RecordedCosts:
+    def __init__(self):
+        self.calls = []
+    
+    def record(self, model, seconds, series=1):
+        self.calls.append(model)
+
+
+def test_model_cost_is_recorded_only_when_a_model_is_fitted(monkeypatch):
+    costs = RecordedCosts()
+    monkeypatch.setattr(app, 'model_costs', costs)
+    history = synthetic.sales_history(np.random.default_rng(5), 90)
+    
+    app.forecaster.predict(history, days=7, model_type='random_forest', product_id='cost-fit')
+    assert costs.calls == ['random_forest']
+    app.forecaster.predict(history, days=7, model_type='random_forest', product_id='cost-fit')
+    assert costs.calls == ['random_forest']
+
+
+def test_model_costs_are_shared_through_the_state_file():
+    path = os.path.join(tempfile.mkdtemp(prefix='ml-test-'), 'model-costs.json')
+    writer = app.ModelCostTracker(path)
+    reader = app.ModelCostTracker(path, refresh_seconds=0)
+    writer.record('prophet', 1.0)  # dropped as the cold first measurement
+    writer.record('prophet', 0.5)
+    
+    assert writer.expected('prophet') == 0.8 * 3000.0 + 0.2 * 500.0
+    assert reader.expected('prophet') == writer.expected('prophet')
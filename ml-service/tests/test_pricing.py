@@ -0,0 +1,49 @@
+"""
+Batch price optimization (PriceOptimizer.optimize_prices) against the per-product optimum
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def test_batch_optimum_matches_the_per_product_grid_search():
+    optimizer = app.PriceOptimizer()
+    products = [(p['current_price'], p['cost_price'], p['historical_sales'])
+                for p in synthetic.price_products(40, 60, seed=11)]
+    # Demo default, too few days, no price variation
+    products += [
+        (20.0, 8.0, []),
+        (20.0, 8.0, [{'price': 19.0, 'quantity': 5}, {'price': 21.0, 'quantity': 4}]),
+        (20.0, 8.0, [{'price': 20.0, 'quantity': q} for q in (5, 6, 7, 8)]),
+    ]
+    
+    batch = optimizer.optimize_prices(products)
+    single = [optimizer.optimize_price(*product) for product in products]
+    assert batch == single
+    elasticities = [result['price_elasticity'] for result in batch[:40]]
+    assert min(elasticities) < -1 < max(elasticities)  # both ends of the search range are exercised
+
+
+def test_unit_elasticity_falls_back_to_the_grid():
+    prices = np.linspace(8.0, 12.0, 9)
+    history = [{'price': float(p), 'quantity': float(100 / p)} for p in prices]
+    result = app.PriceOptimizer().optimize_prices([(10.0, 4.0, history)])[0]
+    
+    assert result['price_elasticity'] == -1.0
+    assert 4.4 <= result['optimal_price'] <= 20.0
+    assert result['revenue_projection']['optimal'] == result['revenue_projection']['current']
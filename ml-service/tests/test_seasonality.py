@@ -0,0 +1,48 @@
+"""
+Seasonality table: random forests trained on it are refitted when it changes
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def ingest(index, product_id, history):
+    dates = np.array([sale['date'] for sale in history], dtype='datetime64[D]')
+    index.ingest({product_id: (dates, np.array([sale['quantity'] for sale in history], dtype=float))})
+
+
+def test_random_forest_is_refitted_when_the_seasonality_table_changes(monkeypatch):
+    index = app.SeasonalityIndex(os.path.join(tempfile.mkdtemp(prefix='ml-test-'), 'seasonality.pkl'))
+    monkeypatch.setattr(app.forecaster, 'seasonality', index)
+    fits = []
+    fit = app.forecaster.fit_random_forest
+    
+    def counted_fit(df, product_id=None):
+        fits.append(product_id)
+        return fit(df, product_id)
+    monkeypatch.setattr(app.forecaster, 'fit_random_forest', counted_fit)
+    
+    history = synthetic.sales_history(np.random.default_rng(7), 120)
+    ingest(index, 'rf-seasonal', history[:60])
+    app.forecaster.predict(history, days=7, model_type='random_forest', product_id='rf-seasonal')
+    app.forecaster.predict(history, days=7, model_type='random_forest', product_id='rf-seasonal')
+    assert len(fits) == 1
+    
+    ingest(index, 'rf-seasonal', history[60:])
+    app.forecaster.predict(history, days=7, model_type='random_forest', product_id='rf-seasonal')
+    assert len(fits) == 2
@@ -0,0 +1,86 @@
+"""
+RFM segment lookup table against the score-string rules it replaced
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+import synthetic  # noqa: E402
+
+STRING_RULES = {
+    'Champions': lambda x: x.startswith(('555', '554', '545', '455')),
+    'Loyal Customers': lambda x: x[1] in ('4', '5') and x[2] in ('4', '5'),
+    'Potential Loyalists': lambda x: x[0] in ('4', '5') and x[1] in ('3', '4'),
+    'At Risk': lambda x: x[0] in ('1', '2') and x[1] in ('3', '4', '5'),
+    'Hibernating': lambda x: x[0] in ('1', '2') and x[1] in ('1', '2')
+}
+
+
+def string_segment(code):
+    for segment, rule in STRING_RULES.items():
+        if rule(code):
+            return segment
+    return 'Needs Attention'
+
+
+def test_lookup_table_matches_the_string_rules_for_every_score():
+    lut, names = app.build_segment_lut(app.DEFAULT_SEGMENT_RULES)
+    r, f, m = (np.array(scores, dtype=np.int16) for scores in zip(
+        *[(r, f, m) for r in range(1, 6) for f in range(1, 6) for m in range(1, 6)]
+    ))
+    segments = [names[i] for i in app.assign_segments(r, f, m, lut)]
+    assert segments == [string_segment(f"{a}{b}{c}") for a, b, c in zip(r, f, m)]
+    
+    unscored = app.assign_segments(np.array([0]), np.array([3]), np.array([3]), lut)
+    assert names[unscored[0]] == app.DEFAULT_SEGMENT
+
+
+def test_segment_summary_matches_the_string_implementation():
+    customers = synthetic.customers(2_000, seed=5)
+    df = pd.DataFrame({
+        'customer_id': [c['id'] for c in customers],
+        'recency': [c['days_since_last_order'] for c in customers],
+        'frequency': [c['order_count'] for c in customers],
+        'monetary': [c['total_spent'] for c in customers]
+    })
+    r = pd.qcut(df['recency'], q=5, labels=[5, 4, 3, 2, 1], duplicates='drop').astype(str)
+    f = pd.qcut(df['frequency'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5]).astype(str)
+    m = pd.qcut(df['monetary'].rank(method='first'), q=5, labels=[1, 2, 3, 4, 5]).astype(str)
+    df['segment'] = (r + f + m).apply(string_segment)
+    expected = df.groupby('segment').agg({
+        'customer_id': 'count', 'recency': 'mean', 'frequency': 'mean', 'monetary': 'mean'
+    }).reset_index()
+    
+    segments = app.CustomerSegmenter().segment(customers)['segments']
+    assert segments == [{
+        'name': row['segment'],
+        'count': int(row['customer_id']),
+        'avg_recency_days': round(float(row['recency']), 1),
+        'avg_orders': round(float(row['frequency']), 1),
+        'avg_spent': round(float(row['monetary']), 2)
+    } for _, row in expected.iterrows()]
+
+
+def test_custom_rules_are_compiled_in_order():
+    rules = [{'name': 'Recent', 'R': [5]}, {'name': 'Big spenders', 'M': [5]}]
+    lut, names = app.build_segment_lut(rules)
+    codes = app.assign_segments(np.array([5, 4, 4]), np.array([1, 1, 1]), np.array([5, 5, 1]), lut)
+    assert [names[i] for i in codes] == ['Recent', 'Big spenders', app.DEFAULT_SEGMENT]
+    
+    with pytest.raises(ValueError):
+        app.build_segment_lut([{'name': 'Everyone'}])
@@ -0,0 +1,106 @@
+"""
+Statistical forecasts for degenerate histories (one day, one repeated date)
+
+Run from ml-service/ with: python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Keep persisted state and cached responses out of the way of the running service
+os.environ.setdefault('ML_STATE_DIR', tempfile.mkdtemp(prefix='ml-test-'))
+os.environ.setdefault('ML_JOB_DB', os.path.join(os.environ['ML_STATE_DIR'], 'jobs.sqlite3'))
+os.environ.setdefault('ML_RESPONSE_CACHE_SIZE', '0')
+
+import app  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+ONE_DAY = [{'date': '2025-01-01', 'quantity': 5}]
+SAME_DATE = [{'date': '2025-01-01', 'quantity': q} for q in (3, 5, 7)]
+
+
+@pytest.fixture(scope='module')
+def client():
+    with TestClient(app.app) as client:
+        yield client
+
+
+def test_one_day_history_forecasts_that_day_flat():
+    forecast = app.forecaster.predict(ONE_DAY, 3, 'statistical')['forecast']
+    predicted, lower, upper = (values.tolist() for values in forecast.rounded())
+    assert predicted == [5, 5, 5]
+    assert all(0 <= lo <= p <= up for lo, p, up in zip(lower, predicted, upper))
+
+
+@pytest.mark.parametrize('model_type', ['statistical', 'linear', 'auto', 'global'])
+@pytest.mark.parametrize('history', [ONE_DAY, SAME_DATE], ids=['one-day', 'same-date'])
+def test_forecast_endpoint_returns_non_negative_quantities(client, model_type, history):
+    response = client.post('/api/forecast', json={
+        'product_id': 'degenerate', 'historical_sales': history, 'forecast_days': 3, 'model_type': model_type
+    })
+    assert response.status_code == 200
+    for day in response.json()['forecast']:
+        assert 0 <= day['lower_bound'] <= day['predicted_quantity'] <= day['upper_bound'] < 1000
+
+
+def test_one_day_history_matches_bulk_engine():
+    single = app.forecaster.predict(ONE_DAY, 3, 'statistical')['forecast']
+    values, dates = app.pack_series([app.forecaster.prepare_data(ONE_DAY)])
+    batch = app.MultiSeriesStatistical(seasonal=False).forecast(values, dates, 3)
+    assert single.rounded()[0].tolist() == batch.result(0)['forecast'].rounded()[0].tolist()
+
+
+def test_untrained_global_reports_the_serving_model(client):
+    assert app.global_models.load() is None
+    response = client.post('/api/forecast', json={
+        'product_id': 'untrained-global', 'historical_sales': SAME_DATE, 'forecast_days': 3, 'model_type': 'global'
+    })
+    assert response.status_code == 200
+    assert response.json()['model_used'] == 'statistical'
+
+
+def test_bulk_global_without_trained_model_does_not_train(client):
+    histories = {'a': SAME_DATE, 'b': ONE_DAY}
+    response = client.post('/api/demand-forecast', json={
+        'product_variants': [{'id': 'a', 'stock': 10}, {'id': 'b', 'stock': 10}],
+        'historical_sales': histories, 'forecast_days': 3, 'model_type': 'global'
+    })
+    assert response.status_code == 200
+    assert all('error' not in forecast for forecast in response.json()['forecasts'])
+    assert app.global_models.load() is None
+
+
+def test_bulk_and_single_statistical_forecasts_agree(client):
+    history = [{'date': f'2025-01-{day:02d}', 'quantity': day % 7 + 3} for day in range(1, 29)]
+    single = client.post('/api/forecast', json={
+        'product_id': 'same-model', 'historical_sales': history, 'forecast_days': 5, 'model_type': 'statistical'
+    }).json()['forecast']
+    bulk = client.post('/api/demand-forecast', json={
+        'product_variants': [{'id': 'same-model', 'stock': 100}], 'historical_sales': {'same-model': history},
+        'forecast_days': 5, 'model_type': 'statistical'
+    }).json()['forecasts'][0]['forecast']
+    assert bulk == single
+
+
+def test_seasonal_engine_recovers_a_weekly_pattern():
+    weekly = [2, 4, 6, 8, 10, 12, 14]
+    start = datetime(2025, 1, 6)
+    history = [{'date': (start + timedelta(days=day)).strftime('%Y-%m-%d'), 'quantity': weekly[day % 7]}
+               for day in range(84)]
+    values, dates = app.pack_series([app.forecaster.prepare_data(history)])
+    
+    trend = app.MultiSeriesStatistical(seasonal=False).forecast(values, dates, 7)
+    seasonal = app.MultiSeriesStatistical(seasonal=True).forecast(values, dates, 7, quantiles=(0.1, 0.9))
+    
+    assert seasonal.patterns[0].tolist() == [True, False]
+    expected = [weekly[(84 + step) % 7] for step in range(7)]
+    assert max(abs(p - e) for p, e in zip(seasonal.predicted[0], expected)) < 0.5
+    assert max(abs(p - e) for p, e in zip(trend.predicted[0], expected)) > 3
+    low, high = seasonal.quantiles[0]
+    assert (low <= high).all()